@@ -1,31 +1,65 @@
-import sentry_sdk
-from sentry_sdk.integrations.flask import FlaskIntegration
 import os
 from datetime import datetime, timezone
-import logging
-from logging.handlers import RotatingFileHandler
-import google.generativeai as genai
 from flask import Flask, jsonify
 from flask_cors import CORS
 from backend.config import config_by_name
 from backend.database import db
+from backend.metrics import snapshot as metrics_snapshot
+from backend.middleware.auth import init_auth_cache
+from backend.middleware.decompression import init_request_decompression
+from backend.middleware.proxy import init_proxy_fix
+from backend.middleware.rate_limit import init_rate_limiter
+from backend.middleware.read_replica import init_read_replica, replica_reads
+from backend.middleware.request_logging import init_request_logging
+from backend.migrations import check_schema_version, upgrade
+from backend import password_hashing
+from backend.services.image_cache import init_image_cache
+from backend.services.image_router import init_image_router
+from backend.services.media_pipeline import init_media_pipeline
+from backend.services.narration_service import init_narration
+from backend.services.progression_buffer import init_progression_buffer
 from backend.routes.auth_routes import auth_bp
 from backend.routes.progression_routes import progression_bp
 from backend.routes.story_routes import story_bp
 from backend.routes.character_routes import character_bp
+from backend.routes.tts_routes import tts_bp
+from backend.routes.image_routes import image_bp
 
-def create_app(config_name):
-    print(f"Creating app with config: {config_name}")
+def init_sentry():
+    # Without a DSN the SDK would do nothing, so it is not even imported
+    dsn = os.getenv('SENTRY_DSN')
+    if not dsn:
+        return
+    import sentry_sdk
+    from sentry_sdk.integrations.flask import FlaskIntegration
     sentry_sdk.init(
-        dsn=os.getenv('SENTRY_DSN'),
+        dsn=dsn,
         integrations=[FlaskIntegration()],
         traces_sample_rate=1.0,
         environment='production'
     )
 
+def create_app(config_name):
+    print(f"Creating app with config: {config_name}")
+    init_sentry()
+
     app = Flask(__name__)
     app.config.from_object(config_by_name[config_name])
     db.init_app(app)
+    init_read_replica(app)
+    init_auth_cache(app)
+    init_proxy_fix(app)
+    init_rate_limiter(app)
+    init_request_decompression(app)
+    init_narration(app)
+    init_image_cache(app)
+    init_image_router(app)
+    init_media_pipeline(app)
+    password_hashing.configure(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+    )
 
     # CORS setup
     CORS(app, resources={
@@ -42,37 +76,26 @@ def create_app(config_name):
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
         return response
 
-    # Logging setup
+    # Logging setup: JSON lines written by a background thread (see request_logging)
+    init_request_logging(app)
     if not app.debug:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/story_weaver.log', maxBytes=10240, backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-
-        app.logger.setLevel(logging.INFO)
         app.logger.info('Story Weaver startup')
 
-    # Gemini setup
-    api_key = app.config["GEMINI_API_KEY"]
-    if not api_key:
+    # Gemini clients are created by the services on first use (see gunicorn.conf.py to warm them)
+    if not app.config["GEMINI_API_KEY"]:
         app.logger.warning("GEMINI_API_KEY not set. Generation endpoints will use fallbacks.")
-    else:
-        genai.configure(api_key=api_key)
-
-    GEMINI_MODEL = app.config.get("GEMINI_MODEL", "gemini-1.5-flash")
-    try:
-        model = genai.GenerativeModel(GEMINI_MODEL) if api_key else None
-    except Exception as e:
-        app.logger.exception("Failed to initialize Gemini model: %s", e)
-        model = None
 
+    # Schema changes are applied by the release step (`python -m backend.migrations
+    # upgrade`); workers only verify the version so they never serve a stale schema.
     with app.app_context():
-        db.create_all()
+        if app.config.get('AUTO_MIGRATE'):
+            upgrade(db.engine)
+        if app.config.get('CHECK_SCHEMA_VERSION', True):
+            check_schema_version(db.engine)
+    init_progression_buffer(app)
 
     @app.route('/health', methods=['GET'])
+    @replica_reads
     def health():
         health_status = {
             'status': 'ok',
@@ -90,9 +113,16 @@ def create_app(config_name):
             health_status['database_error'] = str(e)
             health_status['status'] = 'degraded'
 
+        router = app.extensions.get('read_replica')
+        health_status['read_replica'] = router.status() if router else 'disabled'
+
         # Check Gemini API
         health_status['has_api_key'] = bool(os.getenv('GEMINI_API_KEY'))
 
         return jsonify(health_status), 200 if health_status['status'] == 'ok' else 503
 
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return jsonify(metrics_snapshot()), 200
+
     return app
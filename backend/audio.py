@@ -0,0 +1,103 @@
+"""
+Helpers for stitching synthesized audio segments together.
+
+MP3 segments are concatenated frame-wise after removing per-file metadata
+(ID3v2/ID3v1 tags and the Xing/Info frame encoders put first), which would
+otherwise play as glitches or report the wrong duration. LINEAR16 segments
+arrive as WAV files and are re-wrapped under a single RIFF header.
+"""
+
+import io
+import wave
+
+_MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _strip_id3(data):
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+def mp3_frame_length(header):
+    """Length in bytes of the Layer III frame starting with ``header``, or ``None``."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 0x01
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+
+def mp3_duration(data):
+    """Playing time in seconds of the Layer III frames in ``data``."""
+    data = _strip_info_frame(_strip_id3(bytes(data)))
+    seconds = 0.0
+    pos, end = 0, len(data) - 4
+    while pos <= end:
+        length = mp3_frame_length(data[pos:pos + 4])
+        if length is None:
+            pos += 1  # resync past tags or garbage
+            continue
+        version = (data[pos + 1] >> 3) & 0x03
+        sample_rate = _MP3_SAMPLE_RATES[version][(data[pos + 2] >> 2) & 0x03]
+        seconds += (1152 if version == 3 else 576) / sample_rate
+        pos += length
+    return seconds
+
+
+def _strip_info_frame(data):
+    length = mp3_frame_length(data[:4])
+    if length is None:
+        return data
+    mpeg1 = (data[1] >> 3) & 0x03 == 3
+    mono = (data[3] >> 6) == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    tag = data[4 + side_info:8 + side_info]
+    return data[length:] if tag in (b'Xing', b'Info') else data
+
+
+def join_mp3(parts):
+    return b''.join(_strip_info_frame(_strip_id3(bytes(part))) for part in parts)
+
+
+def join_wav(parts):
+    out = io.BytesIO()
+    params = None
+    with wave.open(out, 'wb') as writer:
+        for part in parts:
+            with wave.open(io.BytesIO(part), 'rb') as reader:
+                part_params = reader.getparams()[:3]
+                if params is None:
+                    params = part_params
+                    writer.setnchannels(params[0])
+                    writer.setsampwidth(params[1])
+                    writer.setframerate(params[2])
+                elif part_params != params:
+                    raise ValueError("Cannot join WAV segments with different formats: "
+                                     f"{params} vs {part_params}")
+                writer.writeframes(reader.readframes(reader.getnframes()))
+    return out.getvalue()
+
+
+def join_audio(parts, encoding):
+    """Concatenate segments produced with the given TTS ``encoding`` (MP3 or LINEAR16)."""
+    if len(parts) == 1:
+        return parts[0]
+    if encoding == 'LINEAR16':
+        return join_wav(parts)
+    return join_mp3(parts)
@@ -0,0 +1,2 @@
+# Micro-benchmarks for the backend; run individual modules with
+# `python -m backend.benchmarks.<name>`.
@@ -0,0 +1,90 @@
+"""
+Per-request cost of listing characters: ORM hydration versus the lightweight
+read path in ``character_repository``.
+
+Reports CPU time and peak traced memory for building the ``/get-characters``
+payload at 1k and 10k rows.
+
+    python -m backend.benchmarks.bench_character_list
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from flask import Flask
+
+from backend.database import db
+from backend.migrations import upgrade
+from backend.models.character import Character
+from backend.repositories import character_repository
+
+
+def _app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    db.init_app(app)
+    return app
+
+
+def _seed(count):
+    db.session.execute(Character.__table__.delete())
+    db.session.execute(Character.__table__.insert(), [
+        {
+            'id': str(uuid.uuid4()), 'name': f"Hero {i}", 'age': 5 + i % 8, 'gender': 'Other',
+            'personality_traits': ['Brave', 'Curious', 'Kind'], 'siblings': [], 'friends': ['Milo'],
+            'likes': ['dragons', 'space', 'painting'], 'dislikes': ['thunder'],
+            'fears': ['the dark'],
+        }
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def _measure(build, repeat=5):
+    # CPU and memory are measured in separate runs; tracemalloc skews timings.
+    samples = []
+    for _ in range(repeat):
+        db.session.remove()
+        start = time.process_time()
+        build()
+        samples.append((time.process_time() - start) * 1000)
+    db.session.remove()
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.remove()
+    return min(samples), peak / 1024
+
+
+PATHS = {
+    'ORM Character.to_dict': lambda: [
+        c.to_dict() for c in Character.query.order_by(Character.created_at.desc()).all()
+    ],
+    'CharacterRecord.to_dict': lambda: [
+        c.to_dict() for c in character_repository.list_character_records()
+    ],
+    'CharacterSummary (?view=summary)': lambda: [
+        c.to_dict() for c in character_repository.list_character_summaries()
+    ],
+}
+
+
+def main():
+    app = _app(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    with app.app_context():
+        upgrade(db.engine)
+        for count in (1_000, 10_000):
+            _seed(count)
+            print(f"{count} rows")
+            for label, build in PATHS.items():
+                build()  # warm statement caches
+                cpu_ms, peak_kib = _measure(build)
+                print(f"  {label:<34} cpu {cpu_ms:8.1f} ms   peak {peak_kib:9.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
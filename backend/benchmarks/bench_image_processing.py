@@ -0,0 +1,68 @@
+"""
+Image post-processing throughput: responsive widths, WebP/AVIF and the LQIP
+placeholder for generated 1024x1024 PNGs, inline and on the process pool.
+
+    python -m backend.benchmarks.bench_image_processing [images] [workers]
+
+Reports images/sec overall and per core. The pool figure includes handing the
+PNG to a worker process and the results back, not the pool's start-up.
+"""
+
+import io
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from PIL import Image
+
+from backend import image_processing
+
+
+def sample_png(size=1024):
+    # Detailed enough that encoders do real work, unlike a flat colour
+    image = Image.effect_mandelbrot((size, size), (-2.0, -1.5, 1.0, 1.5), 100).convert('RGB')
+    channels = tuple(image.rotate(angle).getchannel(0) for angle in (0, 90, 180))
+    image = Image.merge('RGB', channels)
+    out = io.BytesIO()
+    image.save(out, format='PNG')
+    return out.getvalue()
+
+
+def main(images=8, workers=None):
+    workers = workers or os.cpu_count() or 1
+    data = sample_png()
+    widths = image_processing.DEFAULT_WIDTHS
+    print(f"{images} images of {len(data) / 1024:.0f} KB PNG, widths {widths}, "
+          f"encodings {list(image_processing.ENCODINGS)}")
+
+    result = image_processing.process(data, widths)
+    made = sum(len(encoded) for _, _, encoded in result['variants'])
+    print(f"  {len(result['variants'])} variants ({made / 1024:.0f} KB), "
+          f"placeholder {len(result['placeholder'])} chars")
+
+    start = time.perf_counter()
+    for _ in range(images):
+        image_processing.process(data, widths)
+    inline = images / (time.perf_counter() - start)
+    print(f"  inline (1 core)        {inline:6.2f} images/s")
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        # warm up
+        wait([pool.submit(image_processing.process, data, widths) for _ in range(workers)])
+        start = time.perf_counter()
+        wait([pool.submit(image_processing.process, data, widths) for _ in range(images)])
+        pooled = images / (time.perf_counter() - start)
+    print(f"  pool ({workers} workers)      {pooled:6.2f} images/s   "
+          f"{pooled / workers:6.2f} images/s/core")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(
+        images=int(args[0]) if args else 8,
+        workers=int(args[1]) if len(args) > 1 else None,
+    )
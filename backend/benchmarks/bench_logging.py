@@ -0,0 +1,102 @@
+"""
+Per-request logging overhead: no file logging, the old in-thread
+RotatingFileHandler (rotating every 10 KB), and JSON lines through the
+queue listener (``backend.middleware.request_logging``).
+
+    python -m backend.benchmarks.bench_logging [requests]
+
+Each request logs one line from the view plus the access record. Reports
+request latency percentiles and the median overhead over no file logging,
+plus total time per request including writing out the queue, so the
+listener's share of the CPU is not hidden.
+"""
+
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+from flask import Flask
+
+from backend.middleware import request_logging
+
+logger = logging.getLogger('backend.benchmarks.story')
+
+
+def make_app():
+    app = Flask(__name__)
+    app.debug = True  # hooks only; the benchmark attaches the handlers
+    request_logging.init_request_logging(app)
+
+    @app.route('/story/<int:n>')
+    def story(n):
+        request_logging.annotate(model='gemini-1.5-pro-latest', cache='miss')
+        logger.info('Generated story %d with %d choices for %s', n, 3, 'Mia')
+        return {'ok': True}
+
+    return app
+
+
+def _run(client, requests, samples):
+    for n in range(requests):
+        start = time.perf_counter()
+        client.get(f'/story/{n}')
+        samples.append((time.perf_counter() - start) * 1e6)
+
+
+def _percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def main(requests=5000, rounds=10):
+    client = make_app().test_client()
+    directory = tempfile.mkdtemp()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    _run(client, 200, [])  # warm up
+
+    old = RotatingFileHandler(os.path.join(directory, 'old.log'), maxBytes=10240, backupCount=10)
+    old.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+
+    def rotating(run):
+        root.addHandler(old)
+        run()
+        root.removeHandler(old)
+
+    def queued(run):
+        request_logging.start_logging(os.path.join(directory, 'new.log'))
+        run()
+        request_logging.stop_logging()  # waits for the listener to write everything out
+
+    configurations = {
+        'no file logging': lambda run: run(),
+        'rotating 10 KB, in thread': rotating,
+        'JSON via queue listener': queued,
+    }
+    results = {label: [] for label in configurations}
+    elapsed = dict.fromkeys(configurations, 0.0)
+    # Interleaved rounds, so drift in machine speed hits every configuration alike
+    for _ in range(rounds):
+        for label, configure in configurations.items():
+            start = time.perf_counter()
+            configure(lambda: _run(client, requests // rounds, results[label]))
+            elapsed[label] += time.perf_counter() - start
+    old.close()
+
+    baseline = statistics.median(results['no file logging'])
+    print(f"{requests} requests, 2 records each "
+          "(request thread latency; total includes the listener)")
+    for label, samples in results.items():
+        median = statistics.median(samples)
+        print(f"  {label:<26} p50 {median:6.1f} us  p99 {_percentile(samples, 99):7.1f} us  "
+              f"max {max(samples):8.1f} us  overhead {median - baseline:+6.1f} us  "
+              f"total {elapsed[label] / requests * 1e6:6.1f} us/request")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,51 @@
+"""
+Login throughput: password verifications per second, inline and through the
+hashing process pool, normalised per core.
+
+    python -m backend.benchmarks.bench_password_hashing [method] [workers]
+
+e.g. ``python -m backend.benchmarks.bench_password_hashing pbkdf2:sha256:600000 4``
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import password_hashing
+
+
+def _logins_per_second(count, concurrency, password_hash):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as threads:
+        results = list(threads.map(
+            lambda _: password_hashing.verify_password(password_hash, 'correct horse'), range(count)
+        ))
+    assert all(results)
+    return count / (time.perf_counter() - start)
+
+
+def main(method=password_hashing.DEFAULT_METHOD, workers=None, count=40):
+    workers = workers or os.cpu_count() or 1
+    password_hashing.configure(method=method, workers=0)
+    password_hash = password_hashing.hash_password('correct horse')
+
+    print(f"Method {method}, {os.cpu_count()} CPUs available")
+    inline = _logins_per_second(count // 4, 1, password_hash)
+    print(f"  inline, 1 thread          {inline:7.1f} logins/s   {inline:7.1f} per core")
+
+    password_hashing.configure(workers=workers)
+    password_hashing.verify_password(password_hash, 'warm up')  # start the pool
+    pooled = _logins_per_second(count, workers * 2, password_hash)
+    cores = min(workers, os.cpu_count() or 1)
+    print(f"  pool, {workers} worker(s)        {pooled:7.1f} logins/s   "
+          f"{pooled / cores:7.1f} per core")
+    password_hashing.configure(workers=0)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(
+        method=args[0] if args else password_hashing.DEFAULT_METHOD,
+        workers=int(args[1]) if len(args) > 1 else None,
+    )
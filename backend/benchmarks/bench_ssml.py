@@ -0,0 +1,61 @@
+"""
+SSML compilation cost on long stories: the previous five ``re.sub`` passes
+against the single-pass compiler, without marks and with word/sentence marks.
+
+    python -m backend.benchmarks.bench_ssml [words] [repeats]
+
+The compiler's LRU cache is bypassed so every iteration really compiles.
+"""
+
+import re
+import sys
+import time
+
+from backend.ssml import _compile
+
+SAMPLE = (
+    'Luna the little fox tiptoed through the silver forest, her tail swishing. '
+    '"Is anyone there?" she whispered. An owl blinked & hooted softly! '
+    'The stars <twinkled> above, and the river sang its sleepy song. '
+)
+
+
+def _five_pass(text):
+    text = re.sub(r'\.(\s+)', '.<break time="800ms"/>\\1', text)
+    text = re.sub(r',(\s+)', ',<break time="400ms"/>\\1', text)
+    text = re.sub(r'!(\s+)', '!<break time="800ms"/>\\1', text)
+    text = re.sub(r'\?(\s+)', '?<break time="800ms"/>\\1', text)
+    text = re.sub(r'"([^"]+)"', r'<emphasis level="moderate">\1</emphasis>', text)
+    return f'<speak>{text}</speak>'
+
+
+def _per_call_ms(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main(words=8000, repeats=50):
+    sample_words = len(SAMPLE.split())
+    text = SAMPLE * max(1, words // sample_words)
+    kb = len(text.encode()) / 1024
+    print(f"{len(text.split())} words ({kb:.0f} KB), {repeats} repeats")
+
+    cases = [
+        ('five re.sub passes (unescaped)', lambda: _five_pass(text)),
+        ('single pass', lambda: _compile.__wrapped__(text, None, 0)),
+        ('single pass + sentence marks', lambda: _compile.__wrapped__(text, 'sentence', 0)),
+        ('single pass + word marks', lambda: _compile.__wrapped__(text, 'word', 0)),
+    ]
+    for name, fn in cases:
+        ms = _per_call_ms(fn, repeats)
+        print(f"  {name:32s} {ms:8.2f} ms   {kb / ms * 1000:9.0f} KB/s")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(
+        words=int(args[0]) if args else 8000,
+        repeats=int(args[1]) if len(args) > 1 else 50,
+    )
@@ -0,0 +1,115 @@
+"""
+Worker boot cost: ``db.create_all()`` versus the schema version check, and
+the cold import of the app.
+
+Each iteration uses a fresh engine, the way a newly forked gunicorn worker
+does, so connection setup and reflection round trips are included.
+
+    DATABASE_URL=postgresql://... python -m backend.benchmarks.bench_startup
+
+``imports`` starts a fresh interpreter with ``-X importtime`` that imports
+``backend.app`` and calls ``create_app``, and reports the time taken, the
+slowest imports and which heavy provider SDKs were loaded (none should be;
+they are imported on first use).
+
+    python -m backend.benchmarks.bench_startup imports [top]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from backend.database import db
+from backend.migrations import check_schema_version, upgrade
+import backend.models.character  # noqa: F401  (register tables)
+import backend.models.user  # noqa: F401
+
+
+def _time(fn, url, iterations):
+    samples = []
+    for _ in range(iterations):
+        engine = create_engine(url)
+        start = time.perf_counter()
+        fn(engine)
+        samples.append((time.perf_counter() - start) * 1000)
+        engine.dispose()
+    return statistics.median(samples), max(samples)
+
+
+# Provider SDKs that must not be imported just to start the app
+HEAVY_MODULES = ('google.generativeai', 'google.cloud.texttospeech', 'sentry_sdk', 'numpy')
+
+_COLD_START = """
+import sys, time
+started = time.perf_counter()
+from backend.app import create_app
+imported = time.perf_counter()
+create_app('development')
+done = time.perf_counter()
+print('timings', imported - started, done - imported)
+print('heavy', *(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def parse_importtime(output):
+    """[(cumulative ms, depth, module)] from ``-X importtime`` output."""
+    rows = []
+    for line in output.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        rows.append((int(parts[1]) / 1000, (len(name) - len(name.lstrip())) // 2, name.strip()))
+    return rows
+
+
+def cold_start():
+    """(import seconds, create_app seconds, heavy modules, importtime rows), fresh interpreter."""
+    env = {**os.environ, 'DATABASE_URL': os.environ.get('DATABASE_URL', 'sqlite:///:memory:')}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _COLD_START.format(heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    report = {
+        line.split()[0]: line.split()[1:] for line in result.stdout.splitlines() if line.strip()
+    }
+    imported, created = (float(value) for value in report['timings'])
+    return imported, created, report['heavy'], parse_importtime(result.stderr)
+
+
+def imports(top=15):
+    imported, created, heavy, rows = cold_start()
+    print(f"import backend.app {imported * 1000:7.1f} ms   create_app() {created * 1000:7.1f} ms")
+    print(f"  heavy SDKs imported: {', '.join(heavy) or 'none'}")
+    print("  slowest imports (cumulative, top-level packages):")
+    for ms, _, name in sorted((row for row in rows if row[1] <= 1), reverse=True)[:top]:
+        print(f"    {ms:8.1f} ms  {name}")
+
+
+def main(iterations=20):
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    upgrade(engine)
+    engine.dispose()
+
+    print(f"Database: {url.split('@')[-1]}  ({iterations} cold boots each)")
+    for label, fn in (
+        ('db.create_all()', lambda engine: db.metadata.create_all(bind=engine)),
+        ('check_schema_version()', check_schema_version),
+    ):
+        median, worst = _time(fn, url, iterations)
+        print(f"  {label:<24} median {median:7.2f} ms   max {worst:7.2f} ms")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['imports']:
+        imports(int(sys.argv[2]) if len(sys.argv) > 2 else 15)
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
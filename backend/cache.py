@@ -0,0 +1,111 @@
+"""
+Small in-process caches shared by the middleware and services.
+
+``TTLCache`` is a bounded, thread-safe LRU whose entries expire. ``RedisCache``
+has the same interface for state that must be shared across gunicorn
+workers; it is only used when a cache URL is configured and the optional
+``redis`` package is installed. Values stored in either must be
+JSON-serialisable so the two stay interchangeable.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
+
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        now = self._clock()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self._clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+class RedisCache:
+    def __init__(self, url, prefix, ttl=60.0):
+        if not REDIS_AVAILABLE:
+            raise ImportError("Shared caches need the redis package: pip install redis")
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        raw = self._client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._client.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self.prefix + '*'):
+            self._client.delete(key)
+
+    def stats(self):
+        return {'shared': True, 'hits': self.hits, 'misses': self.misses}
+
+
+def make_cache(prefix, maxsize=1024, ttl=60.0, url=None):
+    """A ``RedisCache`` when ``url`` is set, otherwise a process-local ``TTLCache``."""
+    if url:
+        return RedisCache(url, prefix=prefix, ttl=ttl)
+    return TTLCache(maxsize=maxsize, ttl=ttl)
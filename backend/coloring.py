@@ -0,0 +1,88 @@
+"""
+Local coloring pages derived from an existing illustration.
+
+Instead of a second paid image-model call, a color illustration of the scene
+is turned into printable black-on-white line art on the CPU:
+
+1. grayscale, smoothed and posterized so edges follow shapes, not texture
+2. Sobel edge magnitude (NumPy), keeping the strongest edges
+3. speck removal, then line thickening
+4. pure white background, black lines
+
+How much detail survives and how thick the lines are follow the same age
+tiers as ``GeminiImageGenerator.generate_coloring_page`` (large areas and very
+thick lines for ages 3-5, fine detail for teens and adults). A 1024x1024 page
+takes well under a second.
+"""
+
+import io
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+# Part of the cache key of derived pages; bump when the output changes
+VERSION = 1
+
+
+@dataclass(frozen=True)
+class Tier:
+    name: str
+    max_age: int
+    blur: float        # pre-smoothing radius: larger removes more detail
+    bits: int          # posterization (2**bits gray levels): fewer gives larger areas to color
+    keep: float        # share of pixels kept as edge
+    line_width: int    # final line thickness in pixels (odd)
+
+
+# Mirrors the intricacy / line_thickness tiers of the model prompt
+TIERS = (
+    Tier('young', 5, blur=4.0, bits=2, keep=0.05, line_width=7),   # very simple shapes, thick lines
+    Tier('child', 11, blur=2.5, bits=3, keep=0.08, line_width=5),  # moderate details, medium lines
+    Tier('teen', 17, blur=1.5, bits=4, keep=0.11, line_width=3),   # intricate, varied line weights
+    Tier('adult', 200, blur=1.0, bits=5, keep=0.14, line_width=3),
+)
+
+
+def tier_for_age(age):
+    for tier in TIERS:
+        if age <= tier.max_age:
+            return tier
+    return TIERS[-1]
+
+
+def _sobel(gray):
+    """Gradient magnitude of a 2-D float array (edges padded)."""
+    p = np.pad(gray, 1, mode='edge')
+    gx = (p[:-2, 2:] + 2 * p[1:-1, 2:] + p[2:, 2:]) - (p[:-2, :-2] + 2 * p[1:-1, :-2] + p[2:, :-2])
+    gy = (p[2:, :-2] + 2 * p[2:, 1:-1] + p[2:, 2:]) - (p[:-2, :-2] + 2 * p[:-2, 1:-1] + p[:-2, 2:])
+    return np.hypot(gx, gy)
+
+
+def line_art(image, age=7, max_size=1024):
+    """Black-on-white line art ("L" mode, 0 = line) of a PIL image for a child of ``age``."""
+    tier = tier_for_age(age)
+    gray = ImageOps.exif_transpose(image).convert('L')
+    gray.thumbnail((max_size, max_size), Image.LANCZOS)
+    gray = ImageOps.autocontrast(gray, cutoff=1)
+    gray = gray.filter(ImageFilter.GaussianBlur(tier.blur))
+    gray = ImageOps.posterize(gray, tier.bits)
+
+    magnitude = _sobel(np.asarray(gray, dtype=np.float32))
+    threshold = max(np.quantile(magnitude, 1.0 - tier.keep), 1.0)
+    edges = Image.fromarray(np.where(magnitude >= threshold, 255, 0).astype(np.uint8))
+
+    # A median drops isolated specks but keeps lines two or more pixels wide
+    edges = edges.filter(ImageFilter.MedianFilter(3))
+    if tier.line_width > 1:
+        edges = edges.filter(ImageFilter.MaxFilter(tier.line_width))
+    return ImageOps.invert(edges)
+
+
+def derive_coloring_page(data, age=7):
+    """PNG bytes of a printable coloring page derived from illustration bytes."""
+    with Image.open(io.BytesIO(data)) as image:
+        page = line_art(image, age)
+    out = io.BytesIO()
+    page.convert('1').save(out, format='PNG', optimize=True)
+    return out.getvalue()
@@ -0,0 +1,114 @@
+"""
+Compressed JSON storage for large per-user blobs.
+
+``CompressedJSON`` is a drop-in replacement for ``db.JSON`` that stores
+values as a small header followed by compressed UTF-8 JSON:
+
+- byte 0: codec (``RAW``, ``ZLIB`` or ``ZSTD``)
+- byte 1: preset dictionary id (see ``DICTIONARIES``)
+
+Both codecs are primed with a dictionary built from the progression schema
+(the field names and feature keys the client sends), which is what makes
+compression worthwhile on rows of a few hundred bytes. zstd is used when the
+optional ``zstandard`` package is installed, otherwise zlib. Values written
+before the column was compressed (plain JSON text) are still readable.
+
+Never edit an existing dictionary: rows record the id they were written
+with. Add a new entry and point ``CURRENT_DICTIONARY`` at it instead.
+"""
+
+import json
+import zlib
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+RAW = 0
+ZLIB = 1
+ZSTD = 2
+
+# Values shorter than this are stored raw; compression would only add bytes.
+MIN_COMPRESS_SIZE = 64
+
+DICTIONARIES = {
+    1: (
+        b'{"storiesCreated": 0, "storiesRead": 0, "storiesFavorited": 0, '
+        b'"charactersCreated": 0, "coloringPagesCompleted": 0, '
+        b'"unlockedFeatures": ["fantasy_mode", "animal_ears_tails", "custom_colors", '
+        b'"rhyme_time_mode", "superhero_mode", "interactive_stories"], '
+        b'"createdAt": "2025-01-01T00:00:00.000", "lastStoryCreatedAt": null, '
+        b'"tier": "free", "subscription_start_date": null, "subscription_end_date": null, '
+        b'"is_active": false, "subscription_id": null, "stories_created_today": 0, '
+        b'"stories_created_this_month": 0, "last_story_date": "2025-01-01T00:00:00.000", '
+        b'"last_reset_date": "2025-01-01T00:00:00.000", "badges": [], "stars": 0}'
+    ),
+}
+CURRENT_DICTIONARY = 1
+
+_zstd_dicts = {}
+
+
+def _zstd_dict(dict_id):
+    if dict_id not in _zstd_dicts:
+        _zstd_dicts[dict_id] = zstandard.ZstdCompressionDict(
+            DICTIONARIES[dict_id], dict_type=zstandard.DICT_TYPE_RAWCONTENT
+        )
+    return _zstd_dicts[dict_id]
+
+
+def compress_json(value, level=6):
+    """Serialise ``value`` to the stored form: header + (possibly) compressed JSON."""
+    raw = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    dict_id = CURRENT_DICTIONARY
+    if len(raw) < MIN_COMPRESS_SIZE:
+        return bytes((RAW, 0)) + raw
+    if ZSTD_AVAILABLE:
+        compressor = zstandard.ZstdCompressor(level=level, dict_data=_zstd_dict(dict_id))
+        return bytes((ZSTD, dict_id)) + compressor.compress(raw)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=DICTIONARIES[dict_id])
+    return bytes((ZLIB, dict_id)) + compressor.compress(raw) + compressor.flush()
+
+
+def decompress_json(data):
+    """Inverse of ``compress_json``; also accepts legacy plain JSON text."""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        return json.loads(data)
+    data = bytes(data)
+    codec = data[0] if data else None
+    if codec not in (RAW, ZLIB, ZSTD):
+        return json.loads(data)
+    dict_id, body = data[1], data[2:]
+    if codec == ZLIB:
+        decompressor = zlib.decompressobj(-15, zdict=DICTIONARIES[dict_id])
+        body = decompressor.decompress(body) + decompressor.flush()
+    elif codec == ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Row was written with zstd; "
+                               "install the zstandard package to read it")
+        body = zstandard.ZstdDecompressor(dict_data=_zstd_dict(dict_id)).decompress(body)
+    return json.loads(body)
+
+
+def is_compressed(data):
+    return (isinstance(data, (bytes, bytearray, memoryview)) and len(data) > 1
+            and bytes(data[:1])[0] in (RAW, ZLIB, ZSTD))
+
+
+class CompressedJSON(TypeDecorator):
+    """JSON column stored compressed in a binary column."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress_json(value) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return decompress_json(value)
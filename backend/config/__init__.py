@@ -1,20 +1,165 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 load_dotenv()
+
+
+def _amounts(value):
+    """{name: float} from a list like "gemini=0.03,openrouter=0.004"."""
+    pairs = (item.split('=', 1) for item in value.split(',') if '=' in item)
+    return {name.strip(): float(amount) for name, amount in pairs}
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    
+
+    # Optional read replica for GET handlers marked with @replica_reads
+    SQLALCHEMY_BINDS = (
+        {'replica': os.environ['DATABASE_REPLICA_URL']}
+        if os.environ.get('DATABASE_REPLICA_URL') else {}
+    )
+    READ_REPLICA_STICKY_SECONDS = float(os.environ.get('READ_REPLICA_STICKY_SECONDS', 5))
+    READ_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('READ_REPLICA_MAX_LAG_SECONDS', 10))
+    READ_REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('READ_REPLICA_LAG_CHECK_INTERVAL', 5))
+
+    # require_auth identity caches; AUTH_CACHE_URL (redis://) shares them across workers
+    AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 60))
+    AUTH_CACHE_MAXSIZE = int(os.environ.get('AUTH_CACHE_MAXSIZE', 10000))
+    AUTH_CACHE_URL = os.environ.get('AUTH_CACHE_URL')
+
+    # Password hashing (werkzeug method string) and the process pool it runs in;
+    # 0 workers hashes inline in the request thread
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    LOGIN_MAX_ATTEMPTS = int(os.environ.get('LOGIN_MAX_ATTEMPTS', 10))
+    LOGIN_ATTEMPT_WINDOW = float(os.environ.get('LOGIN_ATTEMPT_WINDOW', 60))
+
+    # Token-bucket limits as "<burst>/<seconds>" per category; RATE_LIMIT_STORAGE_URL
+    # (sqlite/postgres) shares bucket state across workers
+    RATE_LIMITS = {
+        'text': os.environ.get('RATE_LIMIT_TEXT', '10/60'),
+        'image': os.environ.get('RATE_LIMIT_IMAGE', '4/60'),
+        'tts': os.environ.get('RATE_LIMIT_TTS', '20/60'),
+    }
+    RATE_LIMITS_PER_IP = {
+        'text': os.environ.get('RATE_LIMIT_TEXT_PER_IP', '30/60'),
+        'image': os.environ.get('RATE_LIMIT_IMAGE_PER_IP', '12/60'),
+        'tts': os.environ.get('RATE_LIMIT_TTS_PER_IP', '60/60'),
+    }
+    # Generations per user over a rolling 24 hours (refilled evenly, not reset at midnight)
+    GENERATION_ROLLING_QUOTA = {
+        'text': int(os.environ.get('ROLLING_QUOTA_TEXT', 100)),
+        'image': int(os.environ.get('ROLLING_QUOTA_IMAGE', 40)),
+        'tts': int(os.environ.get('ROLLING_QUOTA_TTS', 200)),
+    }
+    RATE_LIMIT_STORAGE_URL = os.environ.get('RATE_LIMIT_STORAGE_URL')
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto are trusted
+    PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 0))
+
+    # Coalesce progression syncs in memory (journaled to disk) and flush them to the
+    # database every PROGRESSION_FLUSH_INTERVAL seconds. The buffer is per process, so it
+    # is only enabled when WEB_CONCURRENCY (set by gunicorn.conf.py) is 1
+    PROGRESSION_WRITE_BEHIND = (
+        os.environ.get('PROGRESSION_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    )
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+    PROGRESSION_FLUSH_INTERVAL = float(os.environ.get('PROGRESSION_FLUSH_INTERVAL', 5))
+    PROGRESSION_JOURNAL_DIR = os.environ.get('PROGRESSION_JOURNAL_DIR')
+    PROGRESSION_JOURNAL_FSYNC = (
+        os.environ.get('PROGRESSION_JOURNAL_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+    )
+
+    # Speech synthesis backend: "google" (Cloud TTS) or "stub" (offline, silent audio of
+    # realistic length; TTS_STUB_LATENCY seconds per request imitates the network)
+    TTS_BACKEND = os.environ.get('TTS_BACKEND', 'google')
+    TTS_STUB_LATENCY = float(os.environ.get('TTS_STUB_LATENCY', 0))
+
+    # Content-addressed narration audio; send_file uses X-Sendfile when USE_X_SENDFILE is set
+    TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR')
+    TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    # Concurrent synthesis requests per worker when a long story is split into chunks
+    TTS_MAX_WORKERS = int(os.environ.get('TTS_MAX_WORKERS', 4))
+    # Narrate generated stories in the background when the request opts in ("narration": {...});
+    # PRE_NARRATION_WORKERS threads per worker process, at most PRE_NARRATION_MAX_PENDING jobs
+    PRE_NARRATION = os.environ.get('PRE_NARRATION', '').lower() in ('1', 'true', 'yes')
+    PRE_NARRATION_WORKERS = int(os.environ.get('PRE_NARRATION_WORKERS', 1))
+    PRE_NARRATION_MAX_PENDING = int(os.environ.get('PRE_NARRATION_MAX_PENDING', 100))
+
+    # Content-addressed cache of generated illustrations and coloring pages (LRU beyond the cap)
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR')
+    IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+    # Responsive widths (plus WebP/AVIF and an LQIP placeholder) made for every new image,
+    # in IMAGE_PROCESS_WORKERS processes (0 = in the calling thread)
+    IMAGE_WIDTHS = tuple(
+        int(w) for w in os.environ.get('IMAGE_WIDTHS', '256,512,1024').split(',') if w.strip()
+    )
+    IMAGE_PROCESS_WORKERS = int(os.environ.get('IMAGE_PROCESS_WORKERS', 2))
+    # Image providers the router chooses between ("gemini", "openrouter", "stub"), by cost per image
+    # (dollars), p50/p95 latency against IMAGE_LATENCY_TARGET_MS and error rate; IMAGE_COST_CEILINGS
+    # caps dollars per hour and worker process. Providers without an API key are skipped.
+    IMAGE_PROVIDERS = tuple(
+        p.strip() for p in os.environ.get('IMAGE_PROVIDERS', 'gemini,openrouter').split(',')
+        if p.strip()
+    )
+    IMAGE_PROVIDER_COSTS = _amounts(
+        os.environ.get('IMAGE_PROVIDER_COSTS', 'gemini=0.03,openrouter=0.004,stub=0')
+    )
+    IMAGE_COST_CEILINGS = _amounts(os.environ.get('IMAGE_COST_CEILINGS', ''))
+    IMAGE_LATENCY_TARGET_MS = float(os.environ.get('IMAGE_LATENCY_TARGET_MS', 20000))
+    IMAGE_STUB_LATENCY = float(os.environ.get('IMAGE_STUB_LATENCY', 0))
+
+    # Illustrate, color and narrate generated stories when the request opts in ("media": {...});
+    # MEDIA_PIPELINE_WORKERS concurrent tasks per worker process, MEDIA_PIPELINE_SCENES scenes
+    # by default
+    MEDIA_PIPELINE = os.environ.get('MEDIA_PIPELINE', '').lower() in ('1', 'true', 'yes')
+    MEDIA_PIPELINE_WORKERS = int(os.environ.get('MEDIA_PIPELINE_WORKERS', 4))
+    MEDIA_PIPELINE_SCENES = int(os.environ.get('MEDIA_PIPELINE_SCENES', 3))
+    MEDIA_PIPELINE_MAX_JOBS = int(os.environ.get('MEDIA_PIPELINE_MAX_JOBS', 50))
+
+    # JSON log lines (outside debug mode), rotated at LOG_MAX_BYTES keeping LOG_BACKUP_COUNT files
+    LOG_FILE = os.environ.get('LOG_FILE', 'logs/story_weaver.log')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 50 * 1024 ** 2))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
+    # Upper bound for Content-Encoding: gzip/deflate request bodies once inflated
+    REQUEST_MAX_DECOMPRESSED_BYTES = int(
+        os.environ.get('REQUEST_MAX_DECOMPRESSED_BYTES', 10 * 1024 * 1024)
+    )
+
+    # Apply pending migrations in create_app instead of a release step
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '').lower() in ('1', 'true', 'yes')
+    # Refuse to boot against a database whose schema_version is not the code's
+    CHECK_SCHEMA_VERSION = True
+
     # Add other basic config from app.py
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 class DevelopmentConfig(Config):
     DEBUG = True
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'true').lower() in ('1', 'true', 'yes')
+class TestingConfig(DevelopmentConfig):
+    TESTING = True
+    # The suite builds a throwaway schema with db.create_all, so it never migrates (or
+    # checks) a real database such as instance/app.db. A file rather than :memory:, which
+    # would be one connection shared by the threads that write (media pipeline, image pool)
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(
+        tempfile.gettempdir(), f'story-weaver-tests-{os.getpid()}.db'
+    )
+    SQLALCHEMY_BINDS = {}
+    AUTO_MIGRATE = False
+    CHECK_SCHEMA_VERSION = False
 class ProductionConfig(Config):
     DEBUG = False
+    PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 1))  # Railway's edge proxy
 config_by_name = {
     'dev': DevelopmentConfig,
     'development': DevelopmentConfig,
+    'testing': TestingConfig,
     'production': ProductionConfig,
     'default': DevelopmentConfig
 }
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""
+Content-addressed file cache for generated media.
+
+Entries are immutable files named by their key (a hex digest) under two
+levels of fan-out directories. Writes go to a temporary file in the target
+directory and are renamed into place, so readers, including other workers
+sharing the directory, only ever see complete files. Reads bump the file's
+mtime, and when the total size passes ``max_bytes`` the least recently used
+files are evicted. Callers serve hits straight from ``path_for`` with
+``send_file``, which lets the web server use ``X-Sendfile``/``sendfile``.
+
+Size accounting is per process and re-synchronised from disk whenever an
+eviction pass runs, so several workers can share one directory.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+_KEY_RE = re.compile(r'^[0-9a-f]{16,128}$')
+
+
+def content_key(*parts):
+    """Stable SHA-256 key for a tuple of JSON-serialisable parts."""
+    encoded = json.dumps(parts, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def is_valid_key(key):
+    return bool(_KEY_RE.match(key or ''))
+
+
+class DiskCache:
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        self._size = sum(size for _, size, _ in self._scan())
+
+    def _path(self, key):
+        if not is_valid_key(key):
+            raise ValueError(f"Invalid cache key: {key!r}")
+        return os.path.join(self.directory, key[:2], key[2:4], key)
+
+    def _scan(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not is_valid_key(name):
+                    continue  # in-flight temporary files
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def path_for(self, key, record=True):
+        """Path of the cached file for ``key``, or ``None``.
+
+        ``record=False`` is for serving a file that was already looked up, so
+        downloads do not inflate the hit ratio.
+        """
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.utime(path)
+        except FileNotFoundError:
+            if record:
+                with self._lock:
+                    self.misses += 1
+            return None
+        if record:
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += size
+        return path
+
+    def get(self, key):
+        path = self.path_for(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:  # evicted between lookup and read
+            return None
+
+    def contains(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, data):
+        """Atomically store ``data`` under ``key``; returns the final path."""
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # Overwriting a key must not count the old file's bytes twice.
+            with self._lock:
+                try:
+                    replaced = os.path.getsize(path)
+                except FileNotFoundError:
+                    replaced = 0
+                os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            self._size += len(data) - replaced
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def evict(self):
+        """Delete least recently used files until the cache fits in ``max_bytes``."""
+        with self._lock:
+            entries = sorted(self._scan(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            # Leave headroom so we do not rescan on every write.
+            target = self.max_bytes * 0.9
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+            self._size = total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'bytes_saved': self.bytes_saved,
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+            }
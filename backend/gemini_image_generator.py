@@ -4,22 +4,57 @@ Uses Google's Imagen 3.0 via Gemini API (FREE with your existing key!)
 """
 
 import os
-import google.generativeai as genai
-from PIL import Image
-import io
+import logging
+import threading
 import base64
 import uuid
 from datetime import datetime
 
+from backend.image_processing import image_format
+from backend.services.image_cache import current_image_cache, derive_coloring_page, image_key
+
+logger = logging.getLogger(__name__)
+
+# Imagen 3.0 model for image generation
+MODEL = "imagen-3.0-generate-001"
+ASPECT_RATIO = "1:1"  # Square format
+
+
+def _image_bytes(image):
+    """The encoded image exactly as Imagen returned it; decoding and re-encoding it here
+    would put PNG compression back on the request thread (see backend.image_processing)."""
+    data = getattr(image, 'image_bytes', None)  # google-genai / Vertex AI images
+    if data is None:
+        data = image._image_bytes  # google.generativeai has no public accessor for them
+    return data
+
 class GeminiImageGenerator:
-    def __init__(self, api_key=None):
-        """Initialize with Gemini API key"""
-        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
+    provider = "gemini"
 
-        # Imagen 3.0 model for image generation
-        self.image_model = genai.ImageGenerationModel("imagen-3.0-generate-001")
+    def __init__(self, api_key=None, image_model=None, cache=None):
+        """
+        Initialize with Gemini API key
+
+        Args:
+            image_model: Imagen model client; defaults to MODEL
+            cache: ImageCache checked before calling upstream; defaults to the app's
+        """
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        self._image_model = image_model
+        self._lock = threading.Lock()
+        self.cache = cache
+
+    @property
+    def image_model(self):
+        """The Imagen client; the SDK is imported and configured on the first image"""
+        if self._image_model is None:
+            with self._lock:
+                if self._image_model is None:
+                    import google.generativeai as genai
+                    if self.api_key:
+                        genai.configure(api_key=self.api_key)
+                    self._image_model = genai.ImageGenerationModel(MODEL)
+        return self._image_model
 
     def generate_story_illustration(
         self,
@@ -42,7 +77,7 @@ class GeminiImageGenerator:
             therapeutic_focus: Optional therapeutic theme (e.g., "overcoming fear")
 
         Returns:
-            List of dicts with image data
+            List of dicts with each image's id and URL (GET /images/<id>)
         """
         # Determine detail level based on age
         if age <= 5:
@@ -86,36 +121,8 @@ Visual requirements:
 Style: {style}, optimized for {age_descriptor}
 """.strip()
 
-        try:
-            # Generate images with Gemini
-            response = self.image_model.generate_images(
-                prompt=prompt,
-                number_of_images=num_images,
-                safety_filter_level="block_some",  # Child-appropriate
-                person_generation="allow_adult",  # Allow characters
-                aspect_ratio="1:1",  # Square format
-            )
-
-            images = []
-            for i, image in enumerate(response.images):
-                # Convert to base64 for easy storage/transmission
-                img_byte_arr = io.BytesIO()
-                image._pil_image.save(img_byte_arr, format='PNG')
-                img_byte_arr = img_byte_arr.getvalue()
-
-                images.append({
-                    'id': f"{uuid.uuid4()}_{i}",
-                    'prompt': prompt,
-                    'image_data': base64.b64encode(img_byte_arr).decode('utf-8'),
-                    'format': 'png',
-                    'generated_at': datetime.now().isoformat(),
-                })
-
-            return images
-
-        except Exception as e:
-            print(f"Error generating image with Gemini: {e}")
-            return []
+        # Allow characters
+        return self._generate(prompt, num_images, "illustration", person_generation="allow_adult")
 
     def generate_coloring_page(
         self,
@@ -123,7 +130,9 @@ Style: {style}, optimized for {age_descriptor}
         character_name: str = "the hero",
         num_images: int = 1,
         age: int = 7,
-        therapeutic_focus: str = None
+        therapeutic_focus: str = None,
+        illustration_id: str = None,
+        use_model: bool = False
     ) -> list:
         """
         Generate therapeutic coloring book pages with black and white line art
@@ -134,10 +143,18 @@ Style: {style}, optimized for {age_descriptor}
             num_images: Number of variations
             age: User's age for appropriate complexity
             therapeutic_focus: Optional therapeutic theme (e.g., "relaxation")
+            illustration_id: Id of a cached illustration of the scene; the page is then
+                derived from it locally (one page, no model call)
+            use_model: Ask the model even when an illustration is given (higher quality tier)
 
         Returns:
-            List of dicts with image data
+            List of dicts with each image's id and URL (GET /images/<id>)
         """
+        if illustration_id and not use_model:
+            page = derive_coloring_page(self.cache, illustration_id, age)
+            if page is not None:
+                return [page]
+
         # Determine intricacy based on age
         if age <= 5:
             intricacy = "very simple shapes with large coloring areas, minimal details, easy for small hands"
@@ -190,33 +207,48 @@ Design style: Clean line art coloring page, therapeutic and story-based, for {ag
 Output: Pure black lines on white background only
 """.strip()
 
-        try:
-            response = self.image_model.generate_images(
-                prompt=prompt,
-                number_of_images=num_images,
-                safety_filter_level="block_some",
-                aspect_ratio="1:1",
-            )
-
-            images = []
-            for i, image in enumerate(response.images):
-                img_byte_arr = io.BytesIO()
-                image._pil_image.save(img_byte_arr, format='PNG')
-                img_byte_arr = img_byte_arr.getvalue()
-
-                images.append({
-                    'id': f"{uuid.uuid4()}_{i}",
-                    'prompt': prompt,
-                    'image_data': base64.b64encode(img_byte_arr).decode('utf-8'),
-                    'format': 'png',
-                    'generated_at': datetime.now().isoformat(),
-                })
-
-            return images
-
-        except Exception as e:
-            print(f"Error generating coloring page with Gemini: {e}")
-            return []
+        return self._generate(prompt, num_images, "coloring_page")
+
+    def _generate(self, prompt: str, num_images: int, kind: str, **options) -> list:
+        """Serve cached variants and generate only the missing ones, in one upstream call"""
+        cache = self.cache if self.cache is not None else current_image_cache()
+        keys = [image_key(self.provider, MODEL, prompt, ASPECT_RATIO, i) for i in range(num_images)]
+        results = {}
+        if cache is not None:
+            for i, key in enumerate(keys):
+                if cache.contains(key):
+                    results[i] = cache.describe(key, cached=True)
+
+        missing = [i for i in range(num_images) if i not in results]
+        if missing:
+            try:
+                response = self.image_model.generate_images(
+                    prompt=prompt,
+                    number_of_images=len(missing),
+                    safety_filter_level="block_some",  # Child-appropriate
+                    aspect_ratio=ASPECT_RATIO,
+                    **options,
+                )
+                for i, image in zip(missing, response.images):
+                    data = _image_bytes(image)
+                    if cache is None:
+                        # No app to store it in (e.g. run as a script): inline it
+                        results[i] = {
+                            'id': f"{uuid.uuid4()}_{i}",
+                            'image_data': base64.b64encode(data).decode('utf-8'),
+                            'format': image_format(data),
+                            'generated_at': datetime.now().isoformat(),
+                            'cached': False,
+                        }
+                        continue
+                    # Post-processing continues in the pool; the reference says when it is done
+                    cache.put(keys[i], data, provider=self.provider, model=MODEL, kind=kind,
+                              variant=i, size=ASPECT_RATIO, prompt=prompt)
+                    results[i] = cache.describe(keys[i])
+            except Exception as e:
+                logger.error("Error generating %s with Gemini: %s", kind.replace("_", " "), e)
+
+        return [results[i] for i in sorted(results)]
 
 
 # Example usage
@@ -233,7 +265,6 @@ if __name__ == "__main__":
 
     if illustrations:
         print(f"✓ Generated {len(illustrations)} illustration(s)")
-        print(f"  Prompt: {illustrations[0]['prompt'][:100]}...")
     else:
         print("✗ Failed to generate illustration")
 
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings picked up automatically from the backend directory.
+
+Command-line flags in the Procfile / railway.json still take precedence.
+"""
+
+import os
+
+
+def on_starting(server):
+    # Workers inherit this, so the app knows whether it is the only process
+    # serving requests (per-process state such as the progression buffer).
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
+
+
+def post_fork(server, worker):
+    # Provider SDKs are imported and their clients created lazily, which keeps
+    # importing the app cheap; each worker warms them here instead, so the
+    # first story or narration request does not pay for it.
+    if os.environ.get('GEMINI_API_KEY'):
+        try:
+            from backend.routes import story_routes
+        except ImportError:
+            from routes import story_routes
+        story_routes.story_generation_service.warm()
+
+    # gRPC channels cannot be shared across fork, so each worker opens its own
+    # Cloud TTS channel right away rather than on its first narration request.
+    if os.environ.get('TTS_BACKEND', 'google') != 'google':
+        return
+    try:
+        from backend import tts_backends
+    except ImportError:
+        import tts_backends
+    tts_backends.warm()
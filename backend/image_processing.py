@@ -0,0 +1,157 @@
+"""
+Image post-processing off the request thread.
+
+Generated images arrive as 1024x1024 PNGs, and phones should not download
+those just to draw a thumbnail. ``process`` turns one image into a responsive
+set of widths (``IMAGE_WIDTHS``), each encoded as WebP/AVIF (plus the source
+format when resized), and a tiny blurred WebP placeholder (LQIP) small enough
+to inline as a data URI while the real image loads.
+
+Resizing and encoding are CPU-bound, so they run in a process pool
+(``IMAGE_PROCESS_WORKERS``; 0 processes inline) started with forkserver or
+spawn rather than by forking a threaded web worker. This module only depends
+on Pillow so worker processes start quickly.
+"""
+
+import base64
+import io
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from PIL import Image, features
+
+DEFAULT_WIDTHS = (256, 512, 1024)
+PLACEHOLDER_WIDTH = 16
+
+# Re-encodings offered to clients, best first; only those this Pillow build can write
+ENCODINGS = {
+    name: options for name, options in (
+        ('avif', {'quality': 60, 'speed': 8}),
+        ('webp', {'quality': 80, 'method': 4}),
+    ) if features.check(name)
+}
+
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 0, 'png'),
+    (b'\xff\xd8\xff', 0, 'jpeg'),
+    (b'WEBP', 8, 'webp'),
+    (b'ftypavif', 4, 'avif'),
+    (b'GIF8', 0, 'gif'),
+)
+
+_workers = 0
+_executor = None
+_lock = threading.Lock()
+
+
+def image_format(data):
+    """'png', 'webp', ... from the file signature; 'png' if unrecognised."""
+    for signature, offset, name in _SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            return name
+    return 'png'
+
+
+def _rgb(image):
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    has_alpha = 'transparency' in image.info or 'A' in image.mode
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def _resized(image, width):
+    if width >= image.width:
+        return image
+    return image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+
+def _save(image, fmt):
+    out = io.BytesIO()
+    if fmt in ENCODINGS:
+        image.save(out, format=fmt.upper(), **ENCODINGS[fmt])
+    else:
+        image.save(out, format=fmt.upper(), optimize=fmt == 'png')
+    return out.getvalue()
+
+
+def encode(data, fmt, width=None):
+    """Image bytes re-encoded as ``fmt``, optionally scaled down to ``width``."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        image = _rgb(image)
+        return _save(_resized(image, width) if width else image, fmt)
+
+
+def placeholder(image):
+    """Tiny blurred WebP of ``image`` as a data URI (a few hundred bytes)."""
+    small = _resized(_rgb(image), PLACEHOLDER_WIDTH)
+    out = io.BytesIO()
+    small.save(out, format='WEBP', quality=30)
+    return 'data:image/webp;base64,' + base64.b64encode(out.getvalue()).decode('ascii')
+
+
+def process(data, widths=DEFAULT_WIDTHS):
+    """
+    All derived files for one image; runs in a worker process.
+
+    Returns ``{'width', 'height', 'placeholder', 'variants': [(format, width, bytes)]}``
+    with a variant for every requested width up to the original's, in each of
+    ``ENCODINGS`` and, when resized, the source format.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        source_format = (image.format or 'png').lower()
+        image = _rgb(image)
+    variants = []
+    current = image
+    # Largest first, each step resampling the previous one, which is cheaper
+    for width in sorted({min(w, image.width) for w in widths}, reverse=True):
+        current = _resized(current, width)
+        formats = list(ENCODINGS)
+        if width < image.width and source_format not in formats:
+            formats.append(source_format)
+        for fmt in formats:
+            if fmt == source_format and width == image.width:
+                continue  # that is the original
+            variants.append((fmt, width, _save(current, fmt)))
+    return {
+        'width': image.width,
+        'height': image.height,
+        'placeholder': placeholder(current),
+        'variants': variants,
+    }
+
+
+def configure(workers=None):
+    global _workers, _executor
+    with _lock:
+        if workers is not None and workers != _workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+                _executor = None
+            _workers = workers
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Never fork a (possibly threaded) web worker; start from a clean process.
+            methods = multiprocessing.get_all_start_methods()
+            start_method = 'forkserver' if 'forkserver' in methods else 'spawn'
+            context = multiprocessing.get_context(start_method)
+            _executor = ProcessPoolExecutor(max_workers=_workers, mp_context=context)
+        return _executor
+
+
+def submit(data, widths=DEFAULT_WIDTHS):
+    """Future of ``process(data, widths)``, run in the pool (or inline without workers)."""
+    if _workers:
+        return _pool().submit(process, data, tuple(widths))
+    future = Future()
+    try:
+        future.set_result(process(data, widths))
+    except Exception as e:
+        future.set_exception(e)
+    return future
@@ -0,0 +1,133 @@
+"""
+Image providers behind the image router
+Listed in IMAGE_PROVIDERS: "gemini" (Imagen), "openrouter" (SDXL) or "stub"
+
+Every provider implements the generators' interface:
+    generate_story_illustration(scene_description, character_name, style, num_images, ...)
+        -> [image]
+    generate_coloring_page(scene_description, character_name, num_images, ...) -> [image]
+and names itself in ``provider``; a ``bucket`` (TokenBucket pacing its
+upstream calls) is optional and lets the router see when it is rate limited.
+Like the generators, providers log errors and return fewer images (or none)
+rather than raising.
+
+The stub provider needs no network or credentials. It draws a small PNG per
+prompt, stores it in the image cache like a real provider and can be made
+slow or failing, so the router, the media pipeline and image delivery can be
+exercised offline.
+"""
+
+import base64
+import hashlib
+import io
+import os
+import time
+import uuid
+from datetime import datetime
+
+from PIL import Image, ImageDraw
+
+from backend.services.image_cache import current_image_cache, derive_coloring_page, image_key
+
+PROVIDERS = ("gemini", "openrouter", "stub")
+
+
+class StubImageProvider:
+    """Offline provider drawing one shape per prompt"""
+
+    provider = "stub"
+    MODEL = "stub-v1"
+    SIZE = "512x512"
+
+    def __init__(self, latency: float = 0.0, fail: bool = False, cache=None, name: str = None,
+                 bucket=None):
+        """
+        Args:
+            latency: Seconds to sleep per request, to imitate the network call
+            fail: Return no images, like a provider that is down
+            cache: ImageCache; defaults to the app's
+            name: Provider name to report (lets tests stand in for a real provider)
+            bucket: Optional TokenBucket, to imitate a provider rate limit
+        """
+        self.latency = latency
+        self.fail = fail
+        self.cache = cache
+        self.bucket = bucket
+        self.calls = 0
+        if name:
+            self.provider = name
+
+    def generate_story_illustration(self, scene_description: str, character_name: str = "the hero",
+                                    style: str = "children's book illustration",
+                                    num_images: int = 1, **options) -> list:
+        return self._generate(f"{style}: {scene_description} ({character_name})", num_images,
+                              "illustration")
+
+    def generate_coloring_page(self, scene_description: str, character_name: str = "the hero",
+                               num_images: int = 1, illustration_id: str = None,
+                               use_model: bool = False, age: int = 7, **options) -> list:
+        if illustration_id and not use_model:
+            page = derive_coloring_page(self.cache, illustration_id, age)
+            if page is not None:
+                return [page]
+        return self._generate(f"coloring page: {scene_description} ({character_name})", num_images,
+                              "coloring_page")
+
+    def _generate(self, prompt: str, num_images: int, kind: str) -> list:
+        self.calls += 1
+        if self.bucket is not None:
+            self.bucket.acquire()
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail:
+            return []
+        cache = self.cache if self.cache is not None else current_image_cache()
+        results = []
+        for i in range(num_images):
+            data = _drawing(prompt, i, kind)
+            if cache is None:
+                results.append({
+                    'id': f"{uuid.uuid4()}_{i}",
+                    'image_data': base64.b64encode(data).decode('utf-8'),
+                    'format': 'png',
+                    'generated_at': datetime.now().isoformat(),
+                    'cached': False,
+                })
+                continue
+            key = image_key(self.provider, self.MODEL, prompt, self.SIZE, i)
+            cached = cache.contains(key)
+            if not cached:
+                cache.put(key, data, provider=self.provider, model=self.MODEL, kind=kind,
+                          variant=i, size=self.SIZE, prompt=prompt)
+            results.append(cache.describe(key, cached=cached))
+        return results
+
+
+def _drawing(prompt: str, variant: int, kind: str, size: int = 512) -> bytes:
+    digest = hashlib.sha256(f"{prompt}/{variant}".encode()).digest()
+    coloring = kind == "coloring_page"
+    image = Image.new("RGB", (size, size), "white" if coloring else tuple(digest[:3]))
+    inset = size // 8 + digest[3] % (size // 8)
+    ImageDraw.Draw(image).ellipse((inset, inset, size - inset, size - inset),
+                                  fill=None if coloring else tuple(digest[4:7]), outline="black",
+                                  width=8)
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def create_provider(name: str, config):
+    """The provider registered under name, or None when its API key is not configured"""
+    if name == "gemini":
+        if not config.get("GEMINI_API_KEY"):
+            return None
+        from backend.gemini_image_generator import GeminiImageGenerator
+        return GeminiImageGenerator(api_key=config["GEMINI_API_KEY"])
+    if name == "openrouter":
+        if not os.getenv("OPENROUTER_API_KEY"):
+            return None
+        from backend.openrouter_image_generator import OpenRouterImageGenerator
+        return OpenRouterImageGenerator()
+    if name == "stub":
+        return StubImageProvider(latency=config.get("IMAGE_STUB_LATENCY", 0.0))
+    raise ValueError(f"Unknown image provider {name!r}; choose from {list(PROVIDERS)}")
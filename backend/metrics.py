@@ -0,0 +1,49 @@
+"""
+Process-local metrics exposed as JSON at ``GET /metrics``.
+
+Components register a zero-argument provider returning a dict; the endpoint
+calls every provider on demand, so nothing is computed between scrapes.
+"""
+
+import threading
+from collections import deque
+
+_providers = {}
+
+
+def register(name, provider):
+    _providers[name] = provider
+
+
+def snapshot():
+    return {name: provider() for name, provider in sorted(_providers.items())}
+
+
+class RollingTiming:
+    """Latency samples over the last ``window`` observations."""
+
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+            self.count += 1
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def as_dict(self):
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            'count': self.count,
+            'p50_ms': round(p50, 3) if p50 is not None else None,
+            'p95_ms': round(p95, 3) if p95 is not None else None,
+        }
@@ -1,8 +1,121 @@
+from dataclasses import dataclass
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, g
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from backend.cache import TTLCache, make_cache
+from backend.database import db
+from backend.metrics import RollingTiming, register
 from backend.models.user import User
+import hashlib
 import jwt
 import os
+import time
+
+# Verified token -> JWT claims, and user id -> identity snapshot, so protected
+# requests normally authenticate without a database round trip.
+_token_cache = TTLCache(maxsize=10000, ttl=60.0)
+_user_cache = TTLCache(maxsize=10000, ttl=60.0)
+_auth_timing = RollingTiming()
+
+
+@dataclass(frozen=True, slots=True)
+class AuthenticatedUser:
+    """What require_auth knows about the caller without loading the User row."""
+    id: str
+    username: str
+    email: str
+
+
+def init_auth_cache(app):
+    """Configure the identity caches; shared across workers when AUTH_CACHE_URL is set."""
+    global _token_cache, _user_cache
+    ttl = app.config.get('AUTH_CACHE_TTL', 60.0)
+    maxsize = app.config.get('AUTH_CACHE_MAXSIZE', 10000)
+    url = app.config.get('AUTH_CACHE_URL')
+    _token_cache = make_cache('auth:token:', maxsize=maxsize, ttl=ttl, url=url)
+    _user_cache = make_cache('auth:user:', maxsize=maxsize, ttl=ttl, url=url)
+
+    register('auth', lambda: {
+        **_auth_timing.as_dict(),
+        'token_cache': _token_cache.stats(),
+        'user_cache': _user_cache.stats(),
+    })
+
+    @app.after_request
+    def add_auth_timing(response):
+        auth_ms = g.get('auth_ms')
+        if auth_ms is not None:
+            response.headers.add('Server-Timing', f"auth;dur={auth_ms:.3f}")
+        return response
+
+
+def invalidate_user(user_id):
+    """Drop the cached identity for ``user_id`` (password change, deletion)."""
+    _user_cache.delete(user_id)
+
+
+def _invalidate_on_commit(target):
+    # Until the commit lands, a concurrent request can still read the old row
+    # and cache it again, so the cache is only cleared once the change is visible.
+    session = object_session(target)
+    if session is None:
+        invalidate_user(target.id)
+    else:
+        session.info.setdefault('auth_invalidate', set()).add(target.id)
+
+
+@event.listens_for(User, 'after_update')
+def _invalidate_on_credential_change(mapper, connection, target):
+    state = inspect(target)
+    credentials = ('password_hash', 'username', 'email')
+    if any(state.attrs[name].history.has_changes() for name in credentials):
+        _invalidate_on_commit(target)
+
+
+@event.listens_for(User, 'after_delete')
+def _invalidate_on_delete(mapper, connection, target):
+    _invalidate_on_commit(target)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for user_id in session.info.pop('auth_invalidate', ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('auth_invalidate', None)
+
+
+def _verify_token(token):
+    key = hashlib.sha256(token.encode()).hexdigest()
+    claims = _token_cache.get(key)
+    if claims is None:
+        claims = jwt.decode(
+            token,
+            os.getenv('JWT_SECRET_KEY'),
+            algorithms=['HS256']
+        )
+        # Never cache a token beyond its own expiry.
+        ttl = _token_cache.ttl
+        if 'exp' in claims:
+            ttl = min(ttl, claims['exp'] - time.time())
+        _token_cache.set(key, claims, ttl=ttl)
+    return claims
+
+
+def _load_identity(user_id):
+    cached = _user_cache.get(user_id)
+    if cached is not None:
+        return AuthenticatedUser(**cached)
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+    _user_cache.set(user_id, {'id': user.id, 'username': user.username, 'email': user.email})
+    return AuthenticatedUser(user.id, user.username, user.email)
+
 
 def require_auth(f):
     @wraps(f)
@@ -11,16 +124,13 @@ def require_auth(f):
         if not token:
             return jsonify({'error': 'No auth token'}), 401
 
+        start = time.perf_counter()
         try:
             if token.startswith('Bearer '):
                 token = token[7:]
 
-            data = jwt.decode(
-                token,
-                os.getenv('JWT_SECRET_KEY'),
-                algorithms=['HS256']
-            )
-            current_user = User.query.get(data['user_id'])
+            data = _verify_token(token)
+            current_user = _load_identity(data['user_id'])
             if not current_user:
                 return jsonify({'error': 'User not found'}), 401
 
@@ -30,7 +140,31 @@ def require_auth(f):
             return jsonify({'error': 'Token expired'}), 401
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token'}), 401
+        finally:
+            g.auth_ms = (time.perf_counter() - start) * 1000
+            _auth_timing.record(g.auth_ms)
 
         return f(*args, **kwargs)
 
     return decorated
+
+
+def optional_user_id():
+    """User id from a valid Bearer token, or ``None``; never rejects the request."""
+    current_user = getattr(request, 'current_user', None)
+    if current_user is not None:
+        return current_user.id
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    try:
+        return _verify_token(header[7:]).get('user_id')
+    except (jwt.PyJWTError, TypeError):
+        return None
+
+
+def load_current_user():
+    """The authenticated caller's ``User`` row, loaded once per request when needed."""
+    if 'current_user_row' not in g:
+        g.current_user_row = db.session.get(User, request.current_user.id)
+    return g.current_user_row
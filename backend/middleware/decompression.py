@@ -0,0 +1,104 @@
+"""
+Accept ``Content-Encoding: gzip`` / ``deflate`` request bodies.
+
+Mobile clients can compress large uploads (progression syncs, story
+payloads). The body is inflated incrementally before Flask sees it, with
+``REQUEST_MAX_DECOMPRESSED_BYTES`` bounding the output so a small
+compression bomb cannot exhaust memory: oversized bodies get 413, corrupt
+ones 400.
+"""
+
+import io
+import json
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+# zlib wbits: gzip container, or the zlib-wrapped stream HTTP calls "deflate"
+_WBITS = {'gzip': 31, 'x-gzip': 31, 'deflate': 15}
+
+
+class _BodyError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _inflate(stream, content_length, wbits, max_size):
+    decompressor = zlib.decompressobj(wbits)
+    out = bytearray()
+    remaining = content_length
+    while remaining is None or remaining > 0:
+        chunk = stream.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        data = chunk
+        while data:
+            # Never inflate more than the remaining budget (+1 to detect overflow).
+            out += decompressor.decompress(data, max_size - len(out) + 1)
+            if len(out) > max_size:
+                raise _BodyError('413 Request Entity Too Large',
+                                 'Decompressed request body is too large')
+            data = decompressor.unconsumed_tail
+    out += decompressor.flush()
+    if len(out) > max_size:
+        raise _BodyError('413 Request Entity Too Large', 'Decompressed request body is too large')
+    if not decompressor.eof:
+        raise _BodyError('400 Bad Request', 'Truncated compressed request body')
+    return bytes(out)
+
+
+class DecompressRequestMiddleware:
+    def __init__(self, wsgi_app, max_size=10 * 1024 * 1024, max_compressed_size=None):
+        self.wsgi_app = wsgi_app
+        self.max_size = max_size
+        self.max_compressed_size = max_compressed_size or max_size
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding in ('', 'identity'):
+            return self.wsgi_app(environ, start_response)
+        if encoding not in _WBITS:
+            return self._error(start_response, '415 Unsupported Media Type',
+                               f"Unsupported Content-Encoding: {encoding}")
+
+        try:
+            length = environ.get('CONTENT_LENGTH')
+            content_length = int(length) if length else None
+        except ValueError:
+            return self._error(start_response, '400 Bad Request', 'Invalid Content-Length')
+        if content_length is not None and content_length > self.max_compressed_size:
+            return self._error(start_response, '413 Request Entity Too Large',
+                               'Request body is too large')
+
+        try:
+            body = _inflate(environ['wsgi.input'], content_length, _WBITS[encoding], self.max_size)
+        except _BodyError as e:
+            return self._error(start_response, e.status, e.message)
+        except zlib.error:
+            return self._error(start_response, '400 Bad Request',
+                               'Malformed compressed request body')
+
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ.pop('HTTP_CONTENT_ENCODING', None)
+        return self.wsgi_app(environ, start_response)
+
+    @staticmethod
+    def _error(start_response, status, message):
+        body = json.dumps({'error': message}).encode()
+        start_response(status, [
+            ('Content-Type', 'application/json'), ('Content-Length', str(len(body))),
+        ])
+        return [body]
+
+
+def init_request_decompression(app):
+    app.wsgi_app = DecompressRequestMiddleware(
+        app.wsgi_app,
+        max_size=app.config.get('REQUEST_MAX_DECOMPRESSED_BYTES', 10 * 1024 * 1024),
+        max_compressed_size=app.config.get('MAX_CONTENT_LENGTH'),
+    )
@@ -0,0 +1,18 @@
+"""
+Trust the reverse proxy in front of the app.
+
+Behind Railway's edge every request arrives from the proxy's address, so
+``request.remote_addr`` (and with it the per-IP rate limits) would lump all
+clients together. With ``PROXY_COUNT`` proxies configured, werkzeug's
+``ProxyFix`` takes the client address and scheme from the last
+``PROXY_COUNT`` entries of ``X-Forwarded-For`` / ``X-Forwarded-Proto``;
+entries a client adds itself in front of those are ignored.
+"""
+
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+
+def init_proxy_fix(app):
+    proxies = app.config.get('PROXY_COUNT', 0)
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
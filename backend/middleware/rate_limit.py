@@ -0,0 +1,249 @@
+"""
+Token-bucket rate limiting for expensive endpoints.
+
+Every category (``text``, ``image``, ``tts``, ``login``) has its own buckets.
+A request must find a token in each bucket that applies to it:
+
+- ``ip:<addr>``    per client IP (``RATE_LIMITS_PER_IP``); behind a proxy the
+                   address comes from ``X-Forwarded-For`` (see ``proxy``)
+- ``user:<id>``    per authenticated user (``RATE_LIMITS``)
+- ``quota:<id>``   per-user generation quota over a rolling 24 hours
+                   (``GENERATION_ROLLING_QUOTA``): it refills evenly, one
+                   generation every ``86400 / quota`` seconds, rather than
+                   resetting at midnight
+- ``<key>``         an explicit key such as ``account:<username>`` for logins
+
+Limits are written ``"<capacity>/<seconds>"``: a burst of ``capacity`` requests
+refilled evenly over ``seconds``. Bucket state lives in process by default;
+set ``RATE_LIMIT_STORAGE_URL`` to a SQLite/Postgres URL to share it between
+workers. Its ``rate_limit_bucket`` table is created by the migrations, like
+the rest of the schema. Rejections are immediate 429s with ``Retry-After``.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from sqlalchemy import create_engine, inspect, select
+from sqlalchemy.exc import IntegrityError
+
+from backend.database import db
+from backend.metrics import register
+from backend.middleware.auth import optional_user_id
+from backend.migrations import SchemaVersionError
+
+bucket_table = db.Table(
+    'rate_limit_bucket',
+    db.Column('key', db.String(200), primary_key=True),
+    db.Column('tokens', db.Float, nullable=False),
+    db.Column('updated_at', db.Float, nullable=False),
+)
+
+
+def parse_limit(spec):
+    """``"10/60"`` -> ``(10.0, 10 / 60)`` as (capacity, tokens per second)."""
+    capacity, seconds = spec.split('/')
+    capacity, seconds = float(capacity), float(seconds)
+    return capacity, capacity / seconds
+
+
+def refill(tokens, updated_at, now, capacity, rate):
+    return min(capacity, tokens + (now - updated_at) * rate)
+
+
+def _take(tokens, capacity, rate, cost):
+    """Returns (tokens left, seconds until ``cost`` is available or 0 if allowed).
+
+    A negative ``cost`` gives tokens back, up to ``capacity``.
+    """
+    if tokens >= cost:
+        return min(capacity, tokens - cost), 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class TokenBucket:
+    """A single bucket; also used directly to pace outbound provider calls."""
+
+    def __init__(self, capacity, rate, clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = rate
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def try_take(self, cost=1.0):
+        """Take ``cost`` tokens if available; returns seconds to wait otherwise (0 = taken)."""
+        with self._lock:
+            now = self._clock()
+            tokens = refill(self._tokens, self._updated_at, now, self.capacity, self.rate)
+            self._tokens, wait = _take(tokens, self.capacity, self.rate, cost)
+            self._updated_at = now
+            return wait
+
+    def available(self):
+        """Tokens that could be taken now, without taking any."""
+        with self._lock:
+            return refill(self._tokens, self._updated_at, self._clock(), self.capacity, self.rate)
+
+    def acquire(self, cost=1.0, timeout=None):
+        """Block until ``cost`` tokens are taken; False if that would exceed ``timeout``."""
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            wait = self.try_take(cost)
+            if not wait:
+                return True
+            if deadline is not None and self._clock() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class MemoryBucketStore:
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1.0):
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = refill(tokens, updated_at, now, capacity, rate)
+            tokens, wait = _take(tokens, capacity, rate, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SQLBucketStore:
+    """Buckets in a shared table, updated with compare-and-swap so workers agree."""
+
+    def __init__(self, url, clock=time.time, retries=5):
+        self._engine = create_engine(url)
+        self._clock = clock
+        self._retries = retries
+        if not inspect(self._engine).has_table(bucket_table.name):
+            raise SchemaVersionError(
+                f"{bucket_table.name} is missing. Run `python -m backend.migrations upgrade` "
+                "against RATE_LIMIT_STORAGE_URL before starting workers."
+            )
+
+    def take(self, key, capacity, rate, cost=1.0):
+        for _ in range(self._retries):
+            now = self._clock()
+            with self._engine.begin() as conn:
+                row = conn.execute(
+                    select(bucket_table.c.tokens, bucket_table.c.updated_at)
+                    .where(bucket_table.c.key == key)
+                ).first()
+                if row is None:
+                    tokens, wait = _take(capacity, capacity, rate, cost)
+                    try:
+                        conn.execute(
+                            bucket_table.insert().values(key=key, tokens=tokens, updated_at=now)
+                        )
+                    except IntegrityError:
+                        continue
+                    return wait
+                tokens = refill(row.tokens, row.updated_at, now, capacity, rate)
+                tokens, wait = _take(tokens, capacity, rate, cost)
+                updated = conn.execute(
+                    bucket_table.update()
+                    .where(bucket_table.c.key == key, bucket_table.c.updated_at == row.updated_at)
+                    .values(tokens=tokens, updated_at=now)
+                )
+                if updated.rowcount == 1:
+                    return wait
+        # Heavy contention on one key: fail open rather than stall the request.
+        return 0.0
+
+
+class RateLimiter:
+    def __init__(self, store, user_limits, ip_limits, rolling_quota=None):
+        self.store = store
+        self.user_limits = {k: parse_limit(v) for k, v in user_limits.items()}
+        self.ip_limits = {k: parse_limit(v) for k, v in ip_limits.items()}
+        self.rolling_quota = {
+            k: parse_limit(f"{v}/86400") for k, v in (rolling_quota or {}).items()
+        }
+        self.rejected = {}
+
+    def check(self, category, key=None, user_id=None, ip=None):
+        """
+        Take a token from every applicable bucket; returns Retry-After seconds or 0.
+
+        All or nothing: when a bucket rejects, the tokens already taken from the
+        others are given back, so retrying over one limit (say the quota)
+        does not drain the IP bucket shared by everyone behind the same NAT.
+        """
+        buckets = []
+        if ip and category in self.ip_limits:
+            buckets.append((f"{category}:ip:{ip}", self.ip_limits[category]))
+        if user_id and category in self.user_limits:
+            buckets.append((f"{category}:user:{user_id}", self.user_limits[category]))
+        if user_id and category in self.rolling_quota:
+            buckets.append((f"{category}:quota:{user_id}", self.rolling_quota[category]))
+        if key and category in self.user_limits:
+            buckets.append((f"{category}:{key}", self.user_limits[category]))
+
+        for taken, (bucket_key, (capacity, rate)) in enumerate(buckets):
+            wait = self.store.take(bucket_key, capacity, rate)
+            if wait:
+                for refund_key, (refund_capacity, refund_rate) in buckets[:taken]:
+                    self.store.take(refund_key, refund_capacity, refund_rate, cost=-1.0)
+                self.rejected[category] = self.rejected.get(category, 0) + 1
+                return wait
+        return 0.0
+
+
+def init_rate_limiter(app):
+    url = app.config.get('RATE_LIMIT_STORAGE_URL')
+    store = SQLBucketStore(url) if url else MemoryBucketStore()
+    user_limits = dict(app.config.get('RATE_LIMITS', {}))
+    user_limits['login'] = (
+        f"{app.config.get('LOGIN_MAX_ATTEMPTS', 10)}/{app.config.get('LOGIN_ATTEMPT_WINDOW', 60)}"
+    )
+    limiter = RateLimiter(
+        store,
+        user_limits=user_limits,
+        ip_limits=app.config.get('RATE_LIMITS_PER_IP', {}),
+        rolling_quota=app.config.get('GENERATION_ROLLING_QUOTA', {}),
+    )
+    app.extensions['rate_limiter'] = limiter
+    register('rate_limit', lambda: {'rejected': dict(limiter.rejected)})
+    return limiter
+
+
+def too_many_requests(retry_after, message='Too many requests'):
+    return jsonify({'error': message, 'retry_after': math.ceil(retry_after)}), 429, {
+        'Retry-After': str(math.ceil(retry_after)),
+    }
+
+
+def check_rate_limit(category, key=None):
+    """Retry-After seconds if the current request is over ``category``'s limits, else 0."""
+    limiter = current_app.extensions.get('rate_limiter')
+    if limiter is None:
+        return 0.0
+    return limiter.check(category, key=key, user_id=optional_user_id(), ip=request.remote_addr)
+
+
+def rate_limited(category):
+    """Reject requests over the ``category`` limits before the view runs."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            retry_after = check_rate_limit(category)
+            if retry_after:
+                return too_many_requests(retry_after)
+            return f(*args, **kwargs)
+
+        return decorated
+
+    return decorator
@@ -0,0 +1,174 @@
+"""
+Read-replica routing for read-only request handlers.
+
+Handlers decorated with ``@replica_reads`` have their queries sent to the
+``replica`` bind (``SQLALCHEMY_BINDS['replica']``) unless:
+
+- the caller wrote something within the last ``READ_REPLICA_STICKY_SECONDS``
+  (read-your-writes stickiness, tracked per process and via a cookie so it
+  survives hopping between workers), or
+- the replica is lagging more than ``READ_REPLICA_MAX_LAG_SECONDS`` behind
+  the primary, or its lag cannot be measured.
+
+Without a replica configured everything stays on the primary.
+"""
+
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event, text
+
+from backend.database import RoutingSession, db
+
+REPLICA_BIND = 'replica'
+STICKY_COOKIE = 'sw_primary_until'
+
+# Postgres standby replay delay; other dialects have no replication concept
+# we can observe, so they report zero lag.
+_PG_LAG_QUERY = text(
+    "SELECT COALESCE(EXTRACT(EPOCH FROM (now() - pg_last_xact_replay_timestamp())), 0)"
+)
+
+
+def replica_reads(f):
+    """Mark a view as read-only so its queries may be served by the replica."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.read_replica = True
+        return f(*args, **kwargs)
+
+    return decorated
+
+
+def _request_actor():
+    """Key used for read-your-writes stickiness: the user if known, else the client IP."""
+    user = getattr(request, 'current_user', None)
+    if user is not None:
+        return f"user:{user.id}"
+    return f"ip:{request.remote_addr}"
+
+
+class ReplicaRouter:
+    def __init__(self, sticky_seconds=5.0, max_lag_seconds=10.0,
+                 lag_check_interval=5.0, max_tracked=10000, clock=time.time):
+        self.sticky_seconds = sticky_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_interval = lag_check_interval
+        self.max_tracked = max_tracked
+        self._clock = clock
+        self._sticky = {}
+        self._lock = threading.Lock()
+        self._lag = None
+        self._lag_checked_at = None
+
+    # ---- stickiness -------------------------------------------------------
+
+    def mark_write(self, actor):
+        """Pin ``actor`` to the primary for the stickiness window. Returns the expiry."""
+        now = self._clock()
+        until = now + self.sticky_seconds
+        with self._lock:
+            if len(self._sticky) >= self.max_tracked:
+                self._sticky = {k: v for k, v in self._sticky.items() if v > now}
+            self._sticky[actor] = until
+        return until
+
+    def is_sticky(self, actor, cookie_until=None):
+        now = self._clock()
+        if cookie_until is not None and cookie_until > now:
+            return True
+        until = self._sticky.get(actor)
+        return until is not None and until > now
+
+    # ---- lag ---------------------------------------------------------------
+
+    def replica_lag(self, engine):
+        """Seconds the replica is behind, cached for ``lag_check_interval``.
+
+        Returns ``None`` when the lag cannot be measured.
+        """
+        now = self._clock()
+        checked_at = self._lag_checked_at
+        if checked_at is not None and now - checked_at < self.lag_check_interval:
+            return self._lag
+        lag = None
+        try:
+            if engine.dialect.name == 'postgresql':
+                with engine.connect() as conn:
+                    lag = float(conn.execute(_PG_LAG_QUERY).scalar() or 0.0)
+            else:
+                lag = 0.0
+        except Exception:
+            lag = None
+        self._lag, self._lag_checked_at = lag, now
+        return lag
+
+    def replica_healthy(self, engine):
+        lag = self.replica_lag(engine)
+        return lag is not None and lag <= self.max_lag_seconds
+
+    # ---- routing -----------------------------------------------------------
+
+    def read_engine(self):
+        """Engine to use for the current read, or ``None`` to stay on the primary."""
+        if not has_request_context() or not g.get('read_replica'):
+            return None
+        engine = db.engines.get(REPLICA_BIND)
+        if engine is None:
+            return None
+        if self.is_sticky(_request_actor(), _cookie_until()):
+            return None
+        if not self.replica_healthy(engine):
+            return None
+        return engine
+
+    def status(self):
+        engine = db.engines.get(REPLICA_BIND)
+        if engine is None:
+            return 'disabled'
+        return 'ok' if self.replica_healthy(engine) else 'lagging'
+
+
+def _cookie_until():
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, ''))
+    except ValueError:
+        return None
+
+
+def _after_flush(session, flush_context):
+    if not has_request_context():
+        return
+    router = current_app.extensions.get('read_replica')
+    if router is not None:
+        g.primary_until = router.mark_write(_request_actor())
+
+
+def init_read_replica(app):
+    """Install the replica router if a ``replica`` bind is configured."""
+    if REPLICA_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return None
+
+    router = ReplicaRouter(
+        sticky_seconds=app.config.get('READ_REPLICA_STICKY_SECONDS', 5.0),
+        max_lag_seconds=app.config.get('READ_REPLICA_MAX_LAG_SECONDS', 10.0),
+        lag_check_interval=app.config.get('READ_REPLICA_LAG_CHECK_INTERVAL', 5.0),
+    )
+    app.extensions['read_replica'] = router
+
+    if not event.contains(RoutingSession, 'after_flush', _after_flush):
+        event.listen(RoutingSession, 'after_flush', _after_flush)
+
+    @app.after_request
+    def set_sticky_cookie(response):
+        until = g.get('primary_until')
+        if until is not None:
+            response.set_cookie(
+                STICKY_COOKIE, f"{until:.3f}",
+                max_age=int(router.sticky_seconds) + 1, httponly=True, samesite='Lax',
+            )
+        return response
+
+    return router
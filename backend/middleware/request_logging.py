@@ -0,0 +1,251 @@
+"""
+Structured logging that never writes from a request thread.
+
+Log records are put on a bounded in-memory queue (``QueueHandler``) and a
+``QueueListener`` thread writes them as JSON lines to ``LOG_FILE``, rotated
+at ``LOG_MAX_BYTES``. A request thread only renders the message and copies
+the request context onto the record; when the disk falls behind and the
+queue is full, records are dropped and counted rather than blocking
+requests.
+
+Every request gets an id (a valid incoming ``X-Request-ID``, else a new
+one; echoed in the response) and one access record with route, status and
+latency. Handlers add fields such as the model used or the cache outcome
+with ``annotate``; they appear on the access record and on everything the
+request logs after that.
+"""
+
+import atexit
+import collections
+import copy
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+
+from backend.metrics import register
+
+access_logger = logging.getLogger('story_weaver.access')
+
+# Request context copied onto records, in this order in the JSON
+CONTEXT_FIELDS = ('request_id', 'method', 'route', 'status', 'latency_ms', 'model', 'cache')
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_listener = None
+_handler = None
+_root_level = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request context, exception."""
+
+    def format(self, record):
+        created = datetime.fromtimestamp(record.created, timezone.utc)
+        entry = {
+            'ts': created.isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class LogQueue:
+    """
+    Bounded queue for log records that never wakes the listener per record.
+
+    ``queue.Queue`` signals a condition on every put, which costs the logging
+    thread a lock round trip and, with few cores, a thread switch to the
+    listener for each record. Here ``put_nowait`` is a single deque append and
+    the listener polls every ``poll_interval`` seconds while the queue is
+    empty, calling ``on_idle`` (e.g. to flush the file) first.
+    """
+
+    def __init__(self, maxsize=10000, poll_interval=0.05, on_idle=None):
+        self.maxsize = maxsize
+        self.poll_interval = poll_interval
+        self.on_idle = on_idle
+        self._records = collections.deque()
+
+    def put_nowait(self, record):
+        # QueueListener.stop's sentinel always gets in, or stopping at exit would raise
+        if record is not QueueListener._sentinel and len(self._records) >= self.maxsize:
+            raise queue.Full
+        self._records.append(record)
+
+    def get(self, block=True):
+        while True:
+            try:
+                return self._records.popleft()
+            except IndexError:
+                if not block:
+                    raise queue.Empty from None
+                if self.on_idle is not None:
+                    self.on_idle()
+                time.sleep(self.poll_interval)
+
+    def qsize(self):
+        return len(self._records)
+
+
+class JsonLinesFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler for the listener thread: the file size is counted
+    instead of seeking before every record, and writes are flushed once the
+    queue is drained (``LogQueue.on_idle``) rather than per record.
+    """
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.setFormatter(JsonFormatter())
+        self._size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+
+    def emit(self, record):
+        try:
+            line = self.format(record) + self.terminator  # ASCII: JSON escapes the rest
+            if self.maxBytes and self._size and self._size + len(line) > self.maxBytes:
+                self.doRollover()
+                self._size = 0
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(line)
+            self._size += len(line)
+        except Exception:
+            self.handleError(record)
+
+
+class RequestQueueHandler(QueueHandler):
+    """Hands records to the listener thread with the request context attached; drops when full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Runs in the logging thread: render everything the listener cannot see
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = JsonFormatter().formatException(record.exc_info)
+            record.exc_info = None
+        if has_request_context():
+            for field, value in g.get('log_fields', {}).items():
+                if getattr(record, field, None) is None:
+                    setattr(record, field, value)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def annotate(**fields):
+    """Add fields (e.g. ``model=``, ``cache=``) to this request's log records."""
+    if has_request_context():
+        g.setdefault('log_fields', {}).update(
+            {name: value for name, value in fields.items() if value is not None})
+
+
+def start_logging(path, max_bytes=50 * 1024 ** 2, backup_count=5, level=logging.INFO,
+                  queue_size=10000):
+    """Send every log record to a JSON lines file through the background listener."""
+    global _listener, _handler, _root_level
+    with _lock:
+        stop_logging()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = JsonLinesFileHandler(path, max_bytes, backup_count)
+        _handler = RequestQueueHandler(LogQueue(maxsize=queue_size, on_idle=file_handler.flush))
+        _listener = QueueListener(_handler.queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        _root_level = root.level
+        root.setLevel(level)
+    return _handler
+
+
+def stop_logging():
+    """Write out everything queued and detach the handler (also runs at exit)."""
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _handler is not None:
+        root = logging.getLogger()
+        root.removeHandler(_handler)
+        root.setLevel(_root_level)
+        _handler = None
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork; the child gets a fresh queue and thread
+    global _listener
+    if _listener is not None:
+        _handler.queue = LogQueue(maxsize=_handler.queue.maxsize, on_idle=_handler.queue.on_idle)
+        _listener = QueueListener(_handler.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(stop_logging)
+
+
+def init_request_logging(app):
+    """Request ids and access records; JSON file logging unless in debug mode."""
+    if not app.debug:
+        start_logging(
+            app.config.get('LOG_FILE', 'logs/story_weaver.log'),
+            max_bytes=app.config.get('LOG_MAX_BYTES', 50 * 1024 ** 2),
+            backup_count=app.config.get('LOG_BACKUP_COUNT', 5),
+            level=app.config.get('LOG_LEVEL', 'INFO'),
+        )
+    register('logging', lambda: {
+        'queued': _handler.queue.qsize() if _handler else 0,
+        'dropped': _handler.dropped if _handler else 0,
+    })
+
+    @app.before_request
+    def start_request_log():
+        incoming = request.headers.get('X-Request-ID', '')
+        g.log_started = time.perf_counter()
+        g.log_fields = {
+            'request_id': incoming if _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex,
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else request.path,
+        }
+
+    @app.after_request
+    def log_request(response):
+        fields = g.get('log_fields')
+        if fields is None:
+            return response
+        response.headers['X-Request-ID'] = fields['request_id']
+        latency_ms = round((time.perf_counter() - g.log_started) * 1000, 3)
+        access_logger.info('%s %s %s', fields['method'], fields['route'], response.status_code,
+                           extra={'status': response.status_code, 'latency_ms': latency_ms})
+        return response
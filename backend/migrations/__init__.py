@@ -0,0 +1,163 @@
+"""
+Lightweight schema migrations.
+
+Migrations run once per deploy as a release step::
+
+    python -m backend.migrations upgrade
+
+Workers never touch the schema. At boot they run a single
+``SELECT MAX(version)`` against ``schema_version`` and refuse to start if it
+does not match ``SCHEMA_VERSION`` (see ``check_schema_version``).
+
+To change the schema, append a ``Migration`` to ``MIGRATIONS`` with the next
+version number. Migrations must be idempotent against a database created from
+the current models (use ``checkfirst`` / ``_add_column_if_missing``), because a
+fresh database runs every migration in order.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from sqlalchemy import LargeBinary, inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from backend.database import db
+
+Migration = namedtuple('Migration', ['version', 'description', 'apply'])
+
+schema_version_table = db.Table(
+    'schema_version',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(200), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False),
+)
+
+
+class SchemaVersionError(RuntimeError):
+    """The database schema does not match the version this code expects."""
+
+
+def _create_tables(conn, *models):
+    for model in models:
+        model.__table__.create(conn, checkfirst=True)
+
+
+def _add_column_if_missing(conn, table, column_ddl):
+    name = column_ddl.split()[0]
+    existing = {c['name'] for c in inspect(conn).get_columns(table)}
+    if name not in existing:
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column_ddl}'))
+
+
+def _baseline(conn):
+    from backend.models.character import Character
+    from backend.models.user import User
+    _create_tables(conn, User, Character)
+
+
+def _character_change_feed(conn):
+    from backend.models.character_change import CharacterChange
+    _create_tables(conn, CharacterChange)
+
+
+def _versioned_progression(conn):
+    from backend.models.progression import ProgressionDelta
+    _add_column_if_missing(conn, 'user', "progression_version INTEGER NOT NULL DEFAULT 0")
+    _create_tables(conn, ProgressionDelta)
+
+
+def _compress_progression(conn):
+    from backend.compression import compress_json, decompress_json, is_compressed
+    if conn.dialect.name == 'postgresql':
+        column = next(c for c in inspect(conn).get_columns('user')
+                      if c['name'] == 'progression_data')
+        if not isinstance(column['type'], LargeBinary):
+            conn.execute(text(
+                'ALTER TABLE "user" ALTER COLUMN progression_data TYPE BYTEA '
+                "USING convert_to(progression_data::text, 'UTF8')"
+            ))
+    rows = conn.execute(text(
+        'SELECT id, progression_data FROM "user" WHERE progression_data IS NOT NULL'
+    ))
+    for user_id, data in rows.all():
+        if not is_compressed(data):
+            conn.execute(
+                text('UPDATE "user" SET progression_data = :data WHERE id = :id'),
+                {'data': compress_json(decompress_json(data)), 'id': user_id},
+            )
+
+
+def _image_assets(conn):
+    from backend.models.image_asset import ImageAsset
+    _create_tables(conn, ImageAsset)
+
+
+def _image_variants(conn):
+    _add_column_if_missing(conn, 'image_asset', 'placeholder TEXT')
+    _add_column_if_missing(conn, 'image_asset', 'widths JSON')
+
+
+def _rate_limit_buckets(conn):
+    from backend.middleware.rate_limit import bucket_table
+    bucket_table.create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    Migration(1, 'baseline: user and character tables', _baseline),
+    Migration(2, 'character_change outbox for GET /changes', _character_change_feed),
+    Migration(3, 'versioned progression and progression_delta log', _versioned_progression),
+    Migration(4, 'store user.progression_data as compressed JSON', _compress_progression),
+    Migration(5, 'image_asset metadata for the generated image cache', _image_assets),
+    Migration(6, 'image_asset placeholder and responsive widths', _image_variants),
+    Migration(7, 'rate_limit_bucket for RATE_LIMIT_STORAGE_URL', _rate_limit_buckets),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(conn):
+    """Highest applied migration, or 0 for an unversioned database."""
+    if not inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+
+def upgrade(engine, target=SCHEMA_VERSION):
+    """Apply pending migrations up to ``target``; returns the versions applied."""
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Serialise concurrent release steps.
+            conn.execute(text('SELECT pg_advisory_xact_lock(727001)'))
+        schema_version_table.create(conn, checkfirst=True)
+        version = current_version(conn)
+        applied = []
+        for migration in MIGRATIONS:
+            if version < migration.version <= target:
+                migration.apply(conn)
+                conn.execute(schema_version_table.insert().values(
+                    version=migration.version,
+                    description=migration.description,
+                    applied_at=datetime.now(timezone.utc),
+                ))
+                applied.append(migration.version)
+    return applied
+
+
+def check_schema_version(engine):
+    """Single cheap round trip at worker boot; raises on mismatch."""
+    try:
+        with engine.connect() as conn:
+            version = conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        # Only a database that was never versioned counts as version 0; anything
+        # else (a damaged schema_version, a connection failure) must surface.
+        with engine.connect() as conn:
+            if inspect(conn).has_table('schema_version'):
+                raise
+        version = 0
+    if version != SCHEMA_VERSION:
+        raise SchemaVersionError(
+            f"Database schema is at version {version}, code expects {SCHEMA_VERSION}. "
+            "Run `python -m backend.migrations upgrade` before starting workers."
+        )
+    return version
@@ -0,0 +1,42 @@
+"""Release-step entry point: ``python -m backend.migrations [upgrade|current|check]``."""
+
+import os
+import sys
+
+from flask import Flask
+
+from backend.config import config_by_name
+from backend.database import db
+from backend.migrations import SCHEMA_VERSION, check_schema_version, current_version, upgrade
+
+
+def _migration_app(config_name):
+    # Same import name as create_app so relative sqlite paths resolve to the
+    # same instance folder, without booting the rest of the application.
+    app = Flask('backend.app')
+    app.config.from_object(config_by_name.get(config_name, config_by_name['default']))
+    db.init_app(app)
+    return app
+
+
+def main(argv):
+    command = argv[0] if argv else 'upgrade'
+    app = _migration_app(os.environ.get('FLASK_ENV', 'production'))
+    with app.app_context():
+        if command == 'upgrade':
+            applied = upgrade(db.engine)
+            print(f"Applied migrations: {applied or 'none'} (schema version {SCHEMA_VERSION})")
+        elif command == 'current':
+            with db.engine.connect() as conn:
+                print(f"Database at version {current_version(conn)}, code expects {SCHEMA_VERSION}")
+        elif command == 'check':
+            check_schema_version(db.engine)
+            print(f"Schema version {SCHEMA_VERSION} OK")
+        else:
+            print(f"Unknown command: {command}", file=sys.stderr)
+            return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,2 +1,5 @@
 from .character import Character
-__all__ = ['Character']
\ No newline at end of file
+from .character_change import CharacterChange
+from .image_asset import ImageAsset
+from .progression import ProgressionDelta
+__all__ = ['Character', 'CharacterChange', 'ImageAsset', 'ProgressionDelta']
@@ -0,0 +1,42 @@
+from sqlalchemy import event, text
+
+from backend.database import RoutingSession, db
+from backend.models.character import Character
+
+# pg_advisory_xact_lock key serialising outbox writers ('chrc')
+OUTBOX_LOCK_KEY = 0x63687263
+
+
+class CharacterChange(db.Model):
+    """Outbox row recorded in the same transaction as each character write.
+
+    ``id`` is the sync cursor handed to clients by ``GET /changes``, so ids
+    must become visible in order: a client that has seen id 11 never asks
+    for 10 again. Postgres assigns ids at insert but makes them visible at
+    commit, so on Postgres transactions writing the outbox take a
+    transaction-level advisory lock first and commit one at a time, in id
+    order (replicas replay commits in that order too). SQLite has a single
+    writer and needs no lock.
+    """
+    __tablename__ = 'character_change'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'),
+                   primary_key=True, autoincrement=True)
+    character_id = db.Column(db.String(36), nullable=False, index=True)
+    op = db.Column(db.String(10), nullable=False)  # 'upsert' or 'delete'
+    changed_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _record_character_changes(session, flush_context, instances):
+    changes = [(obj.id, 'upsert') for obj in session.new if isinstance(obj, Character)]
+    changes += [
+        (obj.id, 'upsert') for obj in session.dirty
+        if isinstance(obj, Character) and session.is_modified(obj)
+    ]
+    changes += [(obj.id, 'delete') for obj in session.deleted if isinstance(obj, Character)]
+    if changes and session.get_bind(mapper=CharacterChange).dialect.name == 'postgresql':
+        # Held until commit, so ids are committed in the order they are assigned
+        session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': OUTBOX_LOCK_KEY})
+    for character_id, op in changes:
+        session.add(CharacterChange(character_id=character_id, op=op))
@@ -0,0 +1,28 @@
+from backend.database import db
+
+
+class ImageAsset(db.Model):
+    """A generated image stored in the image cache under ``key``.
+
+    The bytes live on disk (see ``backend.services.image_cache``); this row
+    records what produced them. A row may outlive its file after LRU eviction,
+    in which case the next request regenerates the image and refreshes it.
+    """
+    __tablename__ = 'image_asset'
+
+    key = db.Column(db.String(64), primary_key=True)
+    provider = db.Column(db.String(30), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'illustration' or 'coloring_page'
+    variant = db.Column(db.Integer, nullable=False, default=0)
+    size = db.Column(db.String(20), nullable=False)
+    prompt = db.Column(db.Text, nullable=False)
+    format = db.Column(db.String(10), nullable=False)
+    byte_size = db.Column(db.Integer, nullable=False)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    source_url = db.Column(db.Text)
+    # Filled in by post-processing: inline LQIP data URI and the responsive widths stored
+    placeholder = db.Column(db.Text)
+    widths = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
@@ -0,0 +1,18 @@
+from backend.database import db
+
+
+class ProgressionDelta(db.Model):
+    """Merge-patch taking a user's progression from ``version - 1`` to ``version``.
+
+    Only the most recent deltas are kept; older ``since_version`` requests get
+    the full document instead.
+    """
+    __tablename__ = 'progression_delta'
+    __table_args__ = (db.UniqueConstraint('user_id', 'version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id', ondelete='CASCADE'),
+                        nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    patch = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.now())
@@ -1,5 +1,6 @@
+from backend.compression import CompressedJSON
 from backend.database import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from backend.password_hashing import hash_password, needs_rehash, verify_password
 import uuid
 from datetime import datetime
 
@@ -12,13 +13,17 @@ class User(db.Model):
 
     # Relationships
     characters = db.relationship('Character', backref='user', lazy=True)
-    progression_data = db.Column(db.JSON, default=dict)
+    progression_data = db.Column(CompressedJSON, default=dict)
+    progression_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     def to_dict(self):
         return {
@@ -2,20 +2,99 @@
 OpenRouter Image Generation Service
 Uses Stable Diffusion via OpenRouter (CHEAP: ~$0.002-0.005 per image!)
 Compatible with your existing OpenRouter API key
+
+Images are requested concurrently over one pooled requests.Session per
+process and paced by a token bucket matching the provider's rate limit
+(OPENROUTER_IMAGE_RATE per second, bursts of OPENROUTER_IMAGE_BURST), so four
+images take about one upstream round trip instead of four plus fixed sleeps.
+
+A generation is only retried when the provider says it did not run it: a 429
+or 503 carrying Retry-After, or a connection that timed out before the
+request was sent. A 502/504 may come from a gateway after the image was made
+(and billed), so it is not retried. Every attempt, and the wait before it,
+fits in what is left of the caller's deadline.
 """
 
+import logging
 import os
-import requests
-import base64
-import uuid
-from datetime import datetime
+import threading
 import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.middleware.rate_limit import TokenBucket
+from backend.services.image_cache import current_image_cache, derive_coloring_page, image_key
+
+logger = logging.getLogger(__name__)
+
+MODEL = "stabilityai/stable-diffusion-xl-base-1.0"  # Cheap & good
+SIZE = "1024x1024"
+# Concurrent requests per process; also the size of the shared connection pool
+MAX_CONCURRENCY = int(os.getenv("OPENROUTER_IMAGE_CONCURRENCY", 4))
+# Provider rate limit: sustained requests per second and burst size
+REQUESTS_PER_SECOND = float(os.getenv("OPENROUTER_IMAGE_RATE", 1))
+BURST = float(os.getenv("OPENROUTER_IMAGE_BURST", 4))
+# Answers meaning the request was turned away unprocessed, when they carry Retry-After
+RETRY_STATUSES = (429, 503)
+MAX_RETRIES = 3
+
+_session = None
+_session_lock = threading.Lock()
+_bucket = TokenBucket(BURST, REQUESTS_PER_SECOND)
+
+
+def _reset_session():
+    # Pooled sockets must not be shared with a forked child
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_session)
+
+
+def shared_session() -> requests.Session:
+    """The process-wide session with kept-alive connections (retries are up to the caller)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENCY)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
 
 class OpenRouterImageGenerator:
-    def __init__(self, api_key=None):
-        """Initialize with OpenRouter API key"""
+    provider = "openrouter"
+
+    def __init__(self, api_key=None, session=None, bucket=None, max_concurrency=MAX_CONCURRENCY,
+                 timeout=60, cache=None):
+        """
+        Initialize with OpenRouter API key
+
+        Args:
+            session: HTTP session; defaults to the pooled process-wide one
+            bucket: TokenBucket pacing requests; defaults to one per process
+                sized by OPENROUTER_IMAGE_RATE / OPENROUTER_IMAGE_BURST
+            max_concurrency: Images requested at the same time
+            timeout: Seconds each image may take, including waiting for its turn
+            cache: ImageCache checked before calling upstream; defaults to the app's
+        """
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
         self.base_url = "https://openrouter.ai/api/v1"
+        self.session = session if session is not None else shared_session()
+        self.bucket = bucket if bucket is not None else _bucket
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache = cache
 
     def generate_story_illustration(
         self,
@@ -31,10 +110,12 @@ class OpenRouterImageGenerator:
             scene_description: Description of the scene to illustrate
             character_name: Name of the main character
             style: Art style
-            num_images: Number of images (note: generates 1 at a time)
+            num_images: Number of images (requested concurrently, one per call)
 
         Returns:
-            List of dicts with image URLs or base64 data
+            List of dicts with each image's id and URL (served by GET /images/<id>
+            once stored in the image cache); images that failed or timed out
+            are left out
         """
         prompt = f"""
 {style}, high quality digital art:
@@ -46,54 +127,16 @@ Main character: {character_name}
 Style: colorful, vibrant, child-friendly, professional illustration, ages 4-8, engaging, imaginative, no text, clean composition
 """.strip()
 
-        images = []
-        for i in range(num_images):
-            try:
-                # Use Stable Diffusion XL via OpenRouter
-                response = requests.post(
-                    f"{self.base_url}/images/generations",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "HTTP-Referer": "http://localhost:5000",  # Your app URL
-                        "X-Title": "Story Creator App",
-                    },
-                    json={
-                        "model": "stabilityai/stable-diffusion-xl-base-1.0",  # Cheap & good
-                        "prompt": prompt,
-                        "n": 1,
-                        "size": "1024x1024",
-                    },
-                    timeout=60,
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    image_url = data['data'][0]['url']
-
-                    images.append({
-                        'id': f"{uuid.uuid4()}_{i}",
-                        'prompt': prompt,
-                        'image_url': image_url,
-                        'format': 'png',
-                        'generated_at': datetime.now().isoformat(),
-                    })
-                else:
-                    print(f"OpenRouter API error: {response.status_code} - {response.text}")
-
-                # Rate limiting
-                if i < num_images - 1:
-                    time.sleep(1)
-
-            except Exception as e:
-                print(f"Error generating image {i+1}: {e}")
-
-        return images
+        return self._generate(prompt, num_images, "illustration")
 
     def generate_coloring_page(
         self,
         scene_description: str,
         character_name: str = "the hero",
-        num_images: int = 1
+        num_images: int = 1,
+        illustration_id: str = None,
+        use_model: bool = False,
+        age: int = 7
     ) -> list:
         """
         Generate black and white line art for coloring
@@ -102,10 +145,19 @@ Style: colorful, vibrant, child-friendly, professional illustration, ages 4-8, e
             scene_description: Description of the scene
             character_name: Name of the main character
             num_images: Number of images
+            illustration_id: Id of a cached illustration of the scene; the page is then
+                derived from it locally (one page, no model call)
+            use_model: Ask the model even when an illustration is given (higher quality tier)
+            age: Age the derived page's detail and line thickness are tuned for
 
         Returns:
             List of dicts with image URLs
         """
+        if illustration_id and not use_model:
+            page = derive_coloring_page(self.cache, illustration_id, age)
+            if page is not None:
+                return [page]
+
         prompt = f"""
 black and white line art coloring book page, children's coloring book style:
 
@@ -116,46 +168,150 @@ Main character: {character_name}
 Style: simple black outlines only, no colors, no shading, no gray, thick bold lines, large areas to color, high contrast, white background, suitable for printing, similar to Disney coloring books, ages 4-8, no text
 """.strip()
 
-        images = []
-        for i in range(num_images):
+        return self._generate(prompt, num_images, "coloring_page")
+
+    def _generate(self, prompt: str, num_images: int, kind: str) -> list:
+        """Serve cached variants, request the rest concurrently; returns what is ready in time"""
+        cache = self.cache if self.cache is not None else current_image_cache()
+        keys = [image_key(self.provider, MODEL, prompt, SIZE, i) for i in range(num_images)]
+        results = {}
+        if cache is not None:
+            for i, key in enumerate(keys):
+                if cache.contains(key):
+                    results[i] = cache.describe(key, cached=True)
+
+        missing = [i for i in range(num_images) if i not in results]
+        requested = self._request_all(prompt, missing, kind, download=cache is not None)
+        for i, (image, data) in requested.items():
+            if data is None:
+                results[i] = image  # only the provider's (expiring) URL
+                continue
+            # Stored from this thread, which has the app context for the metadata row
+            cache.put(keys[i], data, provider=self.provider, model=MODEL, kind=kind, variant=i,
+                      size=SIZE, prompt=prompt, source_url=image['image_url'])
+            results[i] = cache.describe(keys[i])
+        return [results[i] for i in sorted(results)]
+
+    def _request_all(self, prompt: str, variants: list, kind: str, download: bool) -> dict:
+        """{variant: (image, bytes or None)} for the variants generated within the timeout"""
+        if not variants:
+            return {}
+        label = kind.replace("_", " ")
+        deadline = time.monotonic() + self.timeout
+        pool = ThreadPoolExecutor(max_workers=min(len(variants), self.max_concurrency),
+                                  thread_name_prefix="openrouter-image")
+        futures = {
+            pool.submit(self._request_image, prompt, i, deadline, download): i for i in variants
+        }
+        results = {}
+        try:
+            pending = set(futures)
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning("Error generating %s %d: %s", label, i + 1, e)
+                        continue
+                    if result is not None:
+                        results[i] = result
+            if pending:
+                logger.warning("%d of %d %ss timed out after %ss",
+                               len(pending), len(variants), label, self.timeout)
+        finally:
+            # Queued images are dropped; in-flight requests end on their own HTTP timeout
+            pool.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def _request_image(self, prompt: str, i: int, deadline: float, download: bool):
+        for attempt in range(MAX_RETRIES + 1):
+            if not self.bucket.acquire(timeout=deadline - time.monotonic()):
+                raise TimeoutError("rate limit leaves no time before the deadline")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("deadline passed while waiting for the rate limit")
             try:
-                response = requests.post(
-                    f"{self.base_url}/images/generations",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "HTTP-Referer": "http://localhost:5000",
-                        "X-Title": "Story Creator App",
-                    },
-                    json={
-                        "model": "stabilityai/stable-diffusion-xl-base-1.0",
-                        "prompt": prompt,
-                        "n": 1,
-                        "size": "1024x1024",
-                    },
-                    timeout=60,
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    image_url = data['data'][0]['url']
-
-                    images.append({
-                        'id': f"{uuid.uuid4()}_{i}",
-                        'prompt': prompt,
-                        'image_url': image_url,
-                        'format': 'png',
-                        'generated_at': datetime.now().isoformat(),
-                    })
-                else:
-                    print(f"OpenRouter API error: {response.status_code} - {response.text}")
-
-                if i < num_images - 1:
-                    time.sleep(1)
-
-            except Exception as e:
-                print(f"Error generating coloring page {i+1}: {e}")
-
-        return images
+                response = self._post(prompt, timeout=(min(10, remaining), remaining))
+            except requests.ConnectTimeout:
+                # Never connected, so nothing was generated
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = 0.5 * 2 ** attempt
+            else:
+                delay = _retry_after(response) if response.status_code in RETRY_STATUSES else None
+                if delay is None or attempt == MAX_RETRIES:
+                    break
+            if time.monotonic() + delay >= deadline:
+                raise TimeoutError("retrying would pass the deadline")
+            logger.info("OpenRouter image %d turned away, retrying in %.1fs", i + 1, delay)
+            time.sleep(delay)
+
+        if response.status_code != 200:
+            logger.warning("OpenRouter API error: %s - %s",
+                           response.status_code, response.text[:500])
+            return None
+
+        image_url = response.json()['data'][0]['url']
+        image = {
+            'id': f"{uuid.uuid4()}_{i}",
+            'image_url': image_url,
+            'format': 'png',
+            'generated_at': datetime.now().isoformat(),
+            'cached': False,
+        }
+        return image, self._download(image_url, deadline) if download else None
+
+    def _post(self, prompt: str, timeout):
+        return self.session.post(
+            f"{self.base_url}/images/generations",
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "HTTP-Referer": "http://localhost:5000",  # Your app URL
+                "X-Title": "Story Creator App",
+            },
+            json={
+                "model": MODEL,
+                "prompt": prompt,
+                "n": 1,
+                "size": SIZE,
+            },
+            timeout=timeout,
+        )
+
+    def _download(self, image_url: str, deadline: float):
+        """The generated file's bytes for the cache; None if it cannot be fetched in time"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        try:
+            response = self.session.get(image_url, timeout=(min(10, remaining), remaining))
+        except requests.RequestException as e:
+            logger.warning("Could not download generated image for caching: %s", e)
+            return None
+        return response.content if response.status_code == 200 and response.content else None
+
+
+def _retry_after(response):
+    """Seconds the Retry-After header asks to wait (delta or HTTP date); None without one"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
 
 
 # Example usage & testing
@@ -177,7 +333,6 @@ if __name__ == "__main__":
     if illustrations:
         print(f"✓ Generated {len(illustrations)} illustration(s)")
         print(f"  Image URL: {illustrations[0]['image_url']}")
-        print(f"  Prompt: {illustrations[0]['prompt'][:100]}...")
     else:
         print("✗ Failed to generate illustration")
 
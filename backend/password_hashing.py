@@ -0,0 +1,69 @@
+"""
+Password hashing off the request thread.
+
+PBKDF2/scrypt are deliberately CPU-bound, so a burst of logins can starve
+story requests running in the same worker. Hashing and verification run in a
+small process pool (``PASSWORD_HASH_WORKERS``; 0 hashes inline) using the
+configured werkzeug method, e.g. ``pbkdf2:sha256:600000`` or
+``scrypt:32768:8:1``. Stored hashes made with other parameters are reported by
+``needs_rehash`` so the login path can upgrade them transparently.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'pbkdf2:sha256:600000'
+
+_method = DEFAULT_METHOD
+_workers = 0
+_timeout = 10.0
+_executor = None
+_lock = threading.Lock()
+
+
+def configure(method=None, workers=None, timeout=None):
+    global _method, _workers, _timeout, _executor
+    with _lock:
+        if method:
+            _method = method
+        if timeout is not None:
+            _timeout = timeout
+        if workers is not None and workers != _workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+                _executor = None
+            _workers = workers
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Never fork a (possibly threaded) web worker; start from a clean process.
+            methods = multiprocessing.get_all_start_methods()
+            start_method = 'forkserver' if 'forkserver' in methods else 'spawn'
+            context = multiprocessing.get_context(start_method)
+            _executor = ProcessPoolExecutor(max_workers=_workers, mp_context=context)
+        return _executor
+
+
+def _run(fn, *args):
+    if not _workers:
+        return fn(*args)
+    return _pool().submit(fn, *args).result(timeout=_timeout)
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, _method)
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True when ``password_hash`` was not produced with the configured method."""
+    return password_hash.split('$', 1)[0] != _method
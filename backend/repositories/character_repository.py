@@ -1,4 +1,10 @@
-from backend.models import Character
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import select, type_coerce
+
+from backend.models import Character, CharacterChange
 from backend.database import db
 
 def get_all_characters():
@@ -24,4 +30,120 @@ def update_character(character, character_data):
 
 def delete_character(character):
     db.session.delete(character)
-    db.session.commit()
\ No newline at end of file
+    db.session.commit()
+
+
+# ----------------------
+# Lightweight read path
+# ----------------------
+# List endpoints do not need ORM instances: these helpers run Core selects
+# through the session (so replica routing still applies) but skip the identity
+# map, and JSON columns stay raw until something reads them.
+
+_SCALAR_COLUMNS = (
+    'id', 'name', 'age', 'gender', 'role', 'magic_type', 'challenge', 'comfort_item', 'created_at',
+)
+_JSON_COLUMNS = ('personality_traits', 'siblings', 'friends', 'likes', 'dislikes', 'fears')
+
+
+def _lazy_json_property(column):
+    slot = f"_{column}"
+
+    def getter(self):
+        value = getattr(self, slot)
+        if isinstance(value, (str, bytes)):
+            value = json.loads(value) if value else None
+            setattr(self, slot, value)
+        return value or []
+
+    return property(getter)
+
+
+class CharacterRecord:
+    """Read-only character row; JSON columns are decoded on first access."""
+
+    __slots__ = _SCALAR_COLUMNS + tuple(f"_{c}" for c in _JSON_COLUMNS)
+
+    def __init__(self, row):
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+
+    def to_dict(self):
+        """Same shape as ``Character.to_dict``."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "age": self.age,
+            "gender": self.gender,
+            "role": self.role,
+            "magic_type": self.magic_type,
+            "challenge": self.challenge,
+            "personality_traits": self.personality_traits,
+            "siblings": self.siblings,
+            "friends": self.friends,
+            "likes": self.likes,
+            "dislikes": self.dislikes,
+            "fears": self.fears,
+            "comfort_item": self.comfort_item,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+for _column in _JSON_COLUMNS:
+    setattr(CharacterRecord, _column, _lazy_json_property(_column))
+
+
+@dataclass(frozen=True, slots=True)
+class CharacterSummary:
+    """Just enough to render a character list or picker."""
+    id: str
+    name: str
+    age: int
+    gender: str | None
+    created_at: datetime | None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "age": self.age,
+            "gender": self.gender,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+def _record_select():
+    columns = [getattr(Character, c) for c in _SCALAR_COLUMNS]
+    # type_coerce keeps the raw JSON text instead of decoding every column up front.
+    columns += [type_coerce(getattr(Character, c), db.Text).label(c) for c in _JSON_COLUMNS]
+    return select(*columns)
+
+
+def list_character_records():
+    stmt = _record_select().order_by(Character.created_at.desc())
+    return [CharacterRecord(row) for row in db.session.execute(stmt)]
+
+
+def get_character_records_by_ids(character_ids):
+    if not character_ids:
+        return []
+    stmt = _record_select().where(Character.id.in_(character_ids))
+    return [CharacterRecord(row) for row in db.session.execute(stmt)]
+
+
+def list_character_summaries():
+    stmt = select(
+        Character.id, Character.name, Character.age, Character.gender, Character.created_at,
+    ).order_by(Character.created_at.desc())
+    return [CharacterSummary(*row) for row in db.session.execute(stmt)]
+
+
+def list_changes_since(cursor, limit):
+    """Up to ``limit`` outbox rows after ``cursor`` as ``(cursor, character_id, op)``."""
+    stmt = (
+        select(CharacterChange.id, CharacterChange.character_id, CharacterChange.op)
+        .where(CharacterChange.id > cursor)
+        .order_by(CharacterChange.id)
+        .limit(limit)
+    )
+    return db.session.execute(stmt).all()
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from backend.models.user import User
 from backend.database import db
+from backend.middleware.rate_limit import check_rate_limit, too_many_requests
 import jwt
 from functools import wraps
 import os
@@ -8,6 +9,7 @@ from datetime import datetime, timedelta
 
 auth_bp = Blueprint('auth', __name__)
 
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -27,8 +29,8 @@ def token_required(f):
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
-    hashed_password = User.generate_password_hash(data['password'])
-    new_user = User(username=data['username'], email=data['email'], password_hash=hashed_password)
+    new_user = User(username=data['username'], email=data['email'])
+    new_user.set_password(data['password'])
     db.session.add(new_user)
     db.session.commit()
     return jsonify({'message': 'New user created!'})
@@ -38,10 +40,18 @@ def login():
     auth = request.authorization
     if not auth or not auth.username or not auth.password:
         return jsonify({'message': 'Could not verify'}), 401
+    # Per-account limit, checked before any hashing so a burst against one
+    # account cannot monopolise the hashing pool.
+    retry_after = check_rate_limit('login', key=f"account:{auth.username}")
+    if retry_after:
+        return too_many_requests(retry_after, 'Too many login attempts')
     user = User.query.filter_by(username=auth.username).first()
     if not user:
         return jsonify({'message': 'Could not verify'}), 401
     if user.check_password(auth.password):
+        if user.password_needs_rehash():
+            user.set_password(auth.password)
+            db.session.commit()
         token = jwt.encode({'id': user.id, 'exp': datetime.utcnow() + timedelta(minutes=30)}, os.environ.get('SECRET_KEY'))
         return jsonify({'token': token})
     return jsonify({'message': 'Could not verify'}), 401
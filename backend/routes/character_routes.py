@@ -1,12 +1,17 @@
 from flask import Blueprint, request, jsonify
 from backend.models.character import Character
 from backend.database import db
+from backend.middleware.read_replica import replica_reads
+from backend.repositories import character_repository
 import uuid
 from datetime import datetime
 from backend.services.emotion_service import _as_list # Import _as_list from emotion_service
 
 character_bp = Blueprint('character', __name__)
 
+CHANGES_PAGE_SIZE = 200
+CHANGES_MAX_PAGE_SIZE = 1000
+
 
 
 @character_bp.route("/create-character", methods=["POST"])
@@ -90,14 +95,65 @@ def delete_character(char_id: str):
     return jsonify({"status": "deleted", "id": char_id}), 200
 
 @character_bp.route("/get-characters", methods=["GET"])
+@replica_reads
 def get_characters():
-    """Return a simple LIST to match the Flutter code that expects a list."""
-    chars = Character.query.order_by(Character.created_at.desc()).all()
+    """Return a simple LIST to match the Flutter code that expects a list.
+
+    ``?view=summary`` returns only id/name/age/gender/created_at per character.
+    """
+    if request.args.get("view") == "summary":
+        chars = character_repository.list_character_summaries()
+    else:
+        chars = character_repository.list_character_records()
     return jsonify([c.to_dict() for c in chars]), 200
 
 @character_bp.route("/characters/<string:char_id>", methods=["GET"])
+@replica_reads
 def get_character(char_id: str):
     char = db.session.get(Character, char_id)
     if not char:
         return jsonify({"error": "Character not found"}), 404
     return jsonify(char.to_dict()), 200
+
+@character_bp.route("/changes", methods=["GET"])
+@replica_reads
+def get_changes():
+    """Incremental sync: upserts and tombstones after ``?since=<cursor>``.
+
+    Each page collapses repeated changes to the same character into its latest
+    state. Clients store ``next_cursor`` and keep paging while ``has_more``.
+    """
+    try:
+        since = int(request.args.get("since", 0))
+        limit = int(request.args.get("limit", CHANGES_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "'since' and 'limit' must be integers"}), 400
+    limit = max(1, min(limit, CHANGES_MAX_PAGE_SIZE))
+
+    rows = character_repository.list_changes_since(since, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for cursor, character_id, op in rows:
+        latest[character_id] = (cursor, op)
+
+    upsert_ids = [cid for cid, (_, op) in latest.items() if op == "upsert"]
+    records = {r.id: r for r in character_repository.get_character_records_by_ids(upsert_ids)}
+
+    changes = []
+    for character_id, (cursor, op) in sorted(latest.items(), key=lambda item: item[1][0]):
+        record = records.get(character_id)
+        if op == "upsert" and record is not None:
+            changes.append({
+                "cursor": cursor, "op": "upsert", "id": character_id, "character": record.to_dict(),
+            })
+        else:
+            # Deleted, or upserted and then deleted after this page was cut.
+            changes.append({"cursor": cursor, "op": "delete", "id": character_id})
+
+    return jsonify({
+        "changes": changes,
+        "next_cursor": rows[-1][0] if rows else since,
+        "has_more": has_more,
+    }), 200
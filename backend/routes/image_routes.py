@@ -0,0 +1,80 @@
+from flask import Blueprint, request, jsonify, send_file
+from PIL import Image
+from backend.disk_cache import is_valid_key
+from backend.services.image_cache import ENCODINGS, MIMETYPES, current_image_cache
+
+image_bp = Blueprint('images', __name__)
+
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+
+def _negotiate(source_format):
+    """Best re-encoding the client explicitly accepts, else the stored format."""
+    accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+    for fmt in ENCODINGS:
+        if fmt == source_format:
+            break
+        if MIMETYPES[fmt] in accepted:
+            return fmt
+    return source_format
+
+
+def _pick_width(requested, widths, original):
+    """Smallest configured width covering the requested one; None means the original size."""
+    if not requested:
+        return None
+    for width in widths:
+        if width >= requested:
+            return width if width < original else None
+    return None
+
+
+@image_bp.route('/<image_id>', methods=['GET'])
+def get_image(image_id):
+    """
+    Serve a generated image by id; immutable, so clients and CDNs may keep it forever.
+
+    Clients sending ``Accept: image/avif`` or ``image/webp`` get that encoding,
+    and ``?w=<pixels>`` picks the smallest responsive width at least that wide
+    (both made ahead of time, or once on demand); range requests and
+    If-None-Match are honoured.
+    """
+    cache = current_image_cache()
+    path = None
+    if cache is not None and is_valid_key(image_id):
+        path = cache.path_for(image_id, record=False)
+    if path is None:
+        return jsonify({'error': 'Image not found'}), 404
+
+    with Image.open(path) as image:  # reads the header only
+        source_format, original_width = (image.format or 'png').lower(), image.width
+    fmt = _negotiate(source_format)
+    width = _pick_width(request.args.get('w', type=int), cache.widths, original_width)
+    if fmt != source_format or width:
+        variant = cache.variant_path(image_id, fmt, width)
+        if variant is not None:
+            path = variant
+        else:
+            fmt, width = source_format, None
+
+    etag = f'{image_id}.{fmt}' + (f'.{width}' if width else '')
+    response = send_file(path, mimetype=MIMETYPES.get(fmt, 'application/octet-stream'),
+                         conditional=True, etag=etag, max_age=IMAGE_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={IMAGE_MAX_AGE}, immutable'
+    response.vary.add('Accept')
+    return response
+
+
+@image_bp.route('/<image_id>/info', methods=['GET'])
+def get_image_info(image_id):
+    """
+    Reference to a generated image (``describe``), without the bytes.
+
+    Poll this while a reference says ``processing``: responsive ``widths`` and
+    the inline ``placeholder`` appear once post-processing has stored them.
+    """
+    cache = current_image_cache()
+    if (cache is None or not is_valid_key(image_id)
+            or cache.path_for(image_id, record=False) is None):
+        return jsonify({'error': 'Image not found'}), 404
+    return jsonify(cache.describe(image_id)), 200
@@ -1,24 +1,90 @@
 from flask import Blueprint, request, jsonify
 from backend.middleware.auth import require_auth
-from backend.database import db
+from backend.middleware.read_replica import replica_reads
+from backend.services.json_patch import PatchError
+from backend.services.progression_service import (
+    JSON_PATCH, PreconditionFailed, ProgressionConflict, ProgressionService,
+)
 
 progression_bp = Blueprint('progression', __name__)
 
+
+def _etag(version):
+    return f'"{version}"'
+
+
+def _parse_version_header(value):
+    """Version from an If-Match / If-None-Match value such as ``"3"`` or ``W/"3"``."""
+    if not value or value.strip() == '*':
+        return None
+    value = value.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        return -1  # matches no stored version
+
+
 @progression_bp.route('/sync-progression', methods=['POST'])
 @require_auth
 def sync_progression():
-    """Sync user progression data"""
-    data = request.get_json()
+    """Sync user progression data.
 
-    user = request.current_user
-    user.progression_data = data
-    db.session.commit()
+    Accepts the full document (``application/json``), an RFC 7396 merge-patch
+    (``application/merge-patch+json``) or an RFC 6902 JSON Patch
+    (``application/json-patch+json``). Send ``If-Match: "<version>"`` to reject
+    the write with 412 if another device synced first.
+    """
+    if not request.get_data():
+        return jsonify({'error': 'Body is required'}), 400
+    data = request.get_json(force=True, silent=True)
+    if request.mimetype == JSON_PATCH:
+        if not isinstance(data, list):
+            return jsonify({'error': 'Body must be a JSON Patch array'}), 400
+    elif not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object'}), 400
 
-    return jsonify({'message': 'Synced'}), 200
+    try:
+        _, version = ProgressionService.apply_update(
+            request.current_user.id,
+            data,
+            content_type=request.mimetype,
+            if_match=_parse_version_header(request.headers.get('If-Match')),
+        )
+    except PreconditionFailed as e:
+        return jsonify({'error': 'Progression has changed', 'version': e.current_version}), 412, {
+            'ETag': _etag(e.current_version),
+        }
+    except ProgressionConflict as e:
+        body = {'error': 'Progression kept changing, retry', 'version': e.current_version}
+        return jsonify(body), 409, {'ETag': _etag(e.current_version)}
+    except PatchError as e:
+        return jsonify({'error': str(e)}), 422
+
+    return jsonify({'message': 'Synced', 'version': version}), 200, {'ETag': _etag(version)}
 
 @progression_bp.route('/get-progression', methods=['GET'])
+@replica_reads
 @require_auth
 def get_progression():
-    """Get user progression data"""
-    user = request.current_user
-    return jsonify(user.progression_data or {}), 200
+    """Get user progression data.
+
+    ``?since_version=<n>`` returns only the merge-patches after version ``n``
+    (``{"version", "deltas": [...]}``), or ``{"version", "full": true, "data"}``
+    when those deltas are no longer kept.
+    """
+    data, version = ProgressionService.get_state(request.current_user.id)
+    headers = {'ETag': _etag(version)}
+
+    if _parse_version_header(request.headers.get('If-None-Match')) == version:
+        return '', 304, headers
+
+    since = request.args.get('since_version', type=int)
+    if since is None:
+        return jsonify(data), 200, headers
+
+    deltas = ProgressionService.deltas_since(request.current_user.id, since, version)
+    if deltas is None:
+        return jsonify({'version': version, 'full': True, 'data': data}), 200, headers
+    return jsonify({'version': version, 'deltas': deltas}), 200, headers
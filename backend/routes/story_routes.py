@@ -6,8 +6,10 @@ import re
 from backend.services.story_generation_service import StoryGenerationService
 from backend.services.prompt_service import PromptService
 from backend.services.emotion_service import EmotionService
-from backend.models.character import Character # For multi-character story
-from backend.database import db # For multi-character story
+from backend.middleware.rate_limit import rate_limited
+from backend.services.media_pipeline import get_media_pipeline, start_media
+from backend.services.narration_service import pre_narrate
+from backend.repositories import character_repository # For multi-character story
 
 story_bp = Blueprint('story', __name__)
 logger = logging.getLogger("story_engine")
@@ -26,11 +28,34 @@ def _safe_extract_title_and_gem(text: str, theme: str):
     story_body = _GEM_RE.sub("", story_body).strip()
     return title, wisdom_gem, story_body
 
+def _with_narration(result: dict, text: str, payload: dict) -> dict:
+    """Start background narration if the request opted in, adding its audio_url"""
+    try:
+        audio_url = pre_narrate(text, payload)
+    except Exception:
+        logger.exception("Could not start pre-narration")
+        audio_url = None
+    if audio_url:
+        result["audio_url"] = audio_url
+    return result
+
+def _with_media(result: dict, text: str, payload: dict) -> dict:
+    """Start illustrating and narrating the story if the request opted in, adding its media_url"""
+    try:
+        media_url = start_media(text, payload)
+    except Exception:
+        logger.exception("Could not start the media pipeline")
+        media_url = None
+    if media_url:
+        result["media_url"] = media_url
+    return result
+
 @story_bp.route("/get-story-themes", methods=["GET"])
 def get_story_themes():
     return jsonify(["Adventure", "Friendship", "Magic", "Dragons", "Castles", "Unicorns", "Space", "Ocean"])
 
 @story_bp.route("/generate-story", methods=["POST"])
+@rate_limited("text")
 def generate_story_endpoint():
     payload = request.get_json(silent=True) or {}
     character_name = payload.get("character", "a brave adventurer")
@@ -51,7 +76,9 @@ def generate_story_endpoint():
     try:
         story_text = story_generation_service.generate_story(prompt)
         title, wisdom_gem, story_body = _safe_extract_title_and_gem(story_text, theme)
-        return jsonify({"title": title, "story_text": story_body, "wisdom_gem": wisdom_gem}), 200
+        result = {"title": title, "story_text": story_body, "wisdom_gem": wisdom_gem}
+        result = _with_narration(result, story_body, payload)
+        return jsonify(_with_media(result, story_body, payload)), 200
 
     except Exception as e:
         logger.warning("Model error, using fallback: %s", e)
@@ -64,7 +91,17 @@ def generate_story_endpoint():
         title, wisdom_gem, story_body = _safe_extract_title_and_gem(raw_text, theme)
         return jsonify({"title": title, "story_text": story_body, "wisdom_gem": wisdom_gem}), 200
 
+@story_bp.route("/media/<job_id>", methods=["GET"])
+def media_status(job_id):
+    """Progress of a story's media job: each scene's illustration and coloring page, narration"""
+    pipeline = get_media_pipeline()
+    job = pipeline.job(job_id) if pipeline is not None else None
+    if job is None:
+        return jsonify({"error": "Media job not found"}), 404
+    return jsonify(job.snapshot()), 200
+
 @story_bp.route("/generate-multi-character-story", methods=["POST"])
+@rate_limited("text")
 def generate_multi_character_story():
     data = request.get_json(silent=True) or {}
     character_ids = data.get("character_ids", [])
@@ -76,7 +113,7 @@ def generate_multi_character_story():
     if not main_character_id or not character_ids:
         return jsonify({"error": "main_character_id and character_ids are required"}), 400
 
-    chars = db.session.query(Character).filter(Character.id.in_(character_ids)).all()
+    chars = character_repository.get_character_records_by_ids(character_ids)
     main_char_db = next((c for c in chars if c.id == main_character_id), None)
     if not main_char_db:
         return jsonify({"error": "Main character not found in the provided list"}), 400
@@ -107,6 +144,7 @@ def generate_multi_character_story():
         return jsonify({"story": story_text}), 200
 
 @story_bp.route("/generate-interactive-story", methods=["POST"])
+@rate_limited("text")
 def generate_interactive_story():
     """
     Generate the FIRST segment of an interactive choose-your-own-adventure story.
@@ -119,7 +157,7 @@ def generate_interactive_story():
     friends = data.get("friends", [])
     therapeutic_prompt = data.get("therapeutic_prompt", "")
 
-    logger.info(f"Starting interactive story for {character_name}, theme={theme}")
+    logger.info("Starting interactive story for %s, theme=%s", character_name, theme)
 
     # Build the prompt for the initial story segment
     prompt_parts = [
@@ -174,11 +212,11 @@ def generate_interactive_story():
             "is_ending": False
         }
 
-        logger.info(f"Generated interactive story start with {len(choices)} choices")
-        return jsonify(result), 200
+        logger.info("Generated interactive story start with %d choices", len(choices))
+        return jsonify(_with_narration(result, story_text, data)), 200
 
     except Exception as e:
-        logger.error(f"Interactive story generation error: {e}")
+        logger.error("Interactive story generation error: %s", e)
         # Fallback
         fallback_story = f"{character_name} stood at the edge of a magical forest. A glowing path led deeper into the trees, while a friendly bird chirped nearby, as if inviting them to follow. What should {character_name} do?"
         fallback_choices = [
@@ -194,6 +232,7 @@ def generate_interactive_story():
 
 
 @story_bp.route("/continue-interactive-story", methods=["POST"])
+@rate_limited("text")
 def continue_interactive_story():
     """
     Continue an interactive story based on the user's choice.
@@ -213,7 +252,8 @@ def continue_interactive_story():
     num_choices_made = len(choices_made)
     is_final_segment = num_choices_made >= 2  # End after 3 choices (2 previous + this one)
 
-    logger.info(f"Continuing interactive story (choice #{num_choices_made + 1}): {choice_made[:50]}")
+    logger.info("Continuing interactive story (choice #%d): %.50s",
+                num_choices_made + 1, choice_made)
 
     prompt_parts = [
         "You are continuing an INTERACTIVE choose-your-own-adventure story for a child.",
@@ -300,11 +340,11 @@ def continue_interactive_story():
                 "is_ending": False
             }
 
-        logger.info(f"Continued interactive story (ending={is_final_segment})")
-        return jsonify(result), 200
+        logger.info("Continued interactive story (ending=%s)", is_final_segment)
+        return jsonify(_with_narration(result, story_text, data)), 200
 
     except Exception as e:
-        logger.error(f"Continue interactive story error: {e}")
+        logger.error("Continue interactive story error: %s", e)
         # Fallback
         if is_final_segment:
             fallback = f"And so, {character_name}'s wonderful adventure came to an end. They learned that every choice they made helped them grow braver and wiser. The End!"
@@ -358,7 +398,7 @@ def _parse_interactive_response(full_text: str, character_name: str) -> tuple[st
 
     # If we didn't find exactly 3 choices, provide defaults
     if len(choices) != 3:
-        logger.warning(f"Expected 3 choices, found {len(choices)}, using defaults")
+        logger.warning("Expected 3 choices, found %d, using defaults", len(choices))
         choices = [
             {"text": "Choose the brave path"},
             {"text": "Choose the thoughtful path"},
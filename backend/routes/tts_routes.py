@@ -0,0 +1,146 @@
+import logging
+
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context, url_for
+from backend.disk_cache import is_valid_key
+from backend.middleware.rate_limit import rate_limited
+from backend.middleware.request_logging import annotate
+from backend.services.narration_service import (
+    audio_cache, get_pre_narrator, get_tts_service, narration_params,
+)
+from backend.ssml import SENTENCE, WORD
+from backend.tts_service import TTSService
+
+tts_bp = Blueprint('tts', __name__)
+logger = logging.getLogger(__name__)
+
+AUDIO_MAX_AGE = 365 * 24 * 3600
+# Long-poll ceiling for audio still being pre-narrated; each poll holds a sync worker
+MAX_AUDIO_WAIT = 25.0
+
+
+@tts_bp.route('/voices', methods=['GET'])
+def get_voices():
+    return jsonify(TTSService.get_available_voices()), 200
+
+
+@tts_bp.route('/narrate', methods=['POST'])
+@rate_limited('tts')
+def narrate():
+    """Synthesize (or find cached) narration and return where to fetch it."""
+    payload = request.get_json(silent=True) or {}
+    params, error = narration_params(payload)
+    if error:
+        return jsonify({'error': error}), 400
+    marks = payload.get('marks')
+    if marks not in (None, WORD, SENTENCE):
+        return jsonify({'error': f"marks must be '{WORD}' or '{SENTENCE}'"}), 400
+
+    service = get_tts_service()
+    if service is None:
+        return jsonify({'error': 'Narration is unavailable'}), 503
+    try:
+        key, cached = service.narrate(marks=marks, **params)
+    except ImportError as e:
+        return jsonify({'error': str(e)}), 501
+    if key is None:
+        return jsonify({'error': 'Narration is unavailable'}), 503
+    annotate(cache='hit' if cached else 'miss')
+
+    result = {
+        'key': key,
+        'audio_url': url_for('tts.get_audio', key=key),
+        'cached': cached,
+    }
+    if marks:
+        result['timepoints_url'] = url_for('tts.get_timepoints', key=key)
+    return jsonify(result), 200
+
+
+@tts_bp.route('/narrate/stream', methods=['POST'])
+@rate_limited('tts')
+def narrate_stream():
+    """Stream MP3 narration with chunked transfer, starting after the first sentence."""
+    params, error = narration_params(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({'error': error}), 400
+
+    service = get_tts_service()
+    if service is None:
+        return jsonify({'error': 'Narration is unavailable'}), 503
+    key = service.speech_key(use_ssml=True, audio_encoding=service.ENCODING, **params)
+    path = audio_cache().path_for(key)
+    annotate(cache='miss' if path is None else 'hit')
+    if path is not None:
+        return send_file(path, mimetype='audio/mpeg', conditional=True, etag=key)
+
+    audio = service.stream_speech(**params)
+    try:
+        first = next(audio, None)
+    except Exception:
+        logger.exception("Narration stream failed before the first chunk")
+        first = None
+    if first is None:
+        return jsonify({'error': 'Narration is unavailable'}), 503
+
+    def generate():
+        yield first
+        try:
+            yield from audio
+        except Exception:
+            # Headers are already sent: abort the connection so the client sees a
+            # truncated transfer instead of a complete-looking narration.
+            logger.exception("Narration stream failed after the first chunk")
+            raise
+
+    return Response(stream_with_context(generate()), mimetype='audio/mpeg', headers={
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@tts_bp.route('/audio/<key>', methods=['GET'])
+def get_audio(key):
+    """
+    Serve cached audio; immutable, so clients and CDNs may keep it forever.
+
+    Audio that is still being pre-narrated answers 202 with Retry-After, after
+    moving its job to the front of the queue; ``?wait=<seconds>`` long-polls
+    for it instead (up to MAX_AUDIO_WAIT).
+    """
+    if not is_valid_key(key):
+        return jsonify({'error': 'Audio not found'}), 404
+    path = audio_cache().path_for(key, record=False)
+    if path is None:
+        narrator = get_pre_narrator(create=False)
+        if narrator is None or not narrator.promote(key):
+            return jsonify({'error': 'Audio not found'}), 404
+        wait = min(max(request.args.get('wait', 0.0, type=float), 0.0), MAX_AUDIO_WAIT)
+        if wait and narrator.wait(key, wait):
+            path = audio_cache().path_for(key, record=False)
+        if path is None:
+            if not narrator.pending(key):
+                return jsonify({'error': 'Audio not found'}), 404
+            response = jsonify({'key': key, 'status': 'pending'})
+            response.status_code = 202
+            response.headers['Retry-After'] = '1'
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
+    response = send_file(path, mimetype='audio/mpeg', conditional=True, etag=key,
+                         max_age=AUDIO_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={AUDIO_MAX_AGE}, immutable'
+    return response
+
+
+@tts_bp.route('/audio/<key>/timepoints', methods=['GET'])
+def get_timepoints(key):
+    """Read-along marks for narrated audio: [{name, index, text, time}] in seconds."""
+    path = None
+    if is_valid_key(key):
+        path = audio_cache().path_for(TTSService.timepoints_key(key), record=False)
+    if path is None:
+        return jsonify({'error': 'Timepoints not found'}), 404
+
+    response = send_file(path, mimetype='application/json', conditional=True, max_age=AUDIO_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={AUDIO_MAX_AGE}, immutable'
+    return response
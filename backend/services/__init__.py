@@ -1,3 +1,4 @@
 from .story_generation_service import StoryGenerationService
 from .prompt_service import PromptService
-from .emotion_service import EmotionService
\ No newline at end of file
+from .emotion_service import EmotionService
+from .progression_service import ProgressionService
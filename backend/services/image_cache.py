@@ -0,0 +1,260 @@
+"""
+Content-addressed cache for generated illustrations and coloring pages.
+
+Image prompts are deterministic f-strings of scene, character, style, age and
+therapeutic focus, so re-requesting a scene (on reload, say) used to cost
+another provider call. Images are now keyed on (provider, model, full prompt,
+size, variant index) and generators look them up before calling upstream.
+
+The bytes are kept as PNG/WebP files in ``IMAGE_CACHE_DIR`` (a ``DiskCache``
+capped at ``IMAGE_CACHE_MAX_BYTES`` with LRU eviction); an ``ImageAsset``
+row records how each one was produced.
+
+Generators hand out references (``describe``: id, URL, format, size) rather
+than the bytes; ``GET /images/<id>`` serves the file, re-encoded as WebP or
+AVIF for clients that accept them (``variant_path``). Every new image is also
+post-processed in a process pool (``postprocess``, see
+``backend.image_processing``) into responsive widths and an inline
+placeholder, stored alongside it. Nothing waits for that: until it is done a
+reference says ``processing`` and lacks ``placeholder`` / ``widths``, which
+clients poll for at ``GET /images/<id>/info``. Widths asked for meanwhile
+are encoded on demand.
+
+Coloring pages can be derived locally from a cached illustration
+(``derive_coloring_page``, see ``backend.coloring``) instead of paying for a
+second model call.
+"""
+
+import io
+import logging
+import os
+from concurrent.futures import Future
+from datetime import datetime
+
+from flask import current_app, has_app_context, has_request_context, url_for
+from PIL import Image
+
+from backend import image_processing
+from backend.database import db
+from backend.disk_cache import DiskCache, content_key, is_valid_key
+from backend.image_processing import DEFAULT_WIDTHS, ENCODINGS, encode, image_format  # noqa: F401
+from backend.metrics import register
+from backend.models.image_asset import ImageAsset
+
+logger = logging.getLogger(__name__)
+
+MIMETYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'gif': 'image/gif',
+}
+
+
+def image_key(provider, model, prompt, size, variant):
+    """Cache key of one generated image."""
+    return content_key('image', provider, model, prompt, size, variant)
+
+
+def variant_key(key, fmt, width=None):
+    """Cache key of image ``key`` re-encoded as ``fmt`` (and scaled to ``width``)."""
+    if width:
+        return content_key('image-variant', key, fmt, width)
+    return content_key('image-variant', key, fmt)
+
+
+def image_url(key):
+    """Where ``GET /images/<id>`` serves ``key``, or ``None`` if that route is not mounted."""
+    if has_request_context() and 'images' in current_app.blueprints:
+        return url_for('images.get_image', image_id=key)
+    return None
+
+
+class ImageCache:
+    def __init__(self, files, widths=(), app=None):
+        """
+        Args:
+            files: DiskCache holding originals and their variants
+            widths: Responsive widths made for every new image (empty: none)
+            app: Flask app, for recording post-processing results from pool threads
+        """
+        self.files = files
+        self.widths = tuple(sorted(widths))
+        self.app = app
+
+    def get(self, key):
+        """Image bytes for ``key``, or ``None``."""
+        return self.files.get(key)
+
+    def path_for(self, key, record=True):
+        return self.files.path_for(key, record=record)
+
+    def contains(self, key):
+        """Whether ``key`` is cached; counted in the hit ratio like ``get``."""
+        return self.files.path_for(key) is not None
+
+    def variant_path(self, key, fmt, width=None):
+        """
+        Path of image ``key`` as ``fmt`` at ``width``; ``None`` if the image is not cached.
+
+        Variants are normally made ahead of time by ``postprocess``; one that
+        is missing (evicted, or a width added since) is encoded on request.
+        """
+        vkey = variant_key(key, fmt, width)
+        path = self.files.path_for(vkey, record=False)
+        if path is None:
+            source = self.files.path_for(key, record=False)
+            if source is None:
+                return None
+            with open(source, 'rb') as f:
+                path = self.files.put(vkey, encode(f.read(), fmt, width))
+        return path
+
+    def describe(self, key, cached=False):
+        """
+        JSON-ready reference to a stored image: id, URL, format and size, never the bytes.
+
+        Includes ``placeholder`` and ``widths`` once post-processing has stored them,
+        ``processing: True`` while it is still running.
+        """
+        result = {'id': key, 'image_url': image_url(key), 'cached': cached}
+        path = self.files.path_for(key, record=False)
+        if path is not None:
+            with Image.open(path) as image:  # reads the header only
+                result.update(format=image.format.lower(), width=image.width, height=image.height)
+        asset = self.asset(key) if has_app_context() else None
+        if asset is not None and asset.placeholder:
+            result.update(placeholder=asset.placeholder, widths=asset.widths)
+        elif asset is not None and self.widths:
+            result['processing'] = True
+        result['generated_at'] = (asset.created_at if asset else datetime.now()).isoformat()
+        return result
+
+    def put(self, key, data, *, provider, model, kind, variant, size, prompt, source_url=None):
+        """
+        Store an image and, inside an app context, its ``ImageAsset`` row.
+
+        Returns the ``postprocess`` Future when responsive widths are configured, else ``None``.
+        """
+        self.files.put(key, data)
+        if has_app_context():
+            self._record(key, data, provider=provider, model=model, kind=kind, variant=variant,
+                         size=size, prompt=prompt, source_url=source_url)
+        return self.postprocess(key, data) if self.widths else None
+
+    def _record(self, key, data, **fields):
+        try:
+            width, height = Image.open(io.BytesIO(data)).size  # reads the header only
+        except Exception:
+            width = height = None
+        try:
+            db.session.merge(ImageAsset(
+                key=key, format=image_format(data), byte_size=len(data), width=width, height=height,
+                **fields,
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Could not record image_asset %s", key)
+
+    def postprocess(self, key, data):
+        """
+        Make the responsive variants and placeholder of a new image in the process pool.
+
+        Returns a Future that resolves once the results are stored: variant
+        files in the cache, placeholder and widths on the ``ImageAsset`` row.
+        """
+        stored = Future()
+
+        def store(future):
+            try:
+                result = future.result()
+                for fmt, width, encoded in result['variants']:
+                    self.files.put(variant_key(key, fmt, width), encoded)
+                self._record_processed(key, result)
+            except Exception as e:
+                logger.exception("Post-processing image %s failed", key)
+                stored.set_exception(e)
+            else:
+                stored.set_result(result)
+
+        image_processing.submit(data, self.widths).add_done_callback(store)
+        return stored
+
+    def derive_coloring_page(self, source_key, age=7):
+        """
+        Coloring page made on the CPU from cached illustration ``source_key``.
+
+        Cached itself under the source, age tier and converter version, so a
+        page is derived once. Returns its ``describe`` reference, or ``None``
+        if the illustration is not cached.
+        """
+        from backend import coloring  # NumPy is only needed here
+
+        tier = coloring.tier_for_age(age)
+        key = content_key('coloring', source_key, tier.name, coloring.VERSION)
+        if self.contains(key):
+            return self.describe(key, cached=True)
+        source = self.get(source_key)
+        if source is None:
+            return None
+        asset = self.asset(source_key) if has_app_context() else None
+        self.put(key, coloring.derive_coloring_page(source, age), provider='local',
+                 model=f'edges-v{coloring.VERSION}', kind='coloring_page', variant=0,
+                 size=asset.size if asset else 'original',
+                 prompt=f'derived from {source_key} ({tier.name})')
+        return self.describe(key)
+
+    def _record_processed(self, key, result):
+        if self.app is None:
+            return
+        widths = sorted({width for _, width, _ in result['variants']} | {result['width']})
+        # Runs on the pool's callback thread, outside any request
+        with self.app.app_context():
+            try:
+                asset = db.session.get(ImageAsset, key)
+                if asset is not None:
+                    asset.placeholder = result['placeholder']
+                    asset.widths = widths
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    @staticmethod
+    def asset(key):
+        return db.session.get(ImageAsset, key)
+
+    def stats(self):
+        return self.files.stats()
+
+
+def init_image_cache(app):
+    image_processing.configure(workers=app.config.get('IMAGE_PROCESS_WORKERS', 0))
+    cache = ImageCache(
+        DiskCache(
+            app.config.get('IMAGE_CACHE_DIR') or os.path.join(app.instance_path, 'image-cache'),
+            max_bytes=app.config.get('IMAGE_CACHE_MAX_BYTES', 5 * 1024 ** 3),
+        ),
+        widths=app.config.get('IMAGE_WIDTHS', DEFAULT_WIDTHS),
+        app=app,
+    )
+    app.extensions['image_cache'] = cache
+    register('image_cache', cache.stats)
+    return cache
+
+
+def current_image_cache():
+    """The app's image cache, or ``None`` outside an app (e.g. running a generator as a script)."""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('image_cache')
+
+
+def derive_coloring_page(cache, illustration_id, age=7):
+    """Locally derived coloring page of a cached illustration; ``None`` without cache or id."""
+    cache = cache if cache is not None else current_image_cache()
+    if cache is None or not is_valid_key(illustration_id):
+        return None
+    return cache.derive_coloring_page(illustration_id, age)
@@ -0,0 +1,231 @@
+"""
+Cost- and latency-aware routing between image providers.
+
+Imagen (Gemini) and SDXL (OpenRouter) differ a lot in price and speed, and
+either can be down or rate limited, so callers go through one ``ImageRouter``
+(built from ``IMAGE_PROVIDERS``, see ``backend.image_providers``) instead of
+a hardwired generator. For every request it ranks the providers:
+
+1. providers over their cost ceiling (``IMAGE_COST_CEILINGS``, dollars per
+   hour per worker process) are left out
+2. healthy providers come first, cheapest first (``IMAGE_PROVIDER_COSTS``),
+   then by p50 latency; a provider is healthy while its p95 latency is within
+   ``IMAGE_LATENCY_TARGET_MS`` and its recent error rate is low
+3. degraded ones follow, by expected time (p50 divided by success rate)
+4. then those that are rate limited right now, and last those whose error
+   rate tripped a cool-down
+
+The request goes to the first; when it fails or returns fewer images than
+asked, the next one is asked for the rest. Latency (p50/p95), error rate,
+spend and failovers per provider are exported in ``GET /metrics``.
+"""
+
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+
+from backend.image_providers import create_provider
+from backend.metrics import RollingTiming, register
+from backend.services.image_cache import derive_coloring_page
+
+logger = logging.getLogger(__name__)
+
+LATENCY_TARGET_MS = 20000
+# Outcomes kept per provider for the error rate
+ERROR_WINDOW = 20
+# Above this error rate a provider is ranked as degraded
+DEGRADED_ERROR_RATE = 0.2
+# At or above this error rate (over at least ERROR_MIN_SAMPLES outcomes) it cools down for
+# COOLDOWN seconds
+COOLDOWN_ERROR_RATE = 0.5
+ERROR_MIN_SAMPLES = 4
+COOLDOWN = 30.0
+SPEND_WINDOW = 3600.0
+
+_lock = threading.Lock()
+
+
+class _Health:
+    def __init__(self, cost, ceiling):
+        self.cost = cost
+        self.ceiling = ceiling
+        self.latency = RollingTiming(window=200)
+        self.outcomes = deque(maxlen=ERROR_WINDOW)
+        self.spending = deque()  # (time, dollars) within SPEND_WINDOW
+        self.cooling_until = 0.0
+        self.counts = {'requests': 0, 'failures': 0, 'images': 0}
+
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def spent(self, now):
+        while self.spending and self.spending[0][0] <= now - SPEND_WINDOW:
+            self.spending.popleft()
+        return sum(dollars for _, dollars in self.spending)
+
+
+class ImageRouter:
+    provider = "router"
+
+    def __init__(self, providers, costs=None, ceilings=None, latency_target_ms=LATENCY_TARGET_MS,
+                 clock=time.monotonic):
+        """
+        Args:
+            providers: Image providers, in order of preference when otherwise equal
+            costs: {provider name: dollars per generated image}
+            ceilings: {provider name: dollars per hour}; providers not listed are uncapped
+            latency_target_ms: p95 latency up to which a provider counts as healthy
+        """
+        costs, ceilings = costs or {}, ceilings or {}
+        self.providers = list(providers)
+        self.latency_target_ms = latency_target_ms
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._health = {
+            p.provider: _Health(costs.get(p.provider, 0.0), ceilings.get(p.provider))
+            for p in self.providers
+        }
+        self.failovers = 0
+
+    def generate_story_illustration(self, scene_description, **options):
+        return self._route('generate_story_illustration', scene_description, options)
+
+    def generate_coloring_page(self, scene_description, illustration_id=None, use_model=False,
+                               age=7, **options):
+        # Derived locally when possible, which costs no provider call at all
+        if illustration_id and not use_model:
+            page = derive_coloring_page(None, illustration_id, age)
+            if page is not None:
+                return [page]
+        return self._route('generate_coloring_page', scene_description, {**options, 'age': age})
+
+    def plan(self, num_images=1):
+        """Providers in the order a request for ``num_images`` would try them."""
+        now = self._clock()
+        ready, limited, cooling = [], [], []
+        with self._lock:
+            for provider in self.providers:
+                health = self._health[provider.provider]
+                cost = health.cost * num_images
+                if health.ceiling is not None and health.spent(now) + cost > health.ceiling:
+                    continue
+                bucket = getattr(provider, 'bucket', None)
+                if health.cooling_until > now:
+                    cooling.append(provider)
+                elif bucket is not None and bucket.available() < 1:
+                    limited.append(provider)
+                else:
+                    ready.append(provider)
+            rank = self._rank
+            cooling.sort(key=lambda provider: self._health[provider.provider].cooling_until)
+            return sorted(ready, key=rank) + sorted(limited, key=rank) + cooling
+
+    def _rank(self, provider):
+        health = self._health[provider.provider]
+        p50, p95 = health.latency.percentile(50) or 0.0, health.latency.percentile(95)
+        error_rate = health.error_rate()
+        if (p95 is None or p95 <= self.latency_target_ms) and error_rate <= DEGRADED_ERROR_RATE:
+            return (0, health.cost, p50)
+        return (1, p50 / max(1.0 - error_rate, 0.05), 0.0)
+
+    def _route(self, method, scene_description, options):
+        wanted = options.get('num_images', 1)
+        images = []
+        for attempt, provider in enumerate(self.plan(wanted)):
+            if attempt:
+                with self._lock:
+                    self.failovers += 1
+                logger.info("Image request failing over to %s", provider.provider)
+            generate = getattr(provider, method)
+            started = self._clock()
+            try:
+                remaining = {**options, 'num_images': wanted - len(images)}
+                result = generate(scene_description, **_accepted(generate, remaining))
+            except Exception:
+                logger.exception("Image provider %s failed", provider.provider)
+                result = []
+            self._record(provider.provider, result, (self._clock() - started) * 1000)
+            images.extend(result)
+            if len(images) >= wanted:
+                break
+        if not images:
+            logger.error("No image provider could serve the request")
+        return images
+
+    def _record(self, name, result, ms):
+        generated = sum(1 for image in result if not image.get('cached'))
+        if result and not generated:
+            return  # served from the cache: says nothing about the provider
+        now = self._clock()
+        with self._lock:
+            health = self._health[name]
+            health.counts['requests'] += 1
+            health.outcomes.append(bool(result))
+            if result:
+                health.latency.record(ms)
+                health.counts['images'] += generated
+                health.spending.append((now, health.cost * generated))
+                return
+            health.counts['failures'] += 1
+            if (len(health.outcomes) >= ERROR_MIN_SAMPLES
+                    and health.error_rate() >= COOLDOWN_ERROR_RATE):
+                health.cooling_until = now + COOLDOWN
+                logger.warning("Image provider %s cooling down for %.0fs (error rate %.0f%%)",
+                               name, COOLDOWN, 100 * health.error_rate())
+
+    def snapshot(self):
+        now = self._clock()
+        with self._lock:
+            providers = {
+                name: {
+                    **health.counts,
+                    **health.latency.as_dict(),
+                    'error_rate': round(health.error_rate(), 3),
+                    'cost_per_image': health.cost,
+                    'spent_last_hour': round(health.spent(now), 4),
+                    'cost_ceiling': health.ceiling,
+                    'cooling_down': health.cooling_until > now,
+                }
+                for name, health in self._health.items()
+            }
+            return {'providers': providers, 'failovers': self.failovers}
+
+
+def _accepted(method, options):
+    """The options ``method`` takes; providers differ in the extras they support."""
+    parameters = inspect.signature(method).parameters
+    if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+        return options
+    return {name: value for name, value in options.items() if name in parameters}
+
+
+def init_image_router(app):
+    state = app.extensions['image_router'] = {'router': None}
+    register('image_router', lambda: state['router'].snapshot() if state['router'] else {})
+
+
+def get_image_router():
+    """The app's image router over ``IMAGE_PROVIDERS``, created on first use."""
+    state = current_app.extensions['image_router']
+    if state['router'] is None:
+        with _lock:
+            if state['router'] is None:
+                config = current_app.config
+                providers = []
+                for name in config.get('IMAGE_PROVIDERS', ('gemini', 'openrouter')):
+                    provider = create_provider(name, config)
+                    if provider is None:
+                        logger.warning("Image provider %s is not configured, skipping it", name)
+                    else:
+                        providers.append(provider)
+                state['router'] = ImageRouter(
+                    providers,
+                    costs=config.get('IMAGE_PROVIDER_COSTS'),
+                    ceilings=config.get('IMAGE_COST_CEILINGS'),
+                    latency_target_ms=config.get('IMAGE_LATENCY_TARGET_MS', LATENCY_TARGET_MS),
+                )
+    return state['router']
@@ -0,0 +1,132 @@
+"""
+JSON merge-patch (RFC 7396) and JSON Patch (RFC 6902) helpers for
+progression sync.
+"""
+
+import copy
+
+
+class PatchError(ValueError):
+    """A patch document is malformed or does not apply to the target."""
+
+
+# ----------------------
+# RFC 7396 merge-patch
+# ----------------------
+
+def merge_patch(target, patch):
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def create_merge_patch(source, target):
+    """Smallest merge-patch turning ``source`` into ``target``.
+
+    Merge-patch cannot express an explicit ``null`` value, so nulls in
+    ``target`` come out as deletions.
+    """
+    if not isinstance(source, dict) or not isinstance(target, dict):
+        return copy.deepcopy(target)
+    patch = {key: None for key in source if key not in target}
+    for key, value in target.items():
+        if key not in source:
+            patch[key] = copy.deepcopy(value)
+        elif source[key] != value:
+            patch[key] = create_merge_patch(source[key], value)
+    return patch
+
+
+# ----------------------
+# RFC 6902 JSON Patch
+# ----------------------
+
+def _tokens(pointer):
+    if pointer == '':
+        return []
+    if not isinstance(pointer, str) or not pointer.startswith('/'):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [t.replace('~1', '/').replace('~0', '~') for t in pointer[1:].split('/')]
+
+
+def _index(container, token, allow_end=False):
+    if token == '-' and allow_end:
+        return len(container)
+    if not token.isdigit():
+        raise PatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _get(doc, tokens):
+    for token in tokens:
+        if isinstance(doc, list):
+            doc = doc[_index(doc, token)]
+        elif isinstance(doc, dict) and token in doc:
+            doc = doc[token]
+        else:
+            raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+    return doc
+
+
+def _add(doc, tokens, value):
+    if not tokens:
+        return value
+    parent, key = _get(doc, tokens[:-1]), tokens[-1]
+    if isinstance(parent, list):
+        parent.insert(_index(parent, key, allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[key] = value
+    else:
+        raise PatchError(f"Cannot add to a scalar at /{'/'.join(tokens[:-1])}")
+    return doc
+
+
+def _remove(doc, tokens):
+    if not tokens:
+        raise PatchError("Cannot remove the document root")
+    parent, key = _get(doc, tokens[:-1]), tokens[-1]
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, key))
+    if isinstance(parent, dict) and key in parent:
+        return parent.pop(key)
+    raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+
+
+def apply_json_patch(doc, operations):
+    if not isinstance(operations, list):
+        raise PatchError("A JSON Patch document must be an array of operations")
+    doc = copy.deepcopy(doc)
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise PatchError("Each JSON Patch operation must be an object")
+        op = operation.get('op')
+        path = _tokens(operation.get('path'))
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise PatchError(f"'{op}' requires a value")
+        if op == 'add':
+            doc = _add(doc, path, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(doc, path)
+        elif op == 'replace':
+            if path:
+                _remove(doc, path)
+            doc = _add(doc, path, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            doc = _add(doc, path, _remove(doc, _tokens(operation.get('from'))))
+        elif op == 'copy':
+            doc = _add(doc, path, copy.deepcopy(_get(doc, _tokens(operation.get('from')))))
+        elif op == 'test':
+            if _get(doc, path) != operation['value']:
+                raise PatchError(f"Test failed at {operation.get('path')}")
+        else:
+            raise PatchError(f"Unsupported operation: {op!r}")
+    return doc
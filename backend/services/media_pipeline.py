@@ -0,0 +1,420 @@
+"""
+Illustrated, narrated books from a generated story.
+
+Story text, illustrations and narration used to be separate services that
+clients called one after another, so a finished book took the sum of all of
+them. With ``MEDIA_PIPELINE`` enabled, a story request that opts in
+(``"media": {...}``, see ``submit``) starts a job right after the text is
+generated:
+
+1. the story is cut into N key scenes (``extract_scenes``, local and instant)
+2. every scene gets an illustration, and a coloring page derived from it
+   (``ImageCache.derive_coloring_page``; with ``coloring_model`` the model
+   draws it instead, independently of the illustration)
+3. the whole story is narrated alongside
+
+Tasks start as soon as the tasks they depend on are done, on one pool of
+``MEDIA_PIPELINE_WORKERS`` threads per process, so a book takes about as long
+as its slowest chain (one illustration plus its coloring page, or the
+narration) rather than the sum. Every stage goes through its cache (images by
+prompt, audio by text and voice) and identical submissions share one job.
+``GET /story/media/<id>`` reports progress and the finished assets.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_request_context, url_for
+
+from backend.disk_cache import content_key
+from backend.metrics import register
+from backend.services.image_cache import image_url
+from backend.services.image_router import get_image_router
+from backend.services.narration_service import (
+    audio_cache, get_pre_narrator, get_tts_service, narration_params,
+)
+from backend.services.pre_narration import FOREGROUND
+
+logger = logging.getLogger(__name__)
+
+PENDING, QUEUED, RUNNING = 'pending', 'queued', 'running'
+DONE, FAILED, SKIPPED = 'done', 'failed', 'skipped'
+
+MAX_SCENES = 8
+# How long a narration task waits for the background narrator to finish it
+NARRATION_TIMEOUT = 120
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def extract_scenes(text, count=3, max_chars=400):
+    """
+    Up to ``count`` scene descriptions spread evenly over the story.
+
+    The story is cut into ``count`` consecutive passages of whole sentences;
+    each scene is the start of its passage, up to ``max_chars``.
+    """
+    sentences = [s.strip() for s in _SENTENCE_RE.split(text or '') if s.strip()]
+    count = max(0, min(count, len(sentences)))
+    scenes = []
+    for i in range(count):
+        start, end = round(i * len(sentences) / count), round((i + 1) * len(sentences) / count)
+        passage = sentences[start:end]
+        scene = passage[0][:max_chars]
+        for sentence in passage[1:]:
+            if len(scene) + 1 + len(sentence) > max_chars:
+                break
+            scene += ' ' + sentence
+        scenes.append(scene)
+    return scenes
+
+
+class _Task:
+    __slots__ = ('name', 'stage', 'scene', 'run', 'deps', 'state', 'result', 'error',
+                 'started', 'finished')
+
+    def __init__(self, name, stage, run, deps=(), scene=None):
+        self.name = name
+        self.stage = stage
+        self.scene = scene
+        self.run = run  # called with the results of deps, in order
+        self.deps = list(deps)
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.started = self.finished = None
+
+    def seconds(self):
+        if self.started is None:
+            return None
+        return round((self.finished or time.monotonic()) - self.started, 3)
+
+
+class MediaJob:
+    def __init__(self, key, scenes, tasks):
+        self.id = key
+        self.scenes = scenes
+        self.tasks = tasks
+        self.created = time.monotonic()
+        self.finished = None
+        self.done = threading.Event()
+
+    @property
+    def status(self):
+        if not self.done.is_set():
+            return RUNNING
+        if all(task.state == DONE for task in self.tasks):
+            return DONE
+        return 'partial' if any(task.state == DONE for task in self.tasks) else FAILED
+
+    def snapshot(self):
+        """JSON-ready progress and finished assets; URLs are filled in inside a request."""
+        by_name = {task.name: task for task in self.tasks}
+        finished = sum(1 for task in self.tasks if task.state in (DONE, FAILED, SKIPPED))
+        narration = by_name.get('narration')
+        return {
+            'id': self.id,
+            'status': self.status,
+            'progress': {'done': finished, 'total': len(self.tasks)},
+            'elapsed': round((self.finished or time.monotonic()) - self.created, 3),
+            'scenes': [
+                {
+                    'index': i,
+                    'description': scene,
+                    'illustration': _image_ref(by_name.get(f'illustration-{i}')),
+                    'coloring_page': _image_ref(by_name.get(f'coloring-page-{i}')),
+                }
+                for i, scene in enumerate(self.scenes)
+            ],
+            'narration': _audio_ref(narration),
+            'tasks': [
+                {'name': task.name, 'state': task.state, 'seconds': task.seconds(),
+                 'error': task.error}
+                for task in self.tasks
+            ],
+        }
+
+
+def _image_ref(task):
+    if task is None or task.state != DONE:
+        return None
+    ref = dict(task.result)
+    if not ref.get('image_url') and 'image_data' not in ref:
+        ref['image_url'] = image_url(ref['id'])
+    return ref
+
+
+def _audio_ref(task):
+    if task is None or task.state != DONE:
+        return None
+    key = task.result
+    in_request = has_request_context() and 'tts' in current_app.blueprints
+    return {'key': key, 'audio_url': url_for('tts.get_audio', key=key) if in_request else None}
+
+
+class MediaPipeline:
+    def __init__(self, app, workers=4, max_jobs=50, image_generator=None):
+        """
+        Args:
+            app: Flask app the tasks run in (image cache, TTS service)
+            workers: Tasks running at the same time, across all jobs
+            max_jobs: Jobs remembered for status; when all of them are still
+                running, further submissions are dropped
+            image_generator: Defaults to the app's image router
+        """
+        self.app = app
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.image_generator = image_generator
+        self._jobs = OrderedDict()  # id -> MediaJob, oldest first
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats = {'submitted': 0, 'reused': 0, 'completed': 0, 'partial': 0, 'failed': 0,
+                      'dropped': 0}
+
+    def submit(self, text, character_name='the hero', age=7, scenes=3, coloring_pages=True,
+               coloring_model=False, narration=None, style=None):
+        """
+        Start (or join) the media job of a story and return its id; ``None`` if dropped.
+
+        Args:
+            scenes: Key scenes to illustrate (at most MAX_SCENES)
+            coloring_pages: Also make a coloring page of every scene
+            coloring_model: Have the image model draw coloring pages instead of deriving them
+            narration: ``narration_params`` to narrate the story with, or ``None`` for no audio
+            style: Illustration style passed to the generator
+        """
+        scene_texts = extract_scenes(text, max(1, min(int(scenes), MAX_SCENES)))
+        key = content_key('media', text, character_name, age, scene_texts, bool(coloring_pages),
+                          bool(coloring_model), narration or {}, style or '')
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status in (RUNNING, DONE):
+                self._jobs.move_to_end(key)
+                self.stats['reused'] += 1
+                return key
+            self._jobs.pop(key, None)  # retried after failures; finished stages are cache hits
+            if not self._make_room():
+                self.stats['dropped'] += 1
+                logger.warning("Media pipeline busy (%d jobs running), skipping", len(self._jobs))
+                return None
+            job = self._jobs[key] = MediaJob(key, scene_texts, self._plan(
+                scene_texts, character_name, age, coloring_pages, coloring_model, narration, style,
+            ))
+            self.stats['submitted'] += 1
+            roots = [task for task in job.tasks if not task.deps]
+            for task in roots:
+                task.state = QUEUED
+        for task in roots:
+            self._start(job, task)
+        if not job.tasks:
+            self._finish_job(job)
+        return key
+
+    def job(self, job_id):
+        return self._jobs.get(job_id)
+
+    def snapshot(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            **self.stats,
+            'running_jobs': sum(1 for job in jobs if not job.done.is_set()),
+            'running_tasks': sum(1 for job in jobs for task in job.tasks if task.state == RUNNING),
+            'workers': self.workers,
+        }
+
+    def stop(self):
+        """Stop accepting tasks; running ones finish, queued ones are abandoned."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _make_room(self):
+        if len(self._jobs) < self.max_jobs:
+            return True
+        for key, job in self._jobs.items():
+            if job.done.is_set():
+                del self._jobs[key]
+                return True
+        return False
+
+    def _plan(self, scenes, character_name, age, coloring_pages, coloring_model, narration, style):
+        tasks = []
+        for i, scene in enumerate(scenes):
+            illustration = _Task(f'illustration-{i}', 'illustration',
+                                 self._illustrate(scene, character_name, style), scene=i)
+            tasks.append(illustration)
+            if coloring_pages:
+                # The local derivation needs the illustration; the model does not
+                deps = () if coloring_model else (illustration,)
+                tasks.append(_Task(f'coloring-page-{i}', 'coloring_page',
+                                   self._color(scene, character_name, age, coloring_model), deps,
+                                   scene=i))
+        if narration:
+            tasks.append(_Task('narration', 'narration', lambda: self._narrate(narration)))
+        return tasks
+
+    def _generator(self):
+        return self.image_generator if self.image_generator is not None else get_image_router()
+
+    def _illustrate(self, scene, character_name, style):
+        def run():
+            options = {'style': style} if style else {}
+            images = self._generator().generate_story_illustration(
+                scene, character_name=character_name, **options)
+            if not images:
+                raise RuntimeError('no illustration was generated')
+            return images[0]
+        return run
+
+    def _color(self, scene, character_name, age, use_model):
+        def run(illustration=None):
+            pages = self._generator().generate_coloring_page(
+                scene, character_name=character_name, age=age,
+                illustration_id=illustration and illustration.get('id'), use_model=use_model,
+            )
+            if not pages:
+                raise RuntimeError('no coloring page was generated')
+            return pages[0]
+        return run
+
+    @staticmethod
+    def _narrate(params):
+        narrator = get_pre_narrator()
+        if narrator is not None:
+            # Shares the background narrator's queue, so a story narrated by
+            # both pre-narration and this job is synthesized once
+            key = narrator.submit(priority=FOREGROUND, **params)
+            if key:
+                narrator.wait(key, NARRATION_TIMEOUT)
+                if audio_cache().contains(key):
+                    return key
+                raise RuntimeError('narration failed')
+        service = get_tts_service()
+        if service is None:
+            raise RuntimeError('narration is unavailable')
+        key, _ = service.narrate(**params)
+        if key is None:
+            raise RuntimeError('narration produced no audio')
+        return key
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='media-pipeline')
+            return self._executor
+
+    def _start(self, job, task):
+        try:
+            self._pool().submit(self._run, job, task)
+        except RuntimeError:  # shut down
+            task.state, task.error = FAILED, 'pipeline stopped'
+            self._settle(job, task)
+
+    def _run(self, job, task):
+        task.state, task.started = RUNNING, time.monotonic()
+        try:
+            with self.app.app_context():
+                task.result = task.run(*(dep.result for dep in task.deps))
+            task.state = DONE
+        except Exception as e:
+            logger.warning("Media task %s of job %s failed: %s", task.name, job.id, e)
+            task.state, task.error = FAILED, str(e)
+        task.finished = time.monotonic()
+        self._settle(job, task)
+
+    def _settle(self, job, task):
+        """Start the tasks that were waiting on ``task``, or skip them if it failed."""
+        ready = []
+        with self._lock:
+            for other in job.tasks:
+                if other.state != PENDING or task not in other.deps:
+                    continue
+                if task.state != DONE:
+                    other.state, other.error = SKIPPED, f'{task.name} {task.state}'
+                    ready.append((other, False))
+                elif all(dep.state == DONE for dep in other.deps):
+                    other.state = QUEUED
+                    ready.append((other, True))
+            finished = all(other.state in (DONE, FAILED, SKIPPED) for other in job.tasks)
+        for other, start in ready:
+            if start:
+                self._start(job, other)
+            else:
+                self._settle(job, other)
+        if finished and not job.done.is_set():
+            self._finish_job(job)
+
+    def _finish_job(self, job):
+        with self._lock:
+            if job.done.is_set():
+                return
+            job.finished = time.monotonic()
+            job.done.set()
+            self.stats[job.status if job.status != DONE else 'completed'] += 1
+
+
+def init_media_pipeline(app):
+    previous = app.extensions.get('media_pipeline')
+    if previous is not None:
+        previous.stop()
+    pipeline = app.extensions['media_pipeline'] = MediaPipeline(
+        app,
+        workers=app.config.get('MEDIA_PIPELINE_WORKERS', 4),
+        max_jobs=app.config.get('MEDIA_PIPELINE_MAX_JOBS', 50),
+    )
+    if app.config.get('MEDIA_PIPELINE'):
+        register('media_pipeline', pipeline.snapshot)
+    return pipeline
+
+
+def get_media_pipeline():
+    """The app's media pipeline, or ``None`` when MEDIA_PIPELINE is off."""
+    if not current_app.config.get('MEDIA_PIPELINE'):
+        return None
+    return current_app.extensions.get('media_pipeline')
+
+
+def start_media(text, payload):
+    """
+    Start the media job of a just-generated story if the request opted in.
+
+    Clients opt in by sending ``"media": {"scenes": 3, "coloring_pages": true,
+    "coloring_model": false, "style": ..., "narration": {"voice": ...}}`` (all
+    optional; narration falls back to the request's own ``"narration"``).
+    Returns the job's status URL, or ``None``.
+    """
+    options = payload.get('media')
+    if not isinstance(options, dict):
+        return None
+    pipeline = get_media_pipeline()
+    if pipeline is None:
+        return None
+    narration = options.get('narration', payload.get('narration'))
+    params = None
+    if isinstance(narration, dict):
+        params, error = narration_params({**narration, 'text': text})
+        if error:
+            logger.info("Media job without narration: %s", error)
+    try:
+        scenes = int(options.get('scenes', current_app.config.get('MEDIA_PIPELINE_SCENES', 3)))
+        age = int(payload.get('character_age', 7))
+    except (TypeError, ValueError):
+        return None
+    job_id = pipeline.submit(
+        text,
+        character_name=payload.get('character') or 'the hero',
+        age=age,
+        scenes=scenes,
+        coloring_pages=bool(options.get('coloring_pages', True)),
+        coloring_model=bool(options.get('coloring_model', False)),
+        narration=params,
+        style=options.get('style'),
+    )
+    return url_for('story.media_status', job_id=job_id) if job_id else None
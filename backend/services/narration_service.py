@@ -0,0 +1,137 @@
+"""
+Story narration backed by the TTS service and a shared audio cache.
+
+Audio is content-addressed (see ``TTSService.cache_key``) and stored in
+``TTS_CACHE_DIR``, capped at ``TTS_CACHE_MAX_BYTES``; replaying a story with
+the same voice and prosody is a file read instead of a synthesis call.
+
+With ``PRE_NARRATION`` enabled, story routes can also start narration in the
+background right after a story is generated (see ``pre_narrate`` and
+``backend.services.pre_narration``).
+"""
+
+import logging
+import os
+import threading
+
+from flask import current_app, url_for
+
+from backend.disk_cache import DiskCache
+from backend.metrics import register
+from backend.services.pre_narration import PreNarrator
+from backend.tts_backends import StubTTSBackend, create_backend
+from backend.tts_service import TTSService
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+def init_narration(app):
+    cache = DiskCache(
+        app.config.get('TTS_CACHE_DIR') or os.path.join(app.instance_path, 'tts-cache'),
+        max_bytes=app.config.get('TTS_CACHE_MAX_BYTES', 2 * 1024 ** 3),
+    )
+    previous = app.extensions.get('narration')
+    if previous and previous.get('pre_narrator'):
+        previous['pre_narrator'].stop()
+    state = app.extensions['narration'] = {'cache': cache, 'service': None, 'pre_narrator': None}
+    register('tts_cache',
+             lambda: {**cache.stats(), 'backend': app.config.get('TTS_BACKEND', 'google')})
+    if app.config.get('PRE_NARRATION'):
+        register('pre_narration',
+                 lambda: state['pre_narrator'].snapshot() if state['pre_narrator'] else {})
+    return cache
+
+
+def audio_cache():
+    return current_app.extensions['narration']['cache']
+
+
+def narration_params(payload):
+    """Validated synthesis parameters from a request body, or an error message."""
+    text = (payload.get('text') or '').strip()
+    if not text:
+        return None, 'text is required'
+    try:
+        speaking_rate = float(payload.get('speaking_rate', 1.0))
+        pitch = float(payload.get('pitch', 0.0))
+    except (TypeError, ValueError):
+        return None, 'speaking_rate and pitch must be numbers'
+    if not 0.25 <= speaking_rate <= 4.0:
+        return None, 'speaking_rate must be between 0.25 and 4.0'
+    if not -20.0 <= pitch <= 20.0:
+        return None, 'pitch must be between -20.0 and 20.0'
+    return {
+        'text': text,
+        'voice_name': payload.get('voice') or 'en-US-Neural2-F',
+        'speaking_rate': speaking_rate,
+        'pitch': pitch,
+    }, None
+
+
+def _backend_options(config, name):
+    if name == StubTTSBackend.name:
+        return {'latency': config.get('TTS_STUB_LATENCY', 0.0)}
+    return {}
+
+
+def get_tts_service():
+    """The app's TTS service (``TTS_BACKEND``), created on first use; ``None`` if it cannot run."""
+    state = current_app.extensions['narration']
+    if state['service'] is None:
+        with _lock:
+            if state['service'] is None:
+                name = current_app.config.get('TTS_BACKEND', 'google')
+                try:
+                    backend = create_backend(name, **_backend_options(current_app.config, name))
+                    state['service'] = TTSService(
+                        cache=state['cache'],
+                        max_workers=current_app.config.get('TTS_MAX_WORKERS', 4),
+                        backend=backend,
+                    )
+                except ImportError as e:
+                    logger.warning("TTS backend %s unavailable, narration disabled: %s", name, e)
+                    state['service'] = False
+    return state['service'] or None
+
+
+def get_pre_narrator(create=True):
+    """The app's background narrator, or ``None`` when PRE_NARRATION is off or TTS cannot run."""
+    state = current_app.extensions['narration']
+    if state['pre_narrator'] is None and create and current_app.config.get('PRE_NARRATION'):
+        service = get_tts_service()
+        if service is None:
+            return None
+        with _lock:
+            if state['pre_narrator'] is None:
+                # A service of its own with one chunk at a time keeps background
+                # synthesis out of the foreground chunk pool.
+                state['pre_narrator'] = PreNarrator(
+                    TTSService(cache=state['cache'], max_workers=1, backend=service.backend),
+                    workers=current_app.config.get('PRE_NARRATION_WORKERS', 1),
+                    max_pending=current_app.config.get('PRE_NARRATION_MAX_PENDING', 100),
+                )
+    return state['pre_narrator']
+
+
+def pre_narrate(text, payload):
+    """
+    Start narrating a just-generated story if the request opted in.
+
+    Clients opt in by sending ``"narration": {"voice": ..., "speaking_rate": ...,
+    "pitch": ...}`` (all optional) with the story request, carrying the child's
+    preferred voice. Returns the URL the audio will be served from, or ``None``.
+    """
+    options = payload.get('narration')
+    if not isinstance(options, dict) or 'tts' not in current_app.blueprints:
+        return None
+    params, error = narration_params({**options, 'text': text})
+    if error:
+        logger.info("Not pre-narrating: %s", error)
+        return None
+    narrator = get_pre_narrator()
+    if narrator is None:
+        return None
+    key = narrator.submit(**params)
+    return url_for('tts.get_audio', key=key) if key else None
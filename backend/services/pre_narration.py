@@ -0,0 +1,158 @@
+"""
+Background pre-narration of freshly generated stories.
+
+Most children press "read to me" right after a story appears. With
+``PRE_NARRATION`` enabled, story routes hand the text to the app's
+``PreNarrator`` as soon as it is generated (when the request opts in, see
+``narration_service.pre_narrate``) and answer with an ``audio_url`` at once;
+the audio is synthesized into the shared audio cache in the background, so
+by the time the button is pressed it is usually a cache hit.
+
+Jobs wait in a priority queue served by ``PRE_NARRATION_WORKERS`` daemon
+threads (default 1). Each worker synthesizes one chunk at a time through its
+own ``TTSService``, so background work never holds more than that many
+provider calls and never queues in front of the chunk pool that foreground
+``/tts`` requests use. A client asking for audio that is still queued
+promotes its job to the front and may long-poll for it.
+"""
+
+import itertools
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+FOREGROUND = 0
+BACKGROUND = 10
+
+
+class _Job:
+    __slots__ = ('key', 'params', 'priority', 'started', 'done')
+
+    def __init__(self, key, params, priority):
+        self.key = key
+        self.params = params
+        self.priority = priority
+        self.started = False
+        self.done = threading.Event()
+
+
+class PreNarrator:
+    def __init__(self, service, workers=1, max_pending=100):
+        """
+        Args:
+            service: TTSService the workers synthesize with; its cache receives the audio
+            workers: Background synthesis threads
+            max_pending: Queued plus running jobs; further submissions are dropped
+        """
+        self.service = service
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue = queue.PriorityQueue()
+        self._jobs = {}  # key -> _Job, while queued or running
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._threads = []
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'dropped': 0, 'promoted': 0}
+
+    def submit(self, text, voice_name='en-US-Neural2-F', speaking_rate=1.0, pitch=0.0,
+               priority=BACKGROUND):
+        """Queue narration of text and return its audio cache key; None if the queue is full."""
+        service = self.service
+        key = service.speech_key(text, voice_name, speaking_rate, pitch, True, service.ENCODING)
+        if service.cache.contains(key):
+            return key
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self._raise_priority(job, priority)
+                return key
+            if len(self._jobs) >= self.max_pending:
+                self.stats['dropped'] += 1
+                logger.warning("Pre-narration queue full (%d jobs), skipping", len(self._jobs))
+                return None
+            job = self._jobs[key] = _Job(key, {
+                'text': text,
+                'voice_name': voice_name,
+                'speaking_rate': speaking_rate,
+                'pitch': pitch,
+            }, priority)
+            self._queue.put((priority, next(self._seq), job))
+            self.stats['submitted'] += 1
+            if not self._threads:
+                self._start()
+        return key
+
+    def pending(self, key):
+        """Whether narration for key is queued or being synthesized."""
+        return key in self._jobs
+
+    def promote(self, key):
+        """Move a queued job to the front; returns whether key is pending at all."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return False
+            if self._raise_priority(job, FOREGROUND):
+                self.stats['promoted'] += 1
+            return True
+
+    def wait(self, key, timeout):
+        """Block until key's job finishes (or timeout); True if nothing is left pending."""
+        job = self._jobs.get(key)
+        return job is None or job.done.wait(timeout)
+
+    def snapshot(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.started)
+            return {
+                **self.stats,
+                'queued': len(self._jobs) - running,
+                'running': running,
+                'workers': len(self._threads),
+            }
+
+    def stop(self):
+        """Let the workers exit after their current job; queued jobs are abandoned."""
+        for _ in self._threads:
+            self._queue.put((FOREGROUND - 1, next(self._seq), None))
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def _raise_priority(self, job, priority):
+        # The old queue entry stays behind and is skipped when popped (see _run)
+        if job.started or priority >= job.priority:
+            return False
+        job.priority = priority
+        self._queue.put((priority, next(self._seq), job))
+        return True
+
+    def _start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'pre-narration-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            priority, _, job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.started or priority != job.priority:
+                    continue
+                job.started = True
+            outcome = 'failed'
+            try:
+                key, _ = self.service.narrate(**job.params)
+                if key:
+                    outcome = 'completed'
+            except Exception:
+                logger.exception("Pre-narration failed")
+            finally:
+                with self._lock:
+                    self._jobs.pop(job.key, None)
+                    self.stats[outcome] += 1
+                job.done.set()
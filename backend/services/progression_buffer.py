@@ -0,0 +1,345 @@
+"""
+Write-behind buffer for progression syncs.
+
+The Flutter client syncs after many small events. With
+``PROGRESSION_WRITE_BEHIND`` enabled, ``ProgressionService`` keeps the latest
+state per user here and acknowledges immediately; the buffer flushes dirty
+users to the database at most every ``PROGRESSION_FLUSH_INTERVAL`` seconds
+and on shutdown.
+
+Every acknowledged write is first appended (and fsynced) to a JSON-lines
+journal. Each process writes to its own ``writer.<pid>.*`` directory under
+``PROGRESSION_JOURNAL_DIR`` and holds an exclusive ``flock`` on it while it
+runs. Each flush starts a new journal segment and deletes the old ones of
+that directory only after the database commit. At startup a process adopts
+the directories whose lock it can take (their writer is gone): it replays
+their segments, journals the result as its own and only then deletes them,
+so a crash of any worker at any point loses no acknowledged write. Flushing
+is idempotent: buffered versions whose delta row is already stored are
+skipped.
+
+The buffer is per process: reads are only served from it, and versions only
+handed out from it, when it is the sole writer. ``init_progression_buffer``
+therefore writes through when ``WEB_CONCURRENCY`` is above 1. Should another
+process still have written a version the buffer also holds, the flush does
+not drop either write: it logs the conflict and applies the buffered
+merge-patches that still change something on top of the stored state, as
+new versions.
+"""
+
+import atexit
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so no write-behind
+    fcntl = None
+
+from sqlalchemy import delete, select, update
+
+from backend.database import db
+from backend.metrics import register
+from backend.models.progression import ProgressionDelta
+from backend.models.user import User
+from backend.services.json_patch import merge_patch
+from backend.services.progression_service import ProgressionService
+
+logger = logging.getLogger(__name__)
+
+WRITER_PREFIX = 'writer.'
+
+
+class _Entry:
+    __slots__ = ('data', 'version', 'deltas')
+
+    def __init__(self, data, version, deltas):
+        self.data = data
+        self.version = version
+        self.deltas = deltas
+
+
+class ProgressionWriteBuffer:
+    def __init__(self, app, journal_dir, flush_interval=5.0, fsync=True, delta_retention=100):
+        self._app = app
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.delta_retention = delta_retention
+        self.lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._entries = {}
+        self._flushing = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'writes': 0, 'flushes': 0, 'rows_flushed': 0, 'conflicts': 0}
+
+        os.makedirs(journal_dir, exist_ok=True)
+        # Serialises startups, so no one adopts a directory before its writer has locked it
+        with open(os.path.join(journal_dir, '.lock'), 'a') as startup:
+            fcntl.flock(startup, fcntl.LOCK_EX)
+            self.writer_dir = tempfile.mkdtemp(prefix=f"{WRITER_PREFIX}{os.getpid()}.",
+                                               dir=journal_dir)
+            self._owner = self._try_lock(self.writer_dir)
+            self._segment = 0
+            self._journal = open(self._segment_path(self._segment), 'a', encoding='utf-8')
+            adopted = self._adopt()
+        if adopted:
+            self._replay(adopted)
+
+    # ---- journal -----------------------------------------------------------
+
+    @staticmethod
+    def _segments(directory):
+        names = (n for n in os.listdir(directory)
+                 if n.startswith('journal.') and n.endswith('.jsonl'))
+        return sorted(int(n.split('.')[1]) for n in names)
+
+    @staticmethod
+    def _segment_files(directory):
+        return [os.path.join(directory, f"journal.{segment:08d}.jsonl")
+                for segment in ProgressionWriteBuffer._segments(directory)]
+
+    def _segment_path(self, segment):
+        return os.path.join(self.writer_dir, f"journal.{segment:08d}.jsonl")
+
+    @staticmethod
+    def _try_lock(directory):
+        """The open lock file of ``directory`` if we got its exclusive lock, else ``None``."""
+        owner = open(os.path.join(directory, 'lock'), 'a')
+        try:
+            fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            owner.close()
+            return None
+        return owner
+
+    def _adopt(self):
+        """Lock the journal directories of writers that are gone; ``[(directory, lock)]``."""
+        adopted = []
+        for name in sorted(os.listdir(self.journal_dir)):
+            directory = os.path.join(self.journal_dir, name)
+            if not name.startswith(WRITER_PREFIX) or directory == self.writer_dir:
+                continue
+            owner = self._try_lock(directory)
+            if owner is not None:
+                adopted.append((directory, owner))
+        if self._segment_files(self.journal_dir):
+            adopted.append((self.journal_dir, None))  # journal from before per-writer directories
+        return adopted
+
+    def _append(self, record):
+        self._journal.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _replay(self, adopted):
+        for directory, _ in adopted:
+            for path in self._segment_files(directory):
+                with open(path, encoding='utf-8') as journal:
+                    for line in journal:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            break  # torn final line from a crash mid-append; never acknowledged
+                        self._apply(record)
+        logger.info("Replayed %d buffered progression users from %d journal(s)",
+                    len(self._entries), len(adopted))
+        self._append_snapshot()
+        # Ours now: only after that is durable may the old journals go
+        for directory, owner in adopted:
+            if owner is None:
+                for path in self._segment_files(directory):
+                    os.remove(path)
+            else:
+                shutil.rmtree(directory)
+                owner.close()
+        self.flush()
+
+    def _append_snapshot(self):
+        for user_id, entry in self._entries.items():
+            for version, patch in entry.deltas:
+                data = entry.data if version == entry.version else None
+                self._append({'user_id': user_id, 'version': version, 'patch': patch, 'data': data})
+
+    def _apply(self, record):
+        entry = self._entries.get(record['user_id'])
+        if entry is None:
+            entry = self._entries[record['user_id']] = _Entry(None, 0, [])
+        entry.deltas.append((record['version'], record['patch']))
+        if record['version'] >= entry.version:
+            entry.version = record['version']
+            if record.get('data') is not None:
+                entry.data = record['data']
+
+    # ---- reads and writes --------------------------------------------------
+
+    def get(self, user_id):
+        """Buffered ``(data, version)`` for ``user_id``, or ``None`` if not buffered."""
+        with self.lock:
+            entry = self._entries.get(user_id) or self._flushing.get(user_id)
+            return (entry.data, entry.version) if entry is not None else None
+
+    def buffered_deltas(self, user_id):
+        with self.lock:
+            deltas = []
+            for entries in (self._flushing, self._entries):
+                entry = entries.get(user_id)
+                if entry is not None:
+                    deltas.extend(entry.deltas)
+            return deltas
+
+    def put(self, user_id, data, version, patch):
+        """Durably record a new state; returns once it is safe to acknowledge."""
+        with self.lock:
+            self._append({'user_id': user_id, 'version': version, 'patch': patch, 'data': data})
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = _Entry(data, version, [])
+            entry.data, entry.version = data, version
+            entry.deltas.append((version, patch))
+            self.stats['writes'] += 1
+
+    # ---- flushing ----------------------------------------------------------
+
+    def flush(self):
+        with self._flush_lock:
+            with self.lock:
+                if not self._entries:
+                    return 0
+                self._flushing, self._entries = self._entries, {}
+                old_segment = self._segment
+                self._journal.close()
+                self._segment += 1
+                self._journal = open(self._segment_path(self._segment), 'a', encoding='utf-8')
+
+            with self._app.app_context():
+                try:
+                    for user_id, entry in self._flushing.items():
+                        self._write(user_id, entry)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Progression flush failed; keeping journal segment %d",
+                                     old_segment)
+                    with self.lock:
+                        for user_id, entry in self._flushing.items():
+                            newer = self._entries.get(user_id)
+                            if newer is not None:
+                                entry.deltas.extend(newer.deltas)
+                                entry.data, entry.version = newer.data, newer.version
+                            self._entries[user_id] = entry
+                        self._flushing = {}
+                    return 0
+                finally:
+                    db.session.remove()
+
+            with self.lock:
+                flushed = len(self._flushing)
+                self._flushing = {}
+                self.stats['flushes'] += 1
+                self.stats['rows_flushed'] += flushed
+            for segment in self._segments(self.writer_dir):
+                if segment <= old_segment:
+                    os.remove(self._segment_path(segment))
+            return flushed
+
+    def _write(self, user_id, entry):
+        row = db.session.execute(
+            select(User.progression_data, User.progression_version).where(User.id == user_id)
+        ).one_or_none()
+        if row is None:
+            return
+        stored = row.progression_version or 0
+        kept = dict(db.session.execute(
+            select(ProgressionDelta.version, ProgressionDelta.patch).where(
+                ProgressionDelta.user_id == user_id,
+                ProgressionDelta.version.in_([version for version, _ in entry.deltas]),
+            )
+        ).all())
+        floor = stored - self.delta_retention
+        pending = [(version, patch) for version, patch in entry.deltas
+                   if version > floor and kept.get(version) != patch]
+        if not pending:
+            return  # flushed before (replay after a crash between commit and cleanup)
+
+        if pending[0][0] <= stored:
+            # Another process took versions this buffer handed out: keep both writes
+            self.stats['conflicts'] += 1
+            logger.warning("Progression for %s was written elsewhere up to version %d; "
+                           "applying %d buffered changes on top", user_id, stored, len(pending))
+            data, version = row.progression_data or {}, stored
+            for _, patch in pending:
+                updated = merge_patch(data, patch)
+                if updated == data:
+                    continue  # already applied, like an unchanged sync
+                data, version = updated, version + 1
+                db.session.add(ProgressionDelta(user_id=user_id, version=version, patch=patch))
+        else:
+            data, version = entry.data, entry.version
+            for delta_version, patch in pending:
+                db.session.add(ProgressionDelta(user_id=user_id, version=delta_version,
+                                                patch=patch))
+        db.session.execute(
+            update(User).where(User.id == user_id)
+            .values(progression_data=data, progression_version=version)
+        )
+        db.session.execute(
+            delete(ProgressionDelta).where(
+                ProgressionDelta.user_id == user_id,
+                ProgressionDelta.version <= version - self.delta_retention,
+            )
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='progression-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._journal.closed:
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+        self._journal.close()
+        with self.lock:
+            if not self._entries:
+                shutil.rmtree(self.writer_dir)  # everything is in the database
+        self._owner.close()
+
+
+def init_progression_buffer(app):
+    if not app.config.get('PROGRESSION_WRITE_BEHIND'):
+        return None
+    workers = app.config.get('WEB_CONCURRENCY', 1)
+    if workers > 1:
+        logger.warning("PROGRESSION_WRITE_BEHIND needs a single worker process, not %d; "
+                       "writing through", workers)
+        return None
+    if fcntl is None:
+        logger.warning("PROGRESSION_WRITE_BEHIND needs flock, which this platform lacks; "
+                       "writing through")
+        return None
+    buffer = ProgressionWriteBuffer(
+        app,
+        journal_dir=(app.config.get('PROGRESSION_JOURNAL_DIR')
+                     or os.path.join(app.instance_path, 'progression-journal')),
+        flush_interval=app.config.get('PROGRESSION_FLUSH_INTERVAL', 5.0),
+        fsync=app.config.get('PROGRESSION_JOURNAL_FSYNC', True),
+        delta_retention=ProgressionService.DELTA_RETENTION,
+    )
+    app.extensions['progression_buffer'] = buffer
+    register('progression_buffer', lambda: dict(buffer.stats))
+    buffer.start()
+    return buffer
@@ -0,0 +1,152 @@
+import logging
+
+from flask import current_app
+from sqlalchemy import delete, select, update
+
+from backend.database import db
+from backend.models.progression import ProgressionDelta
+from backend.models.user import User
+from backend.services.json_patch import apply_json_patch, create_merge_patch, merge_patch
+
+logger = logging.getLogger(__name__)
+
+MERGE_PATCH = 'application/merge-patch+json'
+JSON_PATCH = 'application/json-patch+json'
+
+
+class PreconditionFailed(Exception):
+    """The client's If-Match version is not the stored version."""
+
+    def __init__(self, current_version):
+        super().__init__(f"Progression is at version {current_version}")
+        self.current_version = current_version
+
+
+class ProgressionConflict(Exception):
+    """An unconditional write kept losing to concurrent writes and was given up."""
+
+    def __init__(self, current_version):
+        super().__init__(f"Progression is at version {current_version} and still changing")
+        self.current_version = current_version
+
+
+def _write_buffer():
+    return current_app.extensions.get('progression_buffer')
+
+
+class ProgressionService:
+    """Versioned progression state.
+
+    Each sync rewrites the compressed ``progression_data`` document and adds
+    its merge-patch to ``progression_delta``. Deltas are pruned to the last
+    ``DELTA_RETENTION`` versions, so the document is what reads are served
+    from; the write-behind buffer is what cuts the row writes per sync.
+    """
+    DELTA_RETENTION = 100
+    MAX_RETRIES = 3
+
+    @staticmethod
+    def get_state(user_id):
+        """Returns ``(progression_data, version)``."""
+        buffer = _write_buffer()
+        buffered = buffer.get(user_id) if buffer is not None else None
+        if buffered is not None:
+            return buffered
+        row = db.session.execute(
+            select(User.progression_data, User.progression_version).where(User.id == user_id)
+        ).one()
+        return row.progression_data or {}, row.progression_version or 0
+
+    @staticmethod
+    def apply_update(user_id, body, content_type=None, if_match=None):
+        """Apply a sync body atomically; returns ``(data, version)``.
+
+        ``content_type`` selects how ``body`` is read: a merge-patch, a JSON
+        Patch, or (anything else) the full document. Patches are relative, so
+        a concurrent write without If-Match is retried on the fresh state
+        (``ProgressionConflict`` once ``MAX_RETRIES`` are used up); with
+        If-Match a lost race is a ``PreconditionFailed``.
+        """
+        buffer = _write_buffer()
+        if buffer is not None:
+            return ProgressionService._apply_buffered(buffer, user_id, body, content_type, if_match)
+
+        for _ in range(ProgressionService.MAX_RETRIES):
+            current, version = ProgressionService.get_state(user_id)
+            if if_match is not None and if_match != version:
+                raise PreconditionFailed(version)
+
+            updated = ProgressionService._apply_body(current, body, content_type)
+            if updated == current:
+                return current, version
+
+            result = db.session.execute(
+                update(User)
+                .where(User.id == user_id, User.progression_version == version)
+                .values(progression_data=updated, progression_version=version + 1)
+            )
+            if result.rowcount == 1:
+                patch = create_merge_patch(current, updated)
+                ProgressionService._record_delta(user_id, version + 1, patch)
+                db.session.commit()
+                return updated, version + 1
+
+            db.session.rollback()
+            if if_match is not None:
+                raise PreconditionFailed(ProgressionService.get_state(user_id)[1])
+            logger.info("Progression for %s changed concurrently, retrying", user_id)
+
+        logger.warning("Progression for %s kept changing; giving up after %d attempts",
+                       user_id, ProgressionService.MAX_RETRIES)
+        raise ProgressionConflict(ProgressionService.get_state(user_id)[1])
+
+    @staticmethod
+    def _apply_buffered(buffer, user_id, body, content_type, if_match):
+        # The buffer lock serialises read-modify-write per process, so no CAS is needed.
+        with buffer.lock:
+            current, version = ProgressionService.get_state(user_id)
+            if if_match is not None and if_match != version:
+                raise PreconditionFailed(version)
+            updated = ProgressionService._apply_body(current, body, content_type)
+            if updated == current:
+                return current, version
+            buffer.put(user_id, updated, version + 1, create_merge_patch(current, updated))
+            return updated, version + 1
+
+    @staticmethod
+    def _apply_body(current, body, content_type):
+        if content_type == MERGE_PATCH:
+            return merge_patch(current, body)
+        if content_type == JSON_PATCH:
+            return apply_json_patch(current, body)
+        return body
+
+    @staticmethod
+    def _record_delta(user_id, version, patch):
+        db.session.add(ProgressionDelta(user_id=user_id, version=version, patch=patch))
+        db.session.execute(
+            delete(ProgressionDelta).where(
+                ProgressionDelta.user_id == user_id,
+                ProgressionDelta.version <= version - ProgressionService.DELTA_RETENTION,
+            )
+        )
+
+    @staticmethod
+    def deltas_since(user_id, since_version, current_version):
+        """Merge-patches after ``since_version`` in order, or ``None`` if no longer kept."""
+        if since_version > current_version:
+            return None
+        rows = db.session.execute(
+            select(ProgressionDelta.version, ProgressionDelta.patch)
+            .where(ProgressionDelta.user_id == user_id, ProgressionDelta.version > since_version)
+            .order_by(ProgressionDelta.version)
+        ).all()
+        buffer = _write_buffer()
+        if buffer is not None:
+            merged = dict(rows)
+            buffered = buffer.buffered_deltas(user_id)
+            merged.update((v, patch) for v, patch in buffered if v > since_version)
+            rows = sorted(merged.items())
+        if len(rows) != current_version - since_version:
+            return None
+        return [{'version': v, 'patch': patch} for v, patch in rows]
@@ -1,23 +1,55 @@
-import google.generativeai as genai
 import os
 import logging
+import threading
+
+from backend.middleware.request_logging import annotate
 
 logger = logging.getLogger(__name__)
 
+MODEL = 'gemini-1.5-pro-latest'
+
+
 class StoryGenerationService:
-    def __init__(self):
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not set")
+    """
+    Story text from Gemini.
+
+    Cheap to construct: the SDK is imported and the model client created on
+    the first story (or by ``warm`` from a post-fork hook), so importing the
+    routes neither pays for google.generativeai nor fails without an API key.
+    """
 
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-pro-latest')
+    def __init__(self, api_key=None, model_name=MODEL):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    api_key = self.api_key or os.getenv('GEMINI_API_KEY')
+                    if not api_key:
+                        raise ValueError("GEMINI_API_KEY not set")
+                    import google.generativeai as genai
+                    genai.configure(api_key=api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def warm(self):
+        """Create the model client now instead of on the first story; False without an API key."""
+        try:
+            return self.model is not None
+        except ValueError:
+            return False
 
     def generate_story(self, prompt: str) -> str:
         """Generate story from prompt"""
+        annotate(model=self.model_name)
         try:
             response = self.model.generate_content(prompt)
             return getattr(response, 'text', '')
         except Exception as e:
-            logger.error(f"Story generation failed: {e}", exc_info=True)
+            logger.error("Story generation failed: %s", e, exc_info=True)
             raise
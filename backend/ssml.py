@@ -0,0 +1,147 @@
+"""
+Single-pass SSML compiler for narration.
+
+``compile_ssml`` walks the story text once and emits ``<speak>`` markup with:
+
+- ``&``, ``<`` and ``>`` escaped, so model output can never produce invalid SSML
+- a pause after commas (400ms) and sentence punctuation (800ms)
+- quoted dialogue wrapped in ``<emphasis>`` (an unpaired quote stays literal)
+- optionally a ``<mark>`` before every word (``w0``, ``w1`` ...) or sentence
+  (``s0``, ``s1`` ...); the TTS API reports when each mark is spoken, which
+  is what drives read-along highlighting
+
+Mark numbering can continue across chunks via ``first_index`` so the marks of
+a story split into several requests stay unique.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+WORD = 'word'
+SENTENCE = 'sentence'
+
+COMMA_BREAK = '<break time="400ms"/>'
+SENTENCE_BREAK = '<break time="800ms"/>'
+
+_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;'}
+_PLAIN_REPLACEMENTS = {
+    ',': ',' + COMMA_BREAK,
+    '.': '.' + SENTENCE_BREAK,
+    '!': '!' + SENTENCE_BREAK,
+    '?': '?' + SENTENCE_BREAK,
+    **_ESCAPES,
+}
+
+_PLAIN_RE = re.compile(r'[.!?,](?=\s)|[&<>]|"')
+_MARKED_RE = re.compile(r"(?P<brk>[.!?,])(?=\s)|(?P<esc>[&<>])|(?P<quote>\")|(?P<word>\w[\w'’-]*)")
+
+
+@dataclass(frozen=True, slots=True)
+class Mark:
+    name: str
+    index: int
+    text: str
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledSSML:
+    ssml: str
+    marks: tuple
+    next_index: int
+
+
+def compile_ssml(text, marks=None, first_index=0):
+    """Compile plain story text to SSML; ``marks`` is ``None``, ``"word"`` or ``"sentence"``."""
+    return _compile(text, marks, first_index)
+
+
+@lru_cache(maxsize=512)
+def _compile(text, marks, first_index):
+    if marks not in (None, WORD, SENTENCE):
+        raise ValueError(f"marks must be None, {WORD!r} or {SENTENCE!r}")
+    if not marks:
+        return CompiledSSML(f"<speak>{_compile_plain(text)}</speak>", (), first_index)
+
+    out = ['<speak>']
+    found = []
+    index = first_index
+    pos = 0
+    emphasis_open = False
+    sentence_start = None  # offset of the current sentence's first word
+    append = out.append
+
+    def open_sentence(start):
+        nonlocal index, sentence_start
+        append(f'<mark name="s{index}"/>')
+        sentence_start = start
+        index += 1
+
+    def close_sentence(end):
+        nonlocal sentence_start
+        if sentence_start is not None:
+            found.append(Mark(f"s{index - 1}", index - 1, text[sentence_start:end].strip()))
+            sentence_start = None
+
+    for m in _MARKED_RE.finditer(text):
+        start = m.start()
+        if start > pos:
+            append(text[pos:start])
+        kind = m.lastgroup
+        if kind == 'word':
+            if marks == WORD:
+                append(f'<mark name="w{index}"/>')
+                found.append(Mark(f"w{index}", index, m.group()))
+                index += 1
+            elif sentence_start is None:
+                open_sentence(start)
+            append(m.group())
+        elif kind == 'brk':
+            punct = m.group()
+            append(punct)
+            if punct == ',':
+                append(COMMA_BREAK)
+            else:
+                append(SENTENCE_BREAK)
+                if marks == SENTENCE:
+                    close_sentence(m.end())
+        elif kind == 'esc':
+            append(_ESCAPES[m.group()])
+        elif emphasis_open:
+            append('</emphasis>')
+            emphasis_open = False
+        elif text.find('"', m.end()) != -1:
+            if marks == SENTENCE and sentence_start is None:
+                open_sentence(start)
+            append('<emphasis level="moderate">')
+            emphasis_open = True
+        else:
+            append('"')
+        pos = m.end()
+
+    append(text[pos:])
+    if marks == SENTENCE:
+        close_sentence(len(text))
+    append('</speak>')
+    return CompiledSSML(''.join(out), tuple(found), index)
+
+
+def _compile_plain(text):
+    # Without marks nothing but punctuation, escapes and quotes needs touching,
+    # so one re.sub with a table lookup is enough.
+    emphasis_open = False
+
+    def replace(m):
+        nonlocal emphasis_open
+        token = m.group()
+        if token != '"':
+            return _PLAIN_REPLACEMENTS[token]
+        if emphasis_open:
+            emphasis_open = False
+            return '</emphasis>'
+        if text.find('"', m.end()) != -1:
+            emphasis_open = True
+            return '<emphasis level="moderate">'
+        return '"'
+
+    return _PLAIN_RE.sub(replace, text)
@@ -1,18 +1,22 @@
+import jwt
 import pytest
 from backend.app import create_app
 from backend.database import db as _db
+from backend.models.user import User
 from backend.routes.auth_routes import auth_bp
 from backend.routes.progression_routes import progression_bp
 from backend.routes.story_routes import story_bp
 from backend.routes.character_routes import character_bp
+from backend.routes.tts_routes import tts_bp
+from backend.routes.image_routes import image_bp
+
+JWT_SECRET = 'test-jwt-secret-0123456789abcdef0123'
 
 @pytest.fixture
 def app():
     """Create and configure a new app instance for each test."""
     # create a temporary file to isolate the database for each test
-    app = create_app('development')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['TESTING'] = True
+    app = create_app('testing')
 
     with app.app_context():
         _db.create_all()
@@ -20,6 +24,8 @@ def app():
         app.register_blueprint(progression_bp, url_prefix='/progression')
         app.register_blueprint(story_bp, url_prefix='/story')
         app.register_blueprint(character_bp, url_prefix='/character')
+        app.register_blueprint(tts_bp, url_prefix='/tts')
+        app.register_blueprint(image_bp, url_prefix='/images')
         
         # Ensure database is accessible for health check
         try:
@@ -38,4 +44,22 @@ def app():
 @pytest.fixture
 def client(app):
     """A test client for the app."""
-    return app.test_client()
\ No newline at end of file
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    """A saved account to make authenticated requests as."""
+    user = User(username='tester', email='tester@test.com')
+    user.set_password('password')
+    _db.session.add(user)
+    _db.session.commit()
+    return user
+
+
+@pytest.fixture
+def auth_headers(user, monkeypatch):
+    """Headers carrying a JWT for ``user``."""
+    monkeypatch.setenv('JWT_SECRET_KEY', JWT_SECRET)
+    token = jwt.encode({'user_id': user.id}, JWT_SECRET, algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
@@ -68,4 +68,70 @@ def test_setup_test_account(client):
     assert response.status_code in [200, 201]
     data = json.loads(response.data)
     assert 'status' in data
-    assert data['status'] in ['created', 'updated']
\ No newline at end of file
+    assert data['status'] in ['created', 'updated']
+
+def test_app_starts_without_importing_provider_sdks(monkeypatch):
+    """Provider SDKs are imported on first use, not to start a worker"""
+    from backend.benchmarks.bench_startup import HEAVY_MODULES, cold_start
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    imported, created, heavy, rows = cold_start()
+    assert heavy == []
+    assert HEAVY_MODULES[0] not in {name for _, _, name in rows}
+    assert any(name == 'backend.app' for _, _, name in rows)
+
+
+def test_story_service_creates_its_client_on_first_use(monkeypatch):
+    from backend.services.story_generation_service import StoryGenerationService
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    service = StoryGenerationService()  # no key: still constructible
+    assert service.warm() is False
+    with pytest.raises(ValueError):
+        service.generate_story('Once upon a time')
+
+
+def test_requests_are_logged_as_json_lines(client, tmp_path, monkeypatch):
+    import logging
+    from logging.handlers import QueueListener
+    from backend.middleware import request_logging
+    from backend.routes import story_routes
+
+    class FakeModel:
+        def generate_content(self, prompt):
+            text = '[TITLE: Moonrise]\nThe owl woke.\n[WISDOM GEM: Rest.]'
+            return type('Response', (), {'text': text})()
+
+    monkeypatch.setattr(story_routes.story_generation_service, '_model', FakeModel())
+    path = tmp_path / 'logs' / 'story_weaver.log'
+    request_logging.start_logging(str(path))
+    try:
+        response = client.post('/story/generate-story', json={'character': 'Mia'},
+                               headers={'X-Request-ID': 'trace-42'})
+        generated = client.get('/story/get-story-themes').headers['X-Request-ID']
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logging.getLogger('backend.tests').exception('Lost %d owls', 3)
+    finally:
+        request_logging.stop_logging()
+
+    assert response.headers['X-Request-ID'] == 'trace-42'
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    access = [record for record in records if record['logger'] == 'story_weaver.access']
+    story, themes = access
+    assert story['request_id'] == 'trace-42' and story['route'] == '/story/generate-story'
+    assert story['status'] == 200 and story['latency_ms'] >= 0
+    assert story['model'] == 'gemini-1.5-pro-latest'
+    assert themes['request_id'] == generated and 'model' not in themes
+    error, = [record for record in records if record['logger'] == 'backend.tests']
+    assert error['message'] == 'Lost 3 owls' and 'ZeroDivisionError' in error['exc']
+
+    # A full queue drops records instead of blocking the request thread
+    log_queue = request_logging.LogQueue(maxsize=1)
+    handler = request_logging.RequestQueueHandler(log_queue)
+    for _ in range(2):
+        handler.handle(logging.makeLogRecord({'msg': 'hello'}))
+    assert handler.dropped == 1
+    # ...but the listener's stop sentinel still gets in
+    QueueListener(log_queue).enqueue_sentinel()
+    assert log_queue.qsize() == 2
@@ -0,0 +1,85 @@
+"""
+Tests for authentication and the require_auth identity cache
+"""
+from backend.database import db
+from backend.models.user import User
+
+
+def test_require_auth_caches_identity(client, auth_headers):
+    assert client.get('/progression/get-progression', headers=auth_headers).status_code == 200
+    response = client.get('/progression/get-progression', headers=auth_headers)
+    assert response.status_code == 200
+    assert 'auth;dur=' in response.headers['Server-Timing']
+
+    auth = client.get('/metrics').get_json()['auth']
+    assert auth['token_cache']['hits'] >= 1
+    assert auth['user_cache']['hits'] >= 1
+    assert auth['p50_ms'] is not None
+
+
+def test_deleted_user_is_not_served_from_cache(client, user, auth_headers):
+    assert client.get('/progression/get-progression', headers=auth_headers).status_code == 200
+
+    db.session.delete(user)
+    db.session.commit()
+
+    assert client.get('/progression/get-progression', headers=auth_headers).status_code == 401
+
+
+def test_identity_cache_is_cleared_when_the_change_commits(app, user):
+    from backend.middleware import auth
+
+    user.email = 'renamed@test.com'
+    db.session.flush()
+    # A concurrent request still reads the committed row and caches it
+    auth._user_cache.set(user.id, {'id': user.id, 'username': 'tester',
+                                   'email': 'tester@test.com'})
+    db.session.commit()
+
+    assert auth._user_cache.get(user.id) is None
+
+
+def test_sync_progression_updates_user_row(client, auth_headers):
+    response = client.post('/progression/sync-progression', json={'stars': 3}, headers=auth_headers)
+    assert response.status_code == 200
+    response = client.get('/progression/get-progression', headers=auth_headers)
+    assert response.get_json() == {'stars': 3}
+
+
+def test_password_hashing_runs_in_pool_and_detects_stale_params():
+    from backend import password_hashing
+
+    password_hashing.configure(method='pbkdf2:sha256:1000', workers=1)
+    try:
+        hashed = password_hashing.hash_password('secret')
+        assert hashed.startswith('pbkdf2:sha256:1000$')
+        assert password_hashing.verify_password(hashed, 'secret')
+        assert not password_hashing.verify_password(hashed, 'wrong')
+        assert not password_hashing.needs_rehash(hashed)
+
+        password_hashing.configure(method='pbkdf2:sha256:2000')
+        assert password_hashing.needs_rehash(hashed)
+    finally:
+        password_hashing.configure(method=password_hashing.DEFAULT_METHOD, workers=0)
+
+
+def test_login_rehashes_and_throttles(app, client, monkeypatch):
+    from backend import password_hashing
+    from backend.middleware.rate_limit import parse_limit
+
+    monkeypatch.setenv('SECRET_KEY', 'test-secret-key-0123456789abcdef0123')
+    password_hashing.configure(method='pbkdf2:sha256:1000')
+    user = User(username='rehash', email='rehash@test.com')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    password_hashing.configure(method=password_hashing.DEFAULT_METHOD)
+
+    response = client.post('/auth/login', auth=('rehash', 'password'))
+    assert response.status_code == 200
+    stored = User.query.filter_by(username='rehash').one().password_hash
+    assert stored.startswith(password_hashing.DEFAULT_METHOD + '$')
+
+    app.extensions['rate_limiter'].user_limits['login'] = parse_limit('2/60')
+    statuses = [client.post('/auth/login', auth=('rehash', 'nope')).status_code for _ in range(3)]
+    assert statuses[-1] == 429
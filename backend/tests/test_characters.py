@@ -0,0 +1,70 @@
+"""
+Tests for character read paths
+"""
+from backend.repositories.character_repository import CharacterRecord
+
+
+def _create(client, name, **extra):
+    response = client.post('/character/create-character', json={'name': name, 'age': 7, **extra})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def test_get_characters_matches_orm_shape(client):
+    created = _create(client, 'Full Shape', traits=['Brave'], likes=['space'])
+
+    listed = client.get('/character/get-characters').get_json()
+
+    assert listed == [created]
+
+
+def test_get_characters_summary_view(client):
+    _create(client, 'Summary Hero', likes=['dragons'])
+
+    listed = client.get('/character/get-characters?view=summary').get_json()
+
+    assert listed[0]['name'] == 'Summary Hero'
+    assert set(listed[0]) == {'id', 'name', 'age', 'gender', 'created_at'}
+
+
+def test_character_record_decodes_json_lazily():
+    raw = ('c1', 'Lazy', 7, None, None, None, None, None, None,
+           '["Brave"]', None, '[]', '["space"]', '[]', '[]')
+    record = CharacterRecord(raw)
+
+    assert record._likes == '["space"]'
+    assert record.likes == ['space']
+    assert record._likes == ['space']
+    assert record.siblings == []
+
+
+def test_change_feed_returns_only_changes_since_cursor(client):
+    first = _create(client, 'Before Sync')
+    cursor = client.get('/character/changes').get_json()['next_cursor']
+
+    second = _create(client, 'After Sync')
+    client.patch(f"/character/characters/{second['id']}", json={'name': 'Renamed'})
+    client.delete(f"/character/characters/{first['id']}")
+
+    feed = client.get(f'/character/changes?since={cursor}').get_json()
+
+    assert feed['has_more'] is False
+    assert [(c['op'], c['id']) for c in feed['changes']] == [
+        ('upsert', second['id']),
+        ('delete', first['id']),
+    ]
+    assert feed['changes'][0]['character']['name'] == 'Renamed'
+    assert client.get(f"/character/changes?since={feed['next_cursor']}").get_json()['changes'] == []
+
+
+def test_change_feed_pages(client):
+    for i in range(3):
+        _create(client, f'Paged {i}')
+
+    page = client.get('/character/changes?limit=2').get_json()
+
+    assert page['has_more'] is True
+    assert len(page['changes']) == 2
+    rest = client.get(f"/character/changes?since={page['next_cursor']}&limit=2").get_json()
+    assert rest['has_more'] is False
+    assert [c['character']['name'] for c in rest['changes']] == ['Paged 2']
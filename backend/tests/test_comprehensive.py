@@ -46,21 +46,24 @@ def test_generate_story_error_handling(client):
         assert 'story_text' in data # Fallback provides a story
 
 
-def test_subscription_limits(client):
-    """Test subscription-based limits - Placeholder, actual logic not implemented yet"""
-    # This test is a placeholder as subscription limits are not yet implemented
-    # in the modularized backend.
-    response = client.post('/auth/setup-test-account')
-    assert response.status_code in [200, 201]
-
-    # Test story generation limits (assuming no limits for now)
-    for i in range(3):
-        response = client.post('/story/generate-story', json={
+def test_subscription_limits(app, client, auth_headers):
+    """The rolling 24-hour generation quota rejects stories past it with a 429"""
+    from backend.middleware.rate_limit import parse_limit
+
+    app.extensions['rate_limiter'].rolling_quota['text'] = parse_limit('3/86400')
+
+    target = 'backend.routes.story_routes.story_generation_service.generate_story'
+    with patch(target) as mock_generate_story:
+        mock_generate_story.return_value = "[TITLE: Quota]\nOnce upon a time..."
+        statuses = [client.post('/story/generate-story', json={
             'character': f'Test Child {i}',
             'age': 7,
             'theme': 'Adventure'
-        })
-        assert response.status_code == 200
+        }, headers=auth_headers) for i in range(4)]
+
+    assert [r.status_code for r in statuses] == [200, 200, 200, 429]
+    assert int(statuses[-1].headers['Retry-After']) > 0
+    assert mock_generate_story.call_count == 3
 
 
 def test_database_operations(client):
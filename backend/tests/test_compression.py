@@ -0,0 +1,47 @@
+"""
+Tests for compressed JSON storage and compressed request bodies
+"""
+import gzip
+import json
+
+from backend.compression import compress_json, decompress_json
+from backend.database import db
+
+PROGRESS = {
+    'storiesCreated': 12, 'storiesRead': 40, 'storiesFavorited': 3, 'charactersCreated': 2,
+    'coloringPagesCompleted': 5, 'unlockedFeatures': ['fantasy_mode', 'custom_colors'],
+    'createdAt': '2025-02-11T19:03:12.000', 'lastStoryCreatedAt': '2025-03-02T20:15:44.000',
+}
+
+
+def test_compressed_json_round_trip_and_legacy_rows():
+    stored = compress_json(PROGRESS)
+
+    assert decompress_json(stored) == PROGRESS
+    assert len(stored) < len(json.dumps(PROGRESS)) / 2
+    assert decompress_json(json.dumps(PROGRESS)) == PROGRESS
+    assert decompress_json(json.dumps(PROGRESS).encode()) == PROGRESS
+    assert decompress_json(compress_json({})) == {}
+
+
+def test_gzip_request_body_is_stored_compressed(client, user, auth_headers):
+    response = client.post(
+        '/progression/sync-progression', data=gzip.compress(json.dumps(PROGRESS).encode()),
+        headers={**auth_headers, 'Content-Encoding': 'gzip', 'Content-Type': 'application/json'},
+    )
+    assert response.status_code == 200
+
+    raw = db.session.execute(db.text('SELECT progression_data FROM "user" WHERE id = :id'),
+                             {'id': user.id}).scalar()
+    assert isinstance(raw, bytes) and raw[0] != ord('{')
+    assert client.get('/progression/get-progression', headers=auth_headers).get_json() == PROGRESS
+
+
+def test_oversized_and_malformed_compressed_bodies_are_rejected(app, client, auth_headers):
+    bomb = gzip.compress(b'{"stars": "' + b'0' * (app.wsgi_app.max_size + 1) + b'"}')
+    gzipped = {**auth_headers, 'Content-Encoding': 'gzip', 'Content-Type': 'application/json'}
+    response = client.post('/progression/sync-progression', data=bomb, headers=gzipped)
+    assert response.status_code == 413
+
+    response = client.post('/progression/sync-progression', data=b'not gzip', headers=gzipped)
+    assert response.status_code == 400
@@ -0,0 +1,389 @@
+"""
+Tests for image generation
+"""
+import io
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+from PIL import Image, ImageFilter
+
+from backend import image_processing
+from backend.disk_cache import DiskCache, content_key
+from backend.gemini_image_generator import GeminiImageGenerator
+from backend.image_providers import StubImageProvider
+from backend.middleware.rate_limit import TokenBucket
+from backend.openrouter_image_generator import OpenRouterImageGenerator
+from backend.services.image_cache import ENCODINGS, ImageCache
+from backend.services.image_router import ImageRouter
+
+
+def png(color='red', size=(8, 8)):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, format='PNG')
+    return out.getvalue()
+
+
+@pytest.fixture
+def images(app, tmp_path):
+    cache = app.extensions['image_cache'] = ImageCache(DiskCache(str(tmp_path / 'images')))
+    return cache
+
+
+class FakeResponse:
+    def __init__(self, status_code, url=None, content=b'', headers=None):
+        self.status_code = status_code
+        self.text = '' if url else 'upstream error'
+        self.content = content
+        self.headers = headers or {}
+        self._url = url
+
+    def json(self):
+        return {'data': [{'url': self._url}]}
+
+
+class FakeSession:
+    """Answers request n after ``delays[n]`` seconds; with HTTP 500 if n is in ``failures``."""
+
+    def __init__(self, delays, failures=()):
+        self.delays = list(delays)
+        self.failures = set(failures)
+        self.started = []
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        with self._lock:
+            n = len(self.started)
+            self.started.append(time.monotonic())
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delays[n])
+        with self._lock:
+            self.in_flight -= 1
+        if n in self.failures:
+            return FakeResponse(500)
+        return FakeResponse(200, f'https://img.example/{n}.png')
+
+    def get(self, url, timeout=None):
+        return FakeResponse(200, url, content=png())
+
+
+def test_openrouter_images_are_requested_concurrently_with_partial_results():
+    session = FakeSession([0.2, 0.2, 0.2, 0.2], failures={1})
+    generator = OpenRouterImageGenerator(api_key='key', session=session, bucket=TokenBucket(4, 100))
+
+    started = time.monotonic()
+    images = generator.generate_story_illustration('A dragon reads a book', num_images=4)
+
+    assert time.monotonic() - started < 0.5
+    assert session.max_in_flight == 4
+    variants = [int(image['id'].rsplit('_', 1)[1]) for image in images]
+    assert len(variants) == 3 and variants == sorted(variants)
+
+
+def test_openrouter_images_are_paced_and_time_out_individually():
+    session = FakeSession([0.0, 0.0, 3.0])
+    generator = OpenRouterImageGenerator(api_key='key', session=session, bucket=TokenBucket(1, 10),
+                                         timeout=0.6)
+
+    started = time.monotonic()
+    pages = generator.generate_coloring_page('A dragon reads a book', num_images=3)
+
+    assert time.monotonic() - started < 1.0
+    assert len(pages) == 2
+    gaps = [b - a for a, b in zip(session.started, session.started[1:])]
+    assert all(gap >= 0.09 for gap in gaps)
+
+
+class ScriptedSession:
+    """Answers each generation with the next ``(status, Retry-After)``; records the timeouts."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.timeouts = []
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        self.timeouts.append(timeout[1])
+        status, retry_after = self.answers.pop(0)
+        return FakeResponse(status, 'https://img.example/0.png' if status == 200 else None,
+                            headers={} if retry_after is None else {'Retry-After': retry_after})
+
+    def get(self, url, timeout=None):
+        return FakeResponse(200, url, content=png())
+
+
+@pytest.mark.parametrize('answers, generated', [
+    ([(429, '0'), (503, '0'), (200, None)], 1),   # turned away unprocessed: retried
+    ([(503, None)], 0),                           # no Retry-After: may have run
+    ([(502, None)], 0),                           # a gateway error can follow a billed image
+    ([(504, '0')], 0),
+    ([(429, '30')], 0),                           # waiting would pass the deadline
+])
+def test_openrouter_retries_only_requests_turned_away_in_time(answers, generated):
+    session = ScriptedSession(*answers)
+    generator = OpenRouterImageGenerator(api_key='key', session=session, bucket=TokenBucket(4, 100),
+                                         timeout=5)
+
+    images = generator.generate_story_illustration('A dragon reads a book')
+
+    assert len(images) == generated
+    assert len(session.timeouts) == (len(answers) if generated else 1)
+    # Each attempt only gets what is left of the caller's deadline
+    assert all(timeout <= 5 for timeout in session.timeouts)
+    assert session.timeouts == sorted(session.timeouts, reverse=True)
+
+
+def test_openrouter_images_are_cached_by_prompt_and_variant(app, client, images):
+    session = FakeSession([0.0, 0.0])
+    generator = OpenRouterImageGenerator(api_key='key', session=session, bucket=TokenBucket(4, 100))
+
+    with app.test_request_context():
+        first = generator.generate_story_illustration('A dragon reads a book', num_images=2)
+        again = generator.generate_story_illustration('A dragon reads a book', num_images=2)
+
+    assert len(session.started) == 2
+    assert [image['cached'] for image in first] == [False, False]
+    assert [image['cached'] for image in again] == [True, True]
+    assert [image['id'] for image in again] == [image['id'] for image in first]
+    assert first[0]['id'] != first[1]['id']
+    assert 'image_data' not in again[0] and 'prompt' not in again[0]
+    assert client.get(again[0]['image_url'], headers={'Accept': 'image/png'}).data == png()
+    asset = ImageCache.asset(first[1]['id'])
+    assert (asset.provider, asset.kind, asset.variant, asset.format, asset.width) == \
+        ('openrouter', 'illustration', 1, 'png', 8)
+
+
+def test_gemini_requests_only_uncached_variants(app, images):
+    class FakeImagen:
+        def __init__(self):
+            self.requested = []
+
+        def generate_images(self, prompt, number_of_images, **options):
+            self.requested.append(number_of_images)
+            images = [type('GeneratedImage', (), {'image_bytes': png('blue', (4, 4))})()
+                      for _ in range(number_of_images)]
+            return type('Response', (), {'images': images})()
+
+    imagen = FakeImagen()
+    generator = GeminiImageGenerator(api_key=None, image_model=imagen)
+
+    generator.generate_coloring_page('A cat on a boat', num_images=2, age=4)
+    pages = generator.generate_coloring_page('A cat on a boat', num_images=3, age=4)
+    generator.generate_coloring_page('A cat on a boat', num_images=1, age=12)
+
+    assert imagen.requested == [2, 1, 1]
+    assert [page['cached'] for page in pages] == [True, True, False]
+
+
+def test_image_endpoint_negotiates_format_and_serves_ranges(client, images):
+    key = content_key('image', 'test')
+    images.put(key, png(size=(64, 64)), provider='test', model='test', kind='illustration',
+               variant=0, size='64x64', prompt='A red square')
+
+    original = client.get(f'/images/{key}', headers={'Accept': 'image/png,*/*;q=0.8'})
+    assert original.mimetype == 'image/png' and original.data == png(size=(64, 64))
+    assert original.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert original.headers['Vary'] == 'Accept'
+
+    webp = client.get(f'/images/{key}', headers={'Accept': 'image/webp,*/*'})
+    assert webp.mimetype == 'image/webp' and webp.data[8:12] == b'WEBP'
+    if 'avif' in ENCODINGS:
+        avif = client.get(f'/images/{key}', headers={'Accept': 'image/avif,image/webp'})
+        assert avif.mimetype == 'image/avif'
+
+    partial = client.get(f'/images/{key}', headers={'Accept': 'image/png', 'Range': 'bytes=0-7'})
+    assert partial.status_code == 206 and partial.data == b'\x89PNG\r\n\x1a\n'
+    revalidated = client.get(f'/images/{key}', headers={'If-None-Match': original.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert client.get('/images/not-an-image').status_code == 404
+
+
+def test_new_images_are_postprocessed_in_a_process_pool(app, client, tmp_path):
+    cache = ImageCache(DiskCache(str(tmp_path)), widths=(256, 512, 1024), app=app)
+    app.extensions['image_cache'] = cache
+    key = content_key('image', 'processed')
+    image_processing.configure(workers=1)
+    try:
+        with app.test_request_context():
+            result = cache.put(key, png(size=(1024, 1024)), provider='test', model='test',
+                               kind='illustration', variant=0, size='1024x1024',
+                               prompt='A red square').result(timeout=60)
+            described = cache.describe(key)
+    finally:
+        image_processing.configure(workers=0)
+
+    assert described['placeholder'].startswith('data:image/webp;base64,')
+    assert len(described['placeholder']) < 1000
+    assert described['widths'] == [256, 512, 1024]
+    made = {(fmt, width) for fmt, width, _ in result['variants']}
+    assert {('webp', 256), ('png', 256), ('webp', 1024)} <= made and ('png', 1024) not in made
+
+    thumbnail = client.get(f'/images/{key}?w=200', headers={'Accept': 'image/webp'})
+    assert thumbnail.mimetype == 'image/webp'
+    assert Image.open(io.BytesIO(thumbnail.data)).width == 256
+    original = client.get(f'/images/{key}?w=4000', headers={'Accept': 'image/png'})
+    assert original.data == png(size=(1024, 1024))
+
+
+def test_generators_hand_off_provider_bytes_without_waiting_for_postprocessing(
+        app, client, tmp_path, monkeypatch):
+    cache = ImageCache(DiskCache(str(tmp_path)), widths=(256,), app=app)
+    app.extensions['image_cache'] = cache
+    submitted = []
+
+    def submit(data, widths):
+        submitted.append((data, Future()))
+        return submitted[-1][1]
+
+    monkeypatch.setattr(image_processing, 'submit', submit)
+    returned = png('blue', (512, 512))
+
+    class Imagen:
+        def generate_images(self, prompt, number_of_images, **options):
+            image = type('GeneratedImage', (), {'image_bytes': returned})()
+            return type('Response', (), {'images': [image]})()
+
+    generator = GeminiImageGenerator(api_key=None, image_model=Imagen())
+    with app.test_request_context():
+        [illustration] = generator.generate_story_illustration('A whale sings')
+
+    # Back while post-processing is still pending, with the provider's bytes as they came
+    assert illustration['processing'] is True and 'placeholder' not in illustration
+    assert submitted[0][0] == returned and cache.get(illustration['id']) == returned
+    info = f"/images/{illustration['id']}/info"
+    assert client.get(info).get_json()['processing'] is True
+
+    submitted[0][1].set_result(image_processing.process(returned, (256,)))
+    polled = client.get(info).get_json()
+    assert polled['widths'] == [256, 512] and 'processing' not in polled
+    assert client.get('/images/not-an-image/info').status_code == 404
+
+
+def test_coloring_pages_are_derived_locally_from_the_illustration(app, images):
+    scene = Image.effect_mandelbrot((1024, 1024), (-2.0, -1.5, 1.0, 1.5), 100).convert('RGB')
+    out = io.BytesIO()
+    scene.save(out, format='PNG')
+    illustration = content_key('image', 'scene')
+    images.put(illustration, out.getvalue(), provider='test', model='test', kind='illustration',
+               variant=0, size='1:1', prompt='A scene')
+
+    class NoModel:
+        def generate_images(self, **kwargs):
+            raise AssertionError('the model should not be called')
+
+    generator = GeminiImageGenerator(api_key=None, image_model=NoModel())
+    started = time.monotonic()
+    young, = generator.generate_coloring_page('A scene', age=4, illustration_id=illustration)
+    assert time.monotonic() - started < 1.0
+    teen, = generator.generate_coloring_page('A scene', age=14, illustration_id=illustration)
+    again, = generator.generate_coloring_page('A scene', age=5, illustration_id=illustration)
+
+    assert not young['cached'] and again['cached'] and again['id'] == young['id'] != teen['id']
+    pages = {}
+    for name, page in (('young', young), ('teen', teen)):
+        with Image.open(io.BytesIO(images.get(page['id']))) as image:
+            assert image.size == (1024, 1024)
+            pages[name] = image.convert('L')
+            assert [i for i, n in enumerate(pages[name].histogram()) if n] == [0, 255]
+            assert pages[name].getpixel((0, 0)) == 255  # white background
+    # Less detail for young children, in thicker lines that survive thinning better
+    black = {name: page.histogram()[0] for name, page in pages.items()}
+    thinned = {name: page.filter(ImageFilter.MaxFilter(5)).histogram()[0]
+               for name, page in pages.items()}
+    assert black['young'] < black['teen']
+    assert thinned['young'] / black['young'] > thinned['teen'] / black['teen']
+    assert images.asset(young['id']).provider == 'local'
+
+
+def test_story_media_pipeline_runs_stages_concurrently(app, client, images, tmp_path, monkeypatch):
+    from backend.routes import story_routes
+    from backend.services.media_pipeline import init_media_pipeline
+    from backend.services.narration_service import init_narration
+
+    class SlowImagen:
+        def generate_images(self, prompt, number_of_images, **options):
+            time.sleep(0.3)
+            scene = Image.effect_mandelbrot((256, 256), (-2.0, -1.5, 1.0, 1.5), 50).convert('RGB')
+            out = io.BytesIO()
+            scene.save(out, format='PNG')
+            image = type('GeneratedImage', (), {'image_bytes': out.getvalue()})()
+            return type('Response', (), {'images': [image]})()
+
+    app.config.update(MEDIA_PIPELINE=True, TTS_BACKEND='stub', TTS_STUB_LATENCY=0.3,
+                      TTS_CACHE_DIR=str(tmp_path / 'tts'))
+    init_narration(app)
+    pipeline = init_media_pipeline(app)
+    pipeline.image_generator = GeminiImageGenerator(api_key=None, image_model=SlowImagen())
+    monkeypatch.setattr(story_routes.story_generation_service, 'generate_story', lambda prompt: (
+        "[TITLE: Moonrise]\nThe moon rose over the hill. The owl woke in her oak. "
+        "She flew to the river. A fox waved from the bank. They shared a pear under the stars. "
+        "Then everyone went home to sleep.\n[WISDOM GEM: Rest well.]"
+    ))
+    request = {'character': 'Mia', 'character_age': 4, 'media': {'scenes': 3, 'narration': {}}}
+
+    story = client.post('/story/generate-story', json=request).get_json()
+    job = pipeline.job(story['media_url'].rsplit('/', 1)[1])
+    assert job.done.wait(10)
+    status = client.get(story['media_url']).get_json()
+
+    # 3 illustrations and the narration at once: about one stage, not four
+    assert status['status'] == 'done' and status['progress'] == {'done': 7, 'total': 7}
+    assert status['elapsed'] < 0.9
+    assert [scene['description'] for scene in status['scenes']] == [
+        'The moon rose over the hill. The owl woke in her oak.',
+        'She flew to the river. A fox waved from the bank.',
+        'They shared a pear under the stars. Then everyone went home to sleep.',
+    ]
+    for scene in status['scenes']:
+        assert scene['illustration']['image_url'] == f"/images/{scene['illustration']['id']}"
+        assert images.asset(scene['coloring_page']['id']).provider == 'local'
+    assert client.get(status['narration']['audio_url']).status_code == 200
+
+    again = client.post('/story/generate-story', json=request).get_json()
+    assert again['media_url'] == story['media_url']
+    assert client.get('/story/media/unknown').status_code == 404
+
+
+def test_image_router_prefers_cheap_healthy_providers_and_fails_over(app, images):
+    pricey = StubImageProvider(name='gemini', cache=images)
+    cheap = StubImageProvider(name='openrouter', cache=images, fail=True)
+    router = ImageRouter([pricey, cheap], costs={'gemini': 0.03, 'openrouter': 0.004})
+    assert router.plan() == [cheap, pricey]
+
+    # The cheap provider is down: every request still gets its images, from the other one
+    for n in range(4):
+        assert len(router.generate_story_illustration(f'Scene {n}', num_images=2)) == 2
+    stats = router.snapshot()
+    # One failure marks it degraded: tried after gemini from then on, so asked only once
+    assert stats['failovers'] == 1 and cheap.calls == 1
+    assert stats['providers']['openrouter']['error_rate'] == 1.0
+    assert router.plan() == [pricey, cheap]
+    assert stats['providers']['gemini']['images'] == 8
+    assert stats['providers']['gemini']['spent_last_hour'] == 0.24
+
+    # Cached images are neither billed nor timed
+    router.generate_story_illustration('Scene 0', num_images=2)
+    assert router.snapshot()['providers']['gemini']['images'] == 8
+
+
+def test_image_router_weighs_latency_rate_limits_and_cost_ceilings(app, images):
+    slow = StubImageProvider(name='openrouter', cache=images, latency=0.1)
+    fast = StubImageProvider(name='gemini', cache=images)
+    router = ImageRouter([slow, fast], costs={'gemini': 0.03, 'openrouter': 0.004},
+                         latency_target_ms=50)
+    router.generate_story_illustration('A slow scene')
+    assert router.snapshot()['providers']['openrouter']['p95_ms'] >= 100
+    assert router.plan() == [fast, slow]  # over the latency target, so no longer cheapest-first
+
+    fast.bucket = TokenBucket(1, 0.001)
+    fast.bucket.try_take()
+    assert router.plan() == [slow, fast]  # rate limited right now
+
+    capped = ImageRouter([fast], costs={'gemini': 0.03}, ceilings={'gemini': 0.07})
+    fast.bucket = None
+    assert len(capped.generate_story_illustration('One')) == 1
+    assert capped.plan(num_images=1) == [fast] and capped.plan(num_images=2) == []
+    # Two would pass the hourly ceiling
+    assert capped.generate_story_illustration('Two', num_images=2) == []
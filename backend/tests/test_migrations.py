@@ -0,0 +1,57 @@
+"""
+Tests for the schema migration runner and boot-time version check
+"""
+import json
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
+
+from backend.compression import decompress_json, is_compressed
+from backend.migrations import SCHEMA_VERSION, SchemaVersionError, check_schema_version, upgrade
+
+LEGACY_PROGRESS = {'storiesRead': 7, 'unlockedFeatures': ['fantasy_mode', 'custom_colors']}
+
+
+def test_upgrade_is_idempotent(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+
+    assert upgrade(engine) == list(range(1, SCHEMA_VERSION + 1))
+    assert upgrade(engine) == []
+    assert check_schema_version(engine) == SCHEMA_VERSION
+    tables = set(inspect(engine).get_table_names())
+    assert {'user', 'character', 'schema_version', 'rate_limit_bucket'} <= tables
+
+
+def test_unmigrated_database_refuses_to_boot(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+
+    with pytest.raises(SchemaVersionError):
+        check_schema_version(engine)
+
+
+def test_damaged_schema_version_is_not_mistaken_for_an_empty_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'damaged.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE schema_version (id INTEGER)'))
+
+    with pytest.raises(OperationalError):
+        check_schema_version(engine)
+
+
+def test_progression_rows_are_compressed_in_place(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    upgrade(engine, target=3)
+    with engine.begin() as conn:
+        conn.execute(text(
+            'INSERT INTO "user" '
+            '(id, username, email, password_hash, progression_data, progression_version) '
+            "VALUES ('u1', 'legacy', 'legacy@test.com', 'x', :data, 1)"
+        ), {'data': json.dumps(LEGACY_PROGRESS)})
+
+    upgrade(engine)
+
+    with engine.connect() as conn:
+        raw = conn.execute(text('SELECT progression_data FROM "user"')).scalar()
+    assert is_compressed(raw)
+    assert decompress_json(raw) == LEGACY_PROGRESS
@@ -0,0 +1,199 @@
+"""
+Tests for versioned progression sync
+"""
+import os
+
+import pytest
+
+from backend.database import db
+from backend.models.progression import ProgressionDelta
+from backend.models.user import User
+from backend.services.progression_buffer import ProgressionWriteBuffer, init_progression_buffer
+from backend.services.progression_service import ProgressionService
+from backend.services.json_patch import apply_json_patch, create_merge_patch, merge_patch
+
+
+def test_patch_helpers():
+    doc = {'stars': 3, 'badges': ['first'], 'pets': {'cat': 1}}
+
+    assert merge_patch(doc, {'stars': 4, 'pets': {'cat': None}}) == {
+        'stars': 4, 'badges': ['first'], 'pets': {},
+    }
+    assert create_merge_patch(doc, {'stars': 4, 'badges': ['first']}) == {'stars': 4, 'pets': None}
+    assert apply_json_patch(doc, [
+        {'op': 'add', 'path': '/badges/-', 'value': 'second'},
+        {'op': 'test', 'path': '/stars', 'value': 3},
+        {'op': 'move', 'from': '/pets/cat', 'path': '/cats'},
+    ]) == {'stars': 3, 'badges': ['first', 'second'], 'pets': {}, 'cats': 1}
+
+
+def test_merge_patch_sync_and_since_version(client, auth_headers):
+    response = client.post('/progression/sync-progression', json={'stars': 1, 'badges': []},
+                           headers=auth_headers)
+    assert response.get_json()['version'] == 1
+
+    response = client.post(
+        '/progression/sync-progression', data='{"stars": 2}',
+        content_type='application/merge-patch+json',
+        headers={**auth_headers, 'If-Match': '"1"'},
+    )
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"2"'
+
+    current = client.get('/progression/get-progression', headers=auth_headers).get_json()
+    assert current == {'stars': 2, 'badges': []}
+    delta = client.get('/progression/get-progression?since_version=1',
+                       headers=auth_headers).get_json()
+    assert delta == {'version': 2, 'deltas': [{'version': 2, 'patch': {'stars': 2}}]}
+
+
+def test_stale_if_match_is_rejected(client, auth_headers):
+    client.post('/progression/sync-progression', json={'stars': 1}, headers=auth_headers)
+    client.post('/progression/sync-progression', json={'stars': 2}, headers=auth_headers)
+
+    response = client.post(
+        '/progression/sync-progression', data='[{"op": "replace", "path": "/stars", "value": 9}]',
+        content_type='application/json-patch+json',
+        headers={**auth_headers, 'If-Match': '"1"'},
+    )
+
+    assert response.status_code == 412
+    assert response.get_json()['version'] == 2
+    current = client.get('/progression/get-progression', headers=auth_headers).get_json()
+    assert current == {'stars': 2}
+
+
+@pytest.mark.parametrize('body, content_type', [
+    ('', 'application/json'),
+    ('null', 'application/json'),
+    ('[1, 2]', 'application/json'),
+    ('"stars"', 'application/merge-patch+json'),
+    ('{"op": "remove", "path": "/stars"}', 'application/json-patch+json'),
+])
+def test_sync_without_a_document_is_rejected(client, auth_headers, body, content_type):
+    client.post('/progression/sync-progression', json={'stars': 5, 'badges': ['a']},
+                headers=auth_headers)
+
+    response = client.post('/progression/sync-progression', data=body,
+                           content_type=content_type, headers=auth_headers)
+
+    assert response.status_code == 400
+    current = client.get('/progression/get-progression', headers=auth_headers)
+    assert current.get_json() == {'stars': 5, 'badges': ['a']}
+    assert current.headers['ETag'] == '"1"'
+
+
+def test_unconditional_sync_that_keeps_losing_is_a_conflict(client, auth_headers, monkeypatch):
+    client.post('/progression/sync-progression', json={'stars': 1}, headers=auth_headers)
+    # Every attempt reads a version another writer has already moved past
+    monkeypatch.setattr(ProgressionService, 'get_state', staticmethod(lambda user_id: ({}, 0)))
+
+    response = client.post('/progression/sync-progression', json={'stars': 2},
+                           headers=auth_headers)
+
+    assert response.status_code == 409
+    assert response.get_json()['version'] == 0
+
+
+@pytest.fixture
+def write_buffer(app, tmp_path):
+    buffer = ProgressionWriteBuffer(app, str(tmp_path), flush_interval=3600)
+    app.extensions['progression_buffer'] = buffer
+    yield buffer
+    app.extensions.pop('progression_buffer', None)
+
+
+def test_write_behind_coalesces_syncs(app, client, user, auth_headers, write_buffer):
+    for stars in range(1, 6):
+        client.post('/progression/sync-progression', json={'stars': stars}, headers=auth_headers)
+
+    assert user.progression_version == 0
+    current = client.get('/progression/get-progression', headers=auth_headers).get_json()
+    assert current == {'stars': 5}
+    delta = client.get('/progression/get-progression?since_version=2',
+                       headers=auth_headers).get_json()
+    assert len(delta['deltas']) == 3
+
+    assert write_buffer.flush() == 1
+    db.session.expire_all()
+    assert (user.progression_version, user.progression_data) == (5, {'stars': 5})
+    assert ProgressionDelta.query.filter_by(user_id=user.id).count() == 5
+
+
+def _crash(buffer):
+    # What dying does to a writer: its files close and its lock is released, nothing is flushed
+    buffer._journal.close()
+    buffer._owner.close()
+
+
+def test_write_behind_journal_replays_after_crash(app, client, user, auth_headers, write_buffer,
+                                                  tmp_path):
+    client.post('/progression/sync-progression', json={'stars': 1}, headers=auth_headers)
+    client.post('/progression/sync-progression', data='{"badges": ["first"]}',
+                content_type='application/merge-patch+json', headers=auth_headers)
+    _crash(write_buffer)
+
+    # A new process finds the unflushed journal and writes it through on startup.
+    restarted = ProgressionWriteBuffer(app, str(tmp_path), flush_interval=3600)
+
+    db.session.expire_all()
+    assert user.progression_version == 2
+    assert user.progression_data == {'stars': 1, 'badges': ['first']}
+    assert not os.path.exists(write_buffer.writer_dir)
+    assert restarted.flush() == 0
+
+
+def test_write_behind_workers_keep_their_own_journals(app, tmp_path):
+    users = [User(username=f'worker{n}', email=f'worker{n}@test.com') for n in range(2)]
+    for user in users:
+        user.set_password('password')
+    db.session.add_all(users)
+    db.session.commit()
+    first, second = users[0].id, users[1].id
+    worker_a = ProgressionWriteBuffer(app, str(tmp_path), flush_interval=3600)
+    worker_a.put(first, {'stars': 1}, 1, {'stars': 1})
+    # Starting up next to a live worker leaves its journal alone
+    worker_b = ProgressionWriteBuffer(app, str(tmp_path), flush_interval=3600)
+    worker_b.put(second, {'stars': 2}, 1, {'stars': 2})
+
+    assert worker_b.flush() == 1
+    _crash(worker_a)
+    ProgressionWriteBuffer(app, str(tmp_path), flush_interval=3600)
+
+    db.session.expire_all()
+    assert db.session.get(User, first).progression_data == {'stars': 1}
+    assert db.session.get(User, second).progression_data == {'stars': 2}
+    worker_b.stop()
+    assert not os.path.exists(worker_b.writer_dir)
+
+
+def test_write_behind_flush_keeps_both_writes_of_a_contested_version(app, user, tmp_path):
+    worker_a = ProgressionWriteBuffer(app, str(tmp_path), flush_interval=3600)
+    worker_b = ProgressionWriteBuffer(app, str(tmp_path), flush_interval=3600)
+    # Both built version 1 on the same stored version 0
+    worker_a.put(user.id, {'stars': 1}, 1, {'stars': 1})
+    worker_b.put(user.id, {'badges': ['a']}, 1, {'badges': ['a']})
+
+    assert worker_a.flush() == 1
+    assert worker_b.flush() == 1
+
+    db.session.expire_all()
+    assert user.progression_data == {'stars': 1, 'badges': ['a']}
+    assert user.progression_version == 2
+    assert ProgressionDelta.query.filter_by(user_id=user.id).count() == 2
+    assert (worker_a.stats['conflicts'], worker_b.stats['conflicts']) == (0, 1)
+    # A replayed journal of what is already stored changes nothing
+    worker_b.put(user.id, {'badges': ['a']}, 1, {'badges': ['a']})
+    worker_b.flush()
+    db.session.expire_all()
+    assert user.progression_version == 2
+    worker_a.stop()
+    worker_b.stop()
+
+
+def test_write_behind_is_off_with_several_workers(app, tmp_path):
+    app.config.update(PROGRESSION_WRITE_BEHIND=True, PROGRESSION_JOURNAL_DIR=str(tmp_path),
+                      WEB_CONCURRENCY=2)
+
+    assert init_progression_buffer(app) is None
+    assert 'progression_buffer' not in app.extensions
@@ -0,0 +1,92 @@
+"""
+Tests for token-bucket rate limiting
+"""
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+
+from backend.middleware.proxy import init_proxy_fix
+from backend.middleware.rate_limit import (
+    MemoryBucketStore, RateLimiter, SQLBucketStore, parse_limit,
+)
+from backend.migrations import SchemaVersionError, upgrade
+
+
+def test_bucket_refills_over_time():
+    now = [0.0]
+    store = MemoryBucketStore(clock=lambda: now[0])
+    capacity, rate = parse_limit('2/10')
+
+    assert store.take('k', capacity, rate) == 0
+    assert store.take('k', capacity, rate) == 0
+    assert store.take('k', capacity, rate) == 5.0
+
+    now[0] += 5
+    assert store.take('k', capacity, rate) == 0
+
+
+def test_sql_store_is_shared_between_workers(tmp_path):
+    url = f"sqlite:///{tmp_path / 'buckets.db'}"
+    with pytest.raises(SchemaVersionError):
+        SQLBucketStore(url)  # workers never create the table themselves
+    upgrade(create_engine(url))
+    worker_a, worker_b = SQLBucketStore(url), SQLBucketStore(url)
+    capacity, rate = parse_limit('1/60')
+
+    assert worker_a.take('text:ip:1.2.3.4', capacity, rate) == 0
+    assert worker_b.take('text:ip:1.2.3.4', capacity, rate) > 0
+
+
+def test_rejection_by_a_later_bucket_gives_earlier_tokens_back():
+    store = MemoryBucketStore(clock=lambda: 0.0)
+    limiter = RateLimiter(store, user_limits={'text': '10/60'}, ip_limits={'text': '3/60'},
+                          rolling_quota={'text': 1})
+
+    assert limiter.check('text', user_id='u1', ip='10.0.0.1') == 0
+    # Over quota: retrying must not drain the IP bucket shared behind a school NAT
+    for _ in range(5):
+        assert limiter.check('text', user_id='u1', ip='10.0.0.1') > 0
+    assert limiter.rejected == {'text': 5}
+    assert [limiter.check('text', user_id=f'u{n}', ip='10.0.0.1') for n in (2, 3)] == [0, 0]
+    assert limiter.check('text', user_id='u4', ip='10.0.0.1') > 0
+    assert store.take('text:user:u1', *parse_limit('10/60'), cost=0) == 0
+    assert store._buckets['text:user:u1'][0] == 9.0
+
+
+def test_generate_story_returns_429_with_retry_after(app, client):
+    app.extensions['rate_limiter'].ip_limits['text'] = parse_limit('2/60')
+
+    target = 'backend.routes.story_routes.story_generation_service.generate_story'
+    with patch(target) as mock_generate_story:
+        mock_generate_story.return_value = (
+            "[TITLE: Limited]\nA story.\n[WISDOM GEM: Wait your turn]"
+        )
+        statuses = [
+            client.post('/story/generate-story', json={'character': 'Looper'}).status_code
+            for _ in range(3)
+        ]
+
+    assert statuses == [200, 200, 429]
+    response = client.post('/story/generate-story', json={'character': 'Looper'})
+    assert int(response.headers['Retry-After']) >= 1
+    assert mock_generate_story.call_count == 2
+
+
+def test_per_ip_limits_use_the_client_address_behind_the_proxy(app, client):
+    app.config['PROXY_COUNT'] = 1
+    init_proxy_fix(app)
+    app.extensions['rate_limiter'].ip_limits['text'] = parse_limit('1/60')
+
+    def status(forwarded_for):
+        target = 'backend.routes.story_routes.story_generation_service.generate_story'
+        with patch(target, return_value="[TITLE: Proxied]\nA story."):
+            return client.post('/story/generate-story', json={'character': 'Hopper'},
+                               headers={'X-Forwarded-For': forwarded_for}).status_code
+
+    assert status('203.0.113.7') == 200
+    assert status('203.0.113.7') == 429
+    # Another client behind the same proxy has its own bucket
+    assert status('198.51.100.2') == 200
+    # Only the entry the proxy appended is trusted, not one the client made up
+    assert status('198.51.100.99, 203.0.113.7') == 429
@@ -0,0 +1,77 @@
+"""
+Tests for read-replica routing
+"""
+import uuid
+
+import pytest
+from flask import Flask
+
+from backend.database import db as _db
+from backend.middleware.read_replica import ReplicaRouter, STICKY_COOKIE, init_read_replica
+from backend.models.character import Character
+from backend.routes.character_routes import character_bp
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+        SQLALCHEMY_BINDS={'replica': f"sqlite:///{tmp_path / 'replica.db'}"},
+        TESTING=True,
+    )
+    _db.init_app(app)
+    init_read_replica(app)
+    app.register_blueprint(character_bp, url_prefix='/character')
+
+    with app.app_context():
+        _db.create_all()
+        # The replica is a separate database here, so seed it with a row the
+        # primary does not have to see which one served the read.
+        with _db.engines['replica'].begin() as conn:
+            Character.__table__.create(conn)
+            conn.execute(Character.__table__.insert().values(
+                id=str(uuid.uuid4()), name='Replica Only', age=6,
+            ))
+        yield app
+        _db.session.remove()
+    # init_app registered metadata for the bind on the shared db object
+    _db.metadatas.pop('replica', None)
+
+
+def test_router_stickiness_window():
+    now = [1000.0]
+    router = ReplicaRouter(sticky_seconds=5, clock=lambda: now[0])
+
+    router.mark_write('user:1')
+    assert router.is_sticky('user:1')
+    assert not router.is_sticky('user:2')
+    assert router.is_sticky('user:2', cookie_until=1003.0)
+
+    now[0] += 6
+    assert not router.is_sticky('user:1')
+
+
+def test_reads_go_to_replica_until_a_write(replica_app):
+    client = replica_app.test_client()
+
+    names = [c['name'] for c in client.get('/character/get-characters').get_json()]
+    assert names == ['Replica Only']
+
+    response = client.post('/character/create-character', json={'name': 'Fresh', 'age': 7})
+    assert response.status_code == 201
+    assert STICKY_COOKIE in response.headers.get('Set-Cookie', '')
+
+    # Read-your-writes: the writer is pinned to the primary for a while.
+    names = [c['name'] for c in client.get('/character/get-characters').get_json()]
+    assert names == ['Fresh']
+
+
+def test_lagging_replica_falls_back_to_primary(replica_app):
+    router = replica_app.extensions['read_replica']
+    router.max_lag_seconds = 1.0
+    router._lag, router._lag_checked_at = 30.0, router._clock()
+
+    response = replica_app.test_client().get('/character/get-characters')
+    names = [c['name'] for c in response.get_json()]
+    assert names == []
@@ -0,0 +1,318 @@
+"""
+Tests for narration caching and the TTS endpoints
+"""
+import io
+import os
+import re
+import threading
+import wave
+
+import pytest
+
+from backend.audio import join_audio, mp3_duration, mp3_frame_length
+from backend.disk_cache import DiskCache, content_key
+from backend.services.narration_service import init_narration
+from backend.services.pre_narration import PreNarrator
+from backend.ssml import compile_ssml
+from backend.tts_backends import GOOGLE_TTS_AVAILABLE, StubTTSBackend
+from backend.tts_service import MAX_INPUT_BYTES, MockTTSService, TTSService
+
+FAKE_MP3 = b'\xff\xf3\x44\xc0' + b'\x00' * 92
+
+
+class CountingTTSService(MockTTSService):
+    def __init__(self, cache=None):
+        super().__init__(cache=cache)
+        self.calls = 0
+
+    def _synthesize(self, synthesis_text, use_ssml, voice_name, speaking_rate, pitch,
+                    audio_encoding="MP3"):
+        self.calls += 1
+        return FAKE_MP3
+
+    def _synthesize_timed(self, ssml, voice_name, speaking_rate, pitch):
+        names = re.findall(r'<mark name="([^"]+)"/>', ssml)
+        audio = self._synthesize(ssml, True, voice_name, speaking_rate, pitch)
+        return audio, [(n, i / 100) for i, n in enumerate(names)]
+
+
+@pytest.fixture
+def tts(app, tmp_path):
+    app.config['TTS_CACHE_DIR'] = str(tmp_path / 'tts')
+    init_narration(app)
+    state = app.extensions['narration']
+    state['service'] = CountingTTSService(cache=state['cache'])
+    return state['service']
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=350)
+    keys = [content_key('clip', i) for i in range(3)]
+    for age, key in enumerate(keys):
+        path = cache.put(key, b'x' * 100)
+        os.utime(path, (1000 + age, 1000 + age))
+    cache.get(keys[0])  # most recently used now
+
+    cache.put(content_key('clip', 3), b'x' * 100)
+
+    assert [cache.contains(key) for key in keys] == [True, False, True]
+    leftovers = [name for _, _, files in os.walk(tmp_path) for name in files]
+    assert not [name for name in leftovers if name.startswith('.tmp-')]
+
+
+def test_disk_cache_counts_an_overwritten_key_once(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    kept, rewritten = content_key('clip', 0), content_key('clip', 1)
+    cache.put(kept, b'x' * 100)
+    for _ in range(3):
+        cache.put(rewritten, b'x' * 100)
+
+    assert cache._size == 200
+    assert cache.contains(kept) and cache.contains(rewritten)
+    assert cache.evictions == 0
+
+
+def test_generate_speech_synthesizes_identical_audio_once(tts):
+    assert tts.generate_speech('Once upon a time.') == FAKE_MP3
+    assert tts.generate_speech('Once upon a time.') == FAKE_MP3
+    assert tts.generate_speech('Once upon a time.', speaking_rate=0.9) == FAKE_MP3
+
+    assert tts.calls == 2
+    assert tts.cache.stats()['hits'] == 1
+    assert tts.cache.stats()['bytes_saved'] == len(FAKE_MP3)
+
+
+def test_narrate_and_serve_cached_audio(client, tts):
+    body = {'text': 'The dragon yawned.', 'voice': 'en-US-Neural2-C'}
+    first = client.post('/tts/narrate', json=body).get_json()
+    second = client.post('/tts/narrate', json=body).get_json()
+
+    assert (first['cached'], second['cached'], first['key']) == (False, True, second['key'])
+    assert tts.calls == 1
+
+    audio = client.get(first['audio_url'])
+    assert audio.status_code == 200
+    assert audio.data == FAKE_MP3
+    assert audio.mimetype == 'audio/mpeg'
+    assert 'immutable' in audio.headers['Cache-Control']
+    revalidated = client.get(first['audio_url'], headers={'If-None-Match': f'"{first["key"]}"'})
+    assert revalidated.status_code == 304
+
+    assert client.get('/tts/audio/not-a-key').status_code == 404
+    assert client.post('/tts/narrate', json={'text': 'Hi', 'speaking_rate': 9}).status_code == 400
+    assert client.get('/metrics').get_json()['tts_cache']['hit_ratio'] == 0.5
+
+
+def _mp3_with_metadata(payload):
+    id3 = b'ID3\x04\x00\x00\x00\x00\x00\x05' + b'\x00' * 5
+    xing = b'\xff\xf3\x44\xc4' + b'\x00' * 9 + b'Xing' + b'\x00' * 79
+    return id3 + xing + payload
+
+
+def test_join_audio_strips_per_segment_metadata():
+    frame_a, frame_b = FAKE_MP3, b'\xff\xf3\x44\xc0' + b'\x01' * 92
+
+    assert mp3_frame_length(frame_a) == 96
+    joined = join_audio([_mp3_with_metadata(frame_a), _mp3_with_metadata(frame_b)], 'MP3')
+    assert joined == frame_a + frame_b
+
+    def wav(samples):
+        out = io.BytesIO()
+        with wave.open(out, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(24000)
+            w.writeframes(samples)
+        return out.getvalue()
+
+    audio = join_audio([wav(b'\x01\x00' * 10), wav(b'\x02\x00' * 5)], 'LINEAR16')
+    with wave.open(io.BytesIO(audio)) as joined:
+        assert joined.getnframes() == 15
+
+
+def test_split_text_keeps_every_character(tts):
+    text = ('...and then the owl flew away. "Hoo?" it asked (quietly.)  Then: silence\n\n'
+            'Zzz' + 'z' * 400 + '. The end')
+    assert tts.split_text(text, max_bytes=200)[0].startswith('<speak>...and then the owl')
+    pieces = tts.split_text(text, use_ssml=False, max_bytes=120)
+    assert re.sub(r'\s', '', ''.join(pieces)) == re.sub(r'\s', '', text)
+    assert all(len(piece.encode()) <= 120 for piece in pieces)
+
+
+def test_long_story_is_split_and_only_edited_paragraphs_resynthesized(tts):
+    paragraphs = [f"Paragraph {i} begins. " + "The fox ran. " * 20 for i in range(4)]
+    chunks = tts.split_text("\n\n".join(paragraphs * 20))
+    assert len(chunks) == 80
+    assert all(len(chunk.encode()) <= MAX_INPUT_BYTES for chunk in chunks)
+    for run_on in (" ".join(["Run on"] * 500), "Brrr" + "r" * 1000 + "!"):
+        assert all(len(c.encode()) <= 300 for c in tts.split_text(run_on, max_bytes=300))
+
+    story = "\n\n".join(paragraphs)
+    assert tts.generate_speech(story) == FAKE_MP3 * 4
+    assert tts.calls == 4
+
+    edited = "\n\n".join(paragraphs[:2] + ["A brand new ending."] + paragraphs[3:])
+    tts.generate_speech(edited)
+    assert tts.calls == 5
+
+
+def test_stream_starts_with_first_sentence_and_caches_the_whole(client, tts, monkeypatch):
+    release = threading.Event()
+    synthesize = tts._synthesize
+
+    def gated(synthesis_text, *args):
+        if 'Once upon a time.' not in synthesis_text:
+            assert release.wait(5)
+        return synthesize(synthesis_text, *args)
+
+    monkeypatch.setattr(tts, '_synthesize', gated)
+    story = "Once upon a time. A fox lived in a den.\n\nThe end."
+
+    response = client.post('/tts/narrate/stream', json={'text': story})
+    body = iter(response.response)
+    assert response.is_streamed and next(body) == FAKE_MP3  # before later chunks could finish
+    release.set()
+    assert b''.join(body) == FAKE_MP3 * 2
+    assert tts.calls == 3
+
+    cached = client.post('/tts/narrate/stream', json={'text': story})
+    assert cached.data == FAKE_MP3 * 3 and tts.calls == 3
+    assert client.post('/tts/narrate', json={'text': story}).get_json()['cached'] is True
+
+
+def test_stream_is_aborted_when_a_chunk_fails(client, tts, monkeypatch, caplog):
+    synthesize = tts._synthesize
+    monkeypatch.setattr(tts, '_synthesize',
+                        lambda text, *args: b'' if 'The end' in text else synthesize(text, *args))
+    story = "Once upon a time. A fox lived in a den.\n\nThe end."
+
+    response = client.post('/tts/narrate/stream', json={'text': story})
+    body = iter(response.response)
+    assert next(body) == FAKE_MP3
+    with pytest.raises(RuntimeError):
+        b''.join(body)
+    assert 'produced no audio' in caplog.text
+    key = tts.speech_key(story, 'en-US-Neural2-F', 1.0, 0.0, True, 'MP3')
+    assert tts.cache.path_for(key) is None
+
+
+def test_compile_ssml_escapes_and_marks_in_one_pass():
+    compiled = compile_ssml('Tom & Jerry <3 cheese. "Yum, yum!" said Tom')
+    assert compiled.ssml == (
+        '<speak>Tom &amp; Jerry &lt;3 cheese.<break time="800ms"/> '
+        '<emphasis level="moderate">Yum,<break time="400ms"/> yum!</emphasis> said Tom</speak>'
+    )
+
+    words = compile_ssml('The "big" fox.', marks='word', first_index=7)
+    assert words.ssml == ('<speak><mark name="w7"/>The '
+                          '<emphasis level="moderate"><mark name="w8"/>big</emphasis> '
+                          '<mark name="w9"/>fox.</speak>')
+    assert [m.text for m in words.marks] == ['The', 'big', 'fox'] and words.next_index == 10
+
+    sentences = compile_ssml('One fish. Two "fish"', marks='sentence')
+    assert [(m.name, m.text) for m in sentences.marks] == [
+        ('s0', 'One fish.'), ('s1', 'Two "fish"'),
+    ]
+
+
+def test_narrate_with_sentence_timepoints(client, tts):
+    story = "The moon rose. The owl woke.\n\nEveryone slept."
+    result = client.post('/tts/narrate', json={'text': story, 'marks': 'sentence'}).get_json()
+
+    timepoints = client.get(result['timepoints_url']).get_json()['marks']
+    assert [(m['text'], m['time']) for m in timepoints] == [
+        ('The moon rose.', 0.0), ('The owl woke.', 0.01), ('Everyone slept.', 0.024),
+    ]
+    again = client.post('/tts/narrate', json={'text': story, 'marks': 'sentence'}).get_json()
+    assert again['cached'] is True
+    assert client.post('/tts/narrate', json={'text': story, 'marks': 'letters'}).status_code == 400
+
+
+def test_stub_backend_produces_correctly_timed_audio():
+    stub = StubTTSBackend(words_per_minute=120)
+    ssml = compile_ssml('One two three four. Five six.', marks='sentence').ssml
+
+    audio, marks = stub.synthesize_timed(ssml, 'en-US-Neural2-F', 1.0, 0.0)
+
+    assert marks == [('s0', 0.0), ('s1', 2.8)]  # four words at 0.5s + an 800ms pause
+    assert mp3_duration(audio) == pytest.approx(3.8, abs=0.03)
+    audio = stub.synthesize(ssml, True, 'en-US-Neural2-F', 2.0, 0.0, 'LINEAR16')
+    with wave.open(io.BytesIO(audio)) as wav:
+        assert wav.getnframes() / wav.getframerate() == pytest.approx(2.3, abs=0.01)
+
+
+def test_narration_backend_selection(app, client, tmp_path):
+    app.config.update(TTS_CACHE_DIR=str(tmp_path / 'tts'), TTS_BACKEND='stub')
+    init_narration(app)
+    story = "The moon rose.\n\nThe owl woke."
+
+    response = client.post('/tts/narrate/stream', json={'text': story})
+    assert mp3_duration(response.data) > 1.0
+    assert client.post('/tts/narrate', json={'text': story}).get_json()['cached'] is True
+
+    if not GOOGLE_TTS_AVAILABLE:
+        app.config['TTS_BACKEND'] = 'google'
+        init_narration(app)
+        assert client.post('/tts/narrate', json={'text': story}).status_code == 503
+
+
+def test_generated_story_is_pre_narrated_when_requested(app, client, tmp_path, monkeypatch):
+    from backend.routes import story_routes
+    app.config.update(TTS_CACHE_DIR=str(tmp_path / 'tts'), TTS_BACKEND='stub', PRE_NARRATION=True)
+    init_narration(app)
+    monkeypatch.setattr(story_routes.story_generation_service, 'generate_story',
+                        lambda prompt: "[TITLE: Moonrise]\nThe moon rose. The owl woke.\n"
+                                       "[WISDOM GEM: Rest well.]")
+
+    plain = client.post('/story/generate-story', json={'character': 'Mia'}).get_json()
+    assert 'audio_url' not in plain
+
+    story = client.post('/story/generate-story', json={
+        'character': 'Mia', 'narration': {'voice': 'en-GB-Neural2-A'},
+    }).get_json()
+    response = client.get(story['audio_url'] + '?wait=5')
+    assert response.status_code == 200
+    assert mp3_duration(response.data) > 1.0
+
+    narrated = client.post('/tts/narrate', json={
+        'text': story['story_text'], 'voice': 'en-GB-Neural2-A',
+    }).get_json()
+    assert narrated['cached'] is True and narrated['audio_url'] == story['audio_url']
+
+
+def test_requested_audio_jumps_the_pre_narration_queue(app, client, tmp_path):
+    class GatedBackend(StubTTSBackend):
+        def __init__(self):
+            super().__init__()
+            self.gate = threading.Event()
+            self.spoken = []
+
+        def synthesize(self, synthesis_text, *args, **kwargs):
+            self.gate.wait(5)
+            self.spoken.append(synthesis_text)
+            return super().synthesize(synthesis_text, *args, **kwargs)
+
+    app.config['TTS_CACHE_DIR'] = str(tmp_path / 'tts')
+    init_narration(app)
+    state = app.extensions['narration']
+    backend = GatedBackend()
+    service = TTSService(cache=state['cache'], max_workers=1, backend=backend)
+    narrator = state['pre_narrator'] = PreNarrator(service)
+
+    narrator.submit('First story.')
+    while not narrator.snapshot()['running']:
+        threading.Event().wait(0.01)
+    narrator.submit('Second story.')
+    third = narrator.submit('Third story.')
+
+    pending = client.get(f'/tts/audio/{third}')
+    assert pending.status_code == 202
+    assert pending.headers['Retry-After'] == '1'
+    assert narrator.snapshot()['promoted'] == 1
+
+    backend.gate.set()
+    assert client.get(f'/tts/audio/{third}?wait=5').status_code == 200
+    assert narrator.wait(narrator.submit('Second story.'), 5)
+    spoken = [text.split()[0][len('<speak>'):] for text in backend.spoken]
+    assert spoken == ['First', 'Third', 'Second']
+    narrator.stop()
@@ -0,0 +1,245 @@
+"""
+Speech synthesis backends for TTSService
+Selected with TTS_BACKEND: "google" (Cloud Text-to-Speech) or "stub"
+
+Every backend implements:
+    synthesize(synthesis_text, use_ssml, voice_name, speaking_rate, pitch, audio_encoding) -> bytes
+    synthesize_timed(ssml, voice_name, speaking_rate, pitch) -> (mp3 bytes, [(mark name, seconds)])
+
+The Google SDK (gRPC and protobuf, slow to import) is only looked for at
+import time and imported on first use. Its clients (each a gRPC channel with
+its own TLS handshake) are created once per process on first use and shared
+by every TTSService.
+gRPC channels do not survive fork, so they are dropped in forked children
+and recreated there; call warm() from a post-fork hook to pay the connection
+cost before the first request.
+
+The stub backend needs no network or credentials. It returns valid silent
+MP3 (or a quiet tone as LINEAR16) whose length matches how long the text
+would take to read aloud, and times <mark> tags along the way, so load
+tests and offline development exercise the real chunking, caching and
+streaming paths.
+"""
+
+import importlib
+import io
+import math
+import os
+import re
+import struct
+import threading
+import time
+import wave
+from importlib.util import find_spec
+from typing import List, Tuple
+
+
+def _installed(module: str) -> bool:
+    try:
+        return find_spec(module) is not None
+    except ImportError:  # a parent package is missing
+        return False
+
+
+# Google Cloud TTS is optional; whether it is installed is known without importing it
+GOOGLE_TTS_AVAILABLE = _installed("google.cloud.texttospeech")
+# Timepoints for <mark> tags are only exposed by the v1beta1 API
+_SDK_MODULES = {"v1": "google.cloud.texttospeech", "v1beta1": "google.cloud.texttospeech_v1beta1"}
+
+
+def _sdk(api: str = "v1"):
+    """The texttospeech module for api, imported on first use"""
+    return importlib.import_module(_SDK_MODULES[api])
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _reset_clients():
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients)
+
+
+def shared_client(api: str = "v1"):
+    """The process-wide TextToSpeechClient for api ("v1" or "v1beta1")"""
+    client = _clients.get(api)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(api)
+            if client is None:
+                client = _clients[api] = _sdk(api).TextToSpeechClient()
+    return client
+
+
+def warm():
+    """Open the Google TTS channel now (e.g. from gunicorn's post_fork), not on first request"""
+    if GOOGLE_TTS_AVAILABLE:
+        threading.Thread(target=shared_client, name="tts-warmup", daemon=True).start()
+
+
+def _language_code(voice_name: str) -> str:
+    # "en-GB-Neural2-A" -> "en-GB"; the voice and language must agree
+    return "-".join(voice_name.split("-")[:2]) or "en-US"
+
+
+class GoogleTTSBackend:
+    name = "google"
+
+    def __init__(self):
+        if not GOOGLE_TTS_AVAILABLE:
+            raise ImportError(
+                "Google Cloud Text-to-Speech is not available. "
+                "Install it with: pip install google-cloud-texttospeech"
+            )
+
+    @property
+    def client(self):
+        return shared_client("v1")
+
+    def synthesize(self, synthesis_text: str, use_ssml: bool, voice_name: str,
+                   speaking_rate: float, pitch: float, audio_encoding: str = "MP3") -> bytes:
+        texttospeech = _sdk("v1")
+        # Prepare input
+        if use_ssml:
+            synthesis_input = texttospeech.SynthesisInput(ssml=synthesis_text)
+        else:
+            synthesis_input = texttospeech.SynthesisInput(text=synthesis_text)
+
+        # Voice configuration
+        voice = texttospeech.VoiceSelectionParams(
+            language_code=_language_code(voice_name),
+            name=voice_name,
+        )
+
+        # Audio configuration
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=getattr(texttospeech.AudioEncoding, audio_encoding),
+            speaking_rate=speaking_rate,
+            pitch=pitch,
+        )
+
+        # Generate speech
+        response = self.client.synthesize_speech(
+            input=synthesis_input,
+            voice=voice,
+            audio_config=audio_config,
+        )
+        return response.audio_content
+
+    def synthesize_timed(self, ssml: str, voice_name: str, speaking_rate: float,
+                         pitch: float) -> Tuple[bytes, List[Tuple[str, float]]]:
+        if not _installed(_SDK_MODULES["v1beta1"]):
+            raise ImportError(
+                "Read-along timepoints need google-cloud-texttospeech with the v1beta1 API"
+            )
+        texttospeech_v1beta1 = _sdk("v1beta1")
+        response = shared_client("v1beta1").synthesize_speech(
+            request=texttospeech_v1beta1.SynthesizeSpeechRequest(
+                input=texttospeech_v1beta1.SynthesisInput(ssml=ssml),
+                voice=texttospeech_v1beta1.VoiceSelectionParams(
+                    language_code=_language_code(voice_name), name=voice_name),
+                audio_config=texttospeech_v1beta1.AudioConfig(
+                    audio_encoding=texttospeech_v1beta1.AudioEncoding.MP3,
+                    speaking_rate=speaking_rate,
+                    pitch=pitch,
+                ),
+                enable_time_pointing=[
+                    texttospeech_v1beta1.SynthesizeSpeechRequest.TimepointType.SSML_MARK,
+                ],
+            )
+        )
+        timepoints = [(tp.mark_name, tp.time_seconds) for tp in response.timepoints]
+        return response.audio_content, timepoints
+
+
+# One silent MPEG-2 Layer III frame: 24 kHz mono 32 kbps, 576 samples (24 ms) in 96 bytes
+SILENT_MP3_FRAME = b"\xff\xf3\x44\xc4" + b"\x00" * 92
+SILENT_MP3_FRAME_SECONDS = 576 / 24000
+STUB_SAMPLE_RATE = 24000
+
+_SSML_TOKEN_RE = re.compile(r'<mark name="([^"]*)"\s*/>|<break time="(\d+)ms"\s*/>|<[^>]*>|[^<\s]+')
+
+
+class StubTTSBackend:
+    """Offline backend producing correctly timed silent (or tone) audio"""
+
+    name = "stub"
+
+    def __init__(self, words_per_minute: float = 165.0, latency: float = 0.0, tone_hz: float = 0.0):
+        """
+        Args:
+            words_per_minute: Reading speed at speaking_rate 1.0
+            latency: Seconds to sleep per request, to imitate the network call
+            tone_hz: Tone frequency for LINEAR16 output (0 = silence)
+        """
+        self.words_per_minute = words_per_minute
+        self.latency = latency
+        self.tone_hz = tone_hz
+
+    def timeline(self, synthesis_text: str,
+                 speaking_rate: float = 1.0) -> Tuple[float, List[Tuple[str, float]]]:
+        """(total seconds, [(mark name, seconds)]) for reading synthesis_text aloud"""
+        seconds_per_word = 60.0 / (self.words_per_minute * max(speaking_rate, 0.25))
+        elapsed, marks = 0.0, []
+        for m in _SSML_TOKEN_RE.finditer(synthesis_text):
+            mark, pause = m.group(1), m.group(2)
+            if mark is not None:
+                marks.append((mark, round(elapsed, 3)))
+            elif pause is not None:
+                elapsed += int(pause) / 1000
+            elif not m.group().startswith("<"):
+                elapsed += seconds_per_word
+        return elapsed, marks
+
+    def synthesize(self, synthesis_text: str, use_ssml: bool, voice_name: str,
+                   speaking_rate: float, pitch: float, audio_encoding: str = "MP3") -> bytes:
+        if self.latency:
+            time.sleep(self.latency)
+        duration, _ = self.timeline(synthesis_text, speaking_rate)
+        if audio_encoding == "LINEAR16":
+            return self._wav(duration)
+        return SILENT_MP3_FRAME * max(1, math.ceil(duration / SILENT_MP3_FRAME_SECONDS))
+
+    def synthesize_timed(self, ssml: str, voice_name: str, speaking_rate: float,
+                         pitch: float) -> Tuple[bytes, List[Tuple[str, float]]]:
+        _, marks = self.timeline(ssml, speaking_rate)
+        return self.synthesize(ssml, True, voice_name, speaking_rate, pitch), marks
+
+    def _wav(self, duration: float) -> bytes:
+        frames = max(1, round(duration * STUB_SAMPLE_RATE))
+        if self.tone_hz:
+            step = 2 * math.pi * self.tone_hz / STUB_SAMPLE_RATE
+            tone = (int(3000 * math.sin(i * step)) for i in range(frames))
+            samples = struct.pack(f"<{frames}h", *tone)
+        else:
+            samples = b"\x00\x00" * frames
+        out = io.BytesIO()
+        with wave.open(out, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(STUB_SAMPLE_RATE)
+            writer.writeframes(samples)
+        return out.getvalue()
+
+
+BACKENDS = {
+    GoogleTTSBackend.name: GoogleTTSBackend,
+    StubTTSBackend.name: StubTTSBackend,
+}
+
+
+def create_backend(name: str = "google", **options):
+    """Instantiate the backend registered under name; raises ImportError if it cannot run here"""
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown TTS backend {name!r}; choose one of {sorted(BACKENDS)}"
+        ) from None
+    return backend_class(**options)
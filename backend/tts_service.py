@@ -3,49 +3,127 @@ Google Cloud Text-to-Speech Service
 Provides high-quality, natural-sounding narration for stories
 """
 
+import json
+import logging
 import os
-from typing import Optional, List
+from typing import Iterator, Optional, List, Tuple
 import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.audio import join_audio, join_mp3, mp3_duration
+from backend.disk_cache import DiskCache, content_key
+from backend.ssml import compile_ssml
+
+# Re-exported for callers that check availability before constructing TTSService
+from backend.tts_backends import GOOGLE_TTS_AVAILABLE, StubTTSBackend, create_backend  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# Google rejects synthesis input over 5000 bytes (SSML markup included)
+MAX_INPUT_BYTES = 5000
+
+# Where a sentence ends: its punctuation, closing quotes or brackets and the space after
+_SENTENCE_END_RE = re.compile(r'[.!?]+["\')\]]*\s+')
+_executor_lock = threading.Lock()
+
+
+def _sentences(paragraph: str) -> List[str]:
+    """Paragraph cut after each sentence; the pieces join back to exactly the paragraph"""
+    sentences, start = [], 0
+    for match in _SENTENCE_END_RE.finditer(paragraph):
+        sentences.append(paragraph[start:match.end()])
+        start = match.end()
+    if start < len(paragraph):
+        sentences.append(paragraph[start:])
+    return sentences
+
+
+def _cut_word(word: str, fits) -> List[str]:
+    """A word too long for one input, cut between characters into pieces that fit"""
+    pieces, current = [], ""
+    for char in word:
+        if current and not fits(current + char):
+            pieces.append(current)
+            current = ""
+        current += char
+    return pieces + [current]
+
+
+def _pack(sentences: List[str], render, max_bytes: int, suffix: str = "") -> List[str]:
+    """Greedily join sentences into pieces whose rendered input fits max_bytes"""
+    def fits(piece):
+        return len(render(piece + suffix).encode("utf-8")) <= max_bytes
+
+    pieces, current = [], ""
+    for sentence in sentences:
+        if fits(current + sentence):
+            current += sentence
+            continue
+        if current:
+            pieces.append(current.strip())
+        if fits(sentence):
+            current = sentence
+            continue
+        # A single sentence over the limit: fall back to word boundaries
+        current = ""
+        for word in sentence.split(" "):
+            candidate = f"{current} {word}" if current else word
+            if current and not fits(candidate):
+                pieces.append(current.strip())
+                candidate = word
+            if not fits(candidate):
+                *cut, candidate = _cut_word(candidate, fits)
+                pieces.extend(cut)
+            current = candidate
+    if current.strip():
+        pieces.append(current.strip())
+    return pieces
+
+
+def _split_pieces(text: str, render, max_bytes: int, lead_sentence: bool = False) -> List[str]:
+    """Story text cut into paragraphs (long ones into sentences) that render within max_bytes"""
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text.strip()) if p.strip()]
+    paragraphs = paragraphs or [text.strip()]
+
+    pieces = []
+    for index, paragraph in enumerate(paragraphs):
+        # A trailing space keeps the end-of-sentence pause between paragraphs.
+        suffix = "" if index == len(paragraphs) - 1 else " "
+        sentences = _sentences(paragraph)
+        if lead_sentence and index == 0 and len(sentences) > 1:
+            pieces.extend(piece + " " for piece in _pack(sentences[:1], render, max_bytes, " "))
+            sentences = sentences[1:]
+        pieces.extend(piece + suffix for piece in _pack(sentences, render, max_bytes, suffix))
+    return pieces
 
-# Try to import Google Cloud TTS, but don't fail if it's not available
-try:
-    from google.cloud import texttospeech
-    GOOGLE_TTS_AVAILABLE = True
-except ImportError:
-    GOOGLE_TTS_AVAILABLE = False
-    texttospeech = None  # Placeholder for type hints
 
 class TTSService:
-    def __init__(self):
-        """Initialize Google Cloud TTS client"""
-        if not GOOGLE_TTS_AVAILABLE:
-            raise ImportError(
-                "Google Cloud Text-to-Speech is not available. "
-                "Install it with: pip install google-cloud-texttospeech"
-            )
-        self.client = texttospeech.TextToSpeechClient()
+    ENCODING = "MP3"
+
+    def __init__(self, cache: Optional[DiskCache] = None, max_workers: int = 4, backend=None):
+        """Initialize the TTS service
+
+        Args:
+            cache: Optional audio cache; identical requests are then synthesized once
+            max_workers: Concurrent synthesis requests for long stories
+            backend: Synthesis backend (see tts_backends); defaults to Google Cloud TTS,
+                which raises ImportError when the client library is missing
+        """
+        self.backend = backend if backend is not None else create_backend("google")
+        self.cache = cache
+        self.max_workers = max_workers
+        self._pool = None
 
     def add_natural_pauses(self, text: str) -> str:
         """
         Add SSML markup for natural pauses and emphasis
         Makes the narration sound more human
-        """
-        # Add longer pause after periods (end of sentences)
-        text = re.sub(r'\.(\s+)', '.<break time="800ms"/>\\1', text)
-
-        # Add pause after commas
-        text = re.sub(r',(\s+)', ',<break time="400ms"/>\\1', text)
-
-        # Add pause after exclamation/question marks
-        text = re.sub(r'!(\s+)', '!<break time="800ms"/>\\1', text)
-        text = re.sub(r'\?(\s+)', '?<break time="800ms"/>\\1', text)
 
-        # Add emphasis to dialogue (words in quotes)
-        text = re.sub(r'"([^"]+)"', r'<emphasis level="moderate">\1</emphasis>', text)
-
-        # Wrap in SSML speak tags
-        ssml = f'<speak>{text}</speak>'
-        return ssml
+        Compiled in one pass by backend.ssml, which also escapes &, < and >
+        """
+        return compile_ssml(text).ssml
 
     def generate_speech(
         self,
@@ -54,7 +132,8 @@ class TTSService:
         speaking_rate: float = 1.0,
         pitch: float = 0.0,
         use_ssml: bool = True,
-        output_path: Optional[str] = None
+        output_path: Optional[str] = None,
+        audio_encoding: str = "MP3",
     ) -> bytes:
         """
         Generate speech audio from text
@@ -65,44 +144,231 @@ class TTSService:
             speaking_rate: Speed (0.25 to 4.0, default 1.0)
             pitch: Voice pitch (-20.0 to 20.0, default 0.0)
             use_ssml: Whether to add natural pauses and emphasis
-            output_path: Optional path to save MP3 file
+            output_path: Optional path to save the audio file
+            audio_encoding: "MP3" or "LINEAR16" (WAV)
+
+        Long stories are split into chunks under the per-request input limit
+        and synthesized concurrently; see split_text.
 
         Returns:
-            Audio content as bytes (MP3 format)
+            Audio content as bytes (MP3 format unless audio_encoding says otherwise)
         """
-        # Prepare input
-        if use_ssml:
-            ssml_text = self.add_natural_pauses(text)
-            synthesis_input = texttospeech.SynthesisInput(ssml=ssml_text)
-        else:
-            synthesis_input = texttospeech.SynthesisInput(text=text)
-
-        # Voice configuration
-        voice = texttospeech.VoiceSelectionParams(
-            language_code="en-US",
-            name=voice_name,
-        )
-
-        # Audio configuration
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=speaking_rate,
-            pitch=pitch,
-        )
-
-        # Generate speech
-        response = self.client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=audio_config,
-        )
+        key = self.speech_key(text, voice_name, speaking_rate, pitch, use_ssml, audio_encoding)
+        audio = self.cache.get(key) if self.cache is not None else None
+        if audio is None:
+            audio = self._synthesize_long(text, voice_name, speaking_rate, pitch, use_ssml,
+                                          audio_encoding)
+            if self.cache is not None and audio:
+                self.cache.put(key, audio)
 
         # Optionally save to file
         if output_path:
             with open(output_path, "wb") as out:
-                out.write(response.audio_content)
+                out.write(audio)
 
-        return response.audio_content
+        return audio
+
+    def narrate(
+        self,
+        text: str,
+        voice_name: str = "en-US-Neural2-F",
+        speaking_rate: float = 1.0,
+        pitch: float = 0.0,
+        use_ssml: bool = True,
+        marks: Optional[str] = None,
+    ) -> Tuple[Optional[str], bool]:
+        """
+        Make sure the narration is in the audio cache without reading it back
+
+        Args:
+            marks: "word" or "sentence" to also store when each word or
+                sentence is spoken (see timepoints_key), for read-along
+
+        Returns:
+            (cache key, whether it was already cached); the key is None if
+            synthesis produced no audio
+        """
+        key = self.speech_key(text, voice_name, speaking_rate, pitch, use_ssml, self.ENCODING,
+                              marks)
+        cached = self.cache.path_for(key) is not None
+        if cached and (not marks or self.cache.contains(self.timepoints_key(key))):
+            return key, True
+
+        if marks:
+            audio, timeline = self._synthesize_timed_long(text, voice_name, speaking_rate, pitch,
+                                                          marks)
+        else:
+            audio = self._synthesize_long(text, voice_name, speaking_rate, pitch, use_ssml,
+                                          self.ENCODING)
+        if not audio:
+            return None, False
+        self.cache.put(key, audio)
+        if marks:
+            timepoints = json.dumps({"marks": timeline}).encode("utf-8")
+            self.cache.put(self.timepoints_key(key), timepoints)
+        return key, False
+
+    @staticmethod
+    def timepoints_key(audio_key: str) -> str:
+        """Cache key of the read-along marks stored next to the audio"""
+        return content_key("timepoints", audio_key)
+
+    @classmethod
+    def cache_key(cls, synthesis_text: str, voice_name: str, speaking_rate: float,
+                  pitch: float, use_ssml: bool = True, audio_encoding: Optional[str] = None) -> str:
+        """Content address of the audio for these synthesis parameters"""
+        kind = "ssml" if use_ssml else "text"
+        return content_key(kind, synthesis_text, voice_name, float(speaking_rate), float(pitch),
+                           audio_encoding or cls.ENCODING)
+
+    def speech_key(self, text, voice_name, speaking_rate, pitch, use_ssml, audio_encoding,
+                   marks=None):
+        """Cache key of the complete narration of text"""
+        if marks:
+            synthesis_text = compile_ssml(text, marks).ssml
+        else:
+            synthesis_text = self.add_natural_pauses(text) if use_ssml else text
+        return self.cache_key(synthesis_text, voice_name, speaking_rate, pitch, use_ssml,
+                              audio_encoding)
+
+    def split_text(self, text: str, use_ssml: bool = True, max_bytes: int = MAX_INPUT_BYTES,
+                   lead_sentence: bool = False) -> List[str]:
+        """
+        Split a story into synthesis inputs that each fit one request
+
+        Every paragraph becomes its own input (so editing one paragraph leaves
+        the others' cached audio valid); paragraphs over the limit are split
+        at sentence boundaries, and run-on sentences at word boundaries.
+        With lead_sentence the first sentence is an input of its own, so
+        streaming can start as soon as it is synthesized.
+        """
+        render = self.add_natural_pauses if use_ssml else (lambda piece: piece)
+        return [render(piece) for piece in _split_pieces(text, render, max_bytes, lead_sentence)]
+
+    def compile_chunks(self, text: str, marks: str, max_bytes: int = MAX_INPUT_BYTES) -> List:
+        """Like split_text, as CompiledSSML with marks numbered across the whole story"""
+        # Size pieces with the longest mark names they could get, then number them for real
+        widest = lambda piece: compile_ssml(piece, marks, 10 ** 6).ssml  # noqa: E731
+        chunks, index = [], 0
+        for piece in _split_pieces(text, widest, max_bytes):
+            compiled = compile_ssml(piece, marks, index)
+            chunks.append(compiled)
+            index = compiled.next_index
+        return chunks
+
+    def stream_speech(
+        self,
+        text: str,
+        voice_name: str = "en-US-Neural2-F",
+        speaking_rate: float = 1.0,
+        pitch: float = 0.0,
+        use_ssml: bool = True,
+    ) -> Iterator[bytes]:
+        """
+        Yield MP3 audio in story order as soon as each piece is synthesized
+
+        The first sentence is synthesized on its own and yielded first; the
+        following chunks are synthesized up to max_workers ahead of playback.
+        When every chunk succeeds the joined narration is also cached, so a
+        later narrate() of the same story is a hit. A chunk that yields no
+        audio raises RuntimeError, so the response is aborted rather than
+        ending as if the narration were complete.
+        """
+        chunks = self.split_text(text, use_ssml, lead_sentence=True)
+        pool = self._executor()
+        pending = deque()
+        parts = []
+        next_chunk = 0
+        try:
+            while next_chunk < len(chunks) or pending:
+                while next_chunk < len(chunks) and len(pending) < self.max_workers:
+                    pending.append(pool.submit(
+                        self._synthesize_chunk, chunks[next_chunk], voice_name, speaking_rate,
+                        pitch, use_ssml, "MP3"))
+                    next_chunk += 1
+                audio = pending.popleft().result()
+                if not audio:
+                    logger.error("Narration chunk %d of %d produced no audio",
+                                 len(parts) + 1, len(chunks))
+                    raise RuntimeError("Narration chunk produced no audio")
+                audio = join_mp3([audio])
+                parts.append(audio)
+                yield audio
+        finally:
+            # Client went away or synthesis failed: drop work that has not started.
+            for future in pending:
+                future.cancel()
+
+        if self.cache is not None and len(parts) == len(chunks):
+            key = self.speech_key(text, voice_name, speaking_rate, pitch, use_ssml, "MP3")
+            self.cache.put(key, b"".join(parts))
+
+    def _synthesize_long(self, text, voice_name, speaking_rate, pitch, use_ssml,
+                         audio_encoding) -> bytes:
+        """Synthesize text of any length: chunks run concurrently and are joined in order"""
+        chunks = self.split_text(text, use_ssml)
+        if len(chunks) == 1:
+            return self._synthesize(chunks[0], use_ssml, voice_name, speaking_rate, pitch,
+                                    audio_encoding)
+
+        parts = list(self._executor().map(
+            lambda chunk: self._synthesize_chunk(chunk, voice_name, speaking_rate, pitch, use_ssml,
+                                                 audio_encoding),
+            chunks,
+        ))
+        if not all(parts):
+            return b""
+        return join_audio(parts, audio_encoding)
+
+    def _synthesize_timed_long(self, text, voice_name, speaking_rate, pitch, marks):
+        """MP3 plus [{name, index, text, time}] for every mark, timed from the start of the story"""
+        chunks = self.compile_chunks(text, marks)
+        results = list(self._executor().map(
+            lambda chunk: self._synthesize_timed(chunk.ssml, voice_name, speaking_rate, pitch),
+            chunks,
+        ))
+        if not all(audio for audio, _ in results):
+            return b"", []
+
+        timeline, offset = [], 0.0
+        for chunk, (audio, timepoints) in zip(chunks, results):
+            times = dict(timepoints)
+            for mark in chunk.marks:
+                if mark.name in times:
+                    timeline.append({"name": mark.name, "index": mark.index, "text": mark.text,
+                                     "time": round(offset + times[mark.name], 3)})
+            offset += mp3_duration(audio)
+        return join_audio([audio for audio, _ in results], "MP3"), timeline
+
+    def _synthesize_timed(self, ssml: str, voice_name: str, speaking_rate: float,
+                          pitch: float) -> Tuple[bytes, List[Tuple[str, float]]]:
+        """One MP3 synthesize call that also returns (mark name, seconds) timepoints"""
+        return self.backend.synthesize_timed(ssml, voice_name, speaking_rate, pitch)
+
+    def _synthesize_chunk(self, chunk, voice_name, speaking_rate, pitch, use_ssml,
+                          audio_encoding) -> bytes:
+        """One split_text input, through the per-chunk cache"""
+        key = self.cache_key(chunk, voice_name, speaking_rate, pitch, use_ssml, audio_encoding)
+        audio = self.cache.get(key) if self.cache is not None else None
+        if audio is None:
+            audio = self._synthesize(chunk, use_ssml, voice_name, speaking_rate, pitch,
+                                     audio_encoding)
+            if self.cache is not None and audio:
+                self.cache.put(key, audio)
+        return audio
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with _executor_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="tts")
+            return self._pool
+
+    def _synthesize(self, synthesis_text: str, use_ssml: bool, voice_name: str,
+                    speaking_rate: float, pitch: float, audio_encoding: str = "MP3") -> bytes:
+        """Single synthesize_speech call for input within MAX_INPUT_BYTES"""
+        return self.backend.synthesize(synthesis_text, use_ssml, voice_name, speaking_rate, pitch,
+                                       audio_encoding)
 
     @staticmethod
     def get_available_voices() -> List[dict]:
@@ -165,19 +431,9 @@ class TTSService:
 
 
 # Mock TTS service for testing without API key
-class MockTTSService:
-    """Mock service that returns placeholder audio"""
-
-    def generate_speech(self, text: str, **kwargs) -> bytes:
-        """Return empty bytes as placeholder"""
-        print(f"[MockTTS] Would generate speech for {len(text)} characters")
-        return b""  # Empty audio
+class MockTTSService(TTSService):
+    """Offline service: silent audio of realistic length from the stub backend"""
 
-    @staticmethod
-    def get_available_voices() -> List[dict]:
-        """Return mock voice list"""
-        return TTSService.get_available_voices()
-
-    def add_natural_pauses(self, text: str) -> str:
-        """Mock method"""
-        return f"<speak>{text}</speak>"
+    def __init__(self, cache: Optional[DiskCache] = None, max_workers: int = 4, backend=None):
+        super().__init__(cache=cache, max_workers=max_workers,
+                         backend=backend if backend is not None else StubTTSBackend())